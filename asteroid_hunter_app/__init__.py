@@ -1 +1,23 @@
 __version__ = '0.1.0'
+
+# Report functions are re-exported lazily, so importing the package never loads
+# the pipeline (or requests) until one is used
+_report_functions = (
+    'asteroid_closest_approach',
+    'nearest_misses',
+    'browse_reports',
+    'month_closest_approaches',
+    'month_range_closest_approaches',
+    'closest_approaches_between',
+    'sync_reports',
+    'query_reports',
+    'period_closest_approaches',
+    'yearly_closest_approaches',
+    'serve_reports',
+)
+
+def __getattr__(name):
+    if name in _report_functions:
+        from . import main
+        return getattr(main, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,227 @@
+'''
+Asteroid Hunter API Pipeline
+aggregates.py
+Materialised top (qty) closest approaches per calendar day, month and year.
+Days are kept exact; months are merged from their days and years from their
+months, so any day range, month, quarter or year report is a merge of a few
+short precomputed lists instead of a scan of every approach.
+'''
+
+import copy, datetime
+from .month_information import month_span
+from .records import ApproachRecord, RecordCache
+from .top_k import TopK
+
+
+# Calendar pieces covering start_date..end_date: whole years, then whole months, then days
+def period_parts(start_date, end_date):
+    parts = []
+    cursor = start_date
+    while cursor <= end_date:
+        year_end = datetime.date(cursor.year, 12, 31)
+        _, month_end = month_span(cursor.year, cursor.month)
+        if cursor.month == 1 and cursor.day == 1 and year_end <= end_date:
+            parts.append(('year', f'{cursor.year:04d}'))
+            cursor = year_end + datetime.timedelta(days=1)
+        elif cursor.day == 1 and month_end <= end_date:
+            parts.append(('month', cursor.isoformat()[:7]))
+            cursor = month_end + datetime.timedelta(days=1)
+        else:
+            parts.append(('day', cursor.isoformat()))
+            cursor += datetime.timedelta(days=1)
+    return parts
+
+# First and last date of 'YYYY', 'YYYY-Qn', 'YYYY-MM' or 'YYYY-MM-DD'
+def period_bounds(text):
+    if len(text) == 4:
+        year = int(text)
+        return datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+    if text[5:6] in ('Q', 'q'):
+        year, quarter = int(text[:4]), int(text[6:])
+        if not 1 <= quarter <= 4:
+            raise ValueError(f'Invalid quarter: {text}')
+        return month_span(year, quarter * 3 - 2)[0], month_span(year, quarter * 3)[1]
+    if len(text) == 7:
+        return month_span(int(text[:4]), int(text[5:7]))
+    date = datetime.date.fromisoformat(text)
+    return date, date
+
+
+def record_entry(record):
+    approach_record = ApproachRecord.from_report(record)
+    return approach_record.approach.astronomical, approach_record.key, approach_record
+
+
+class PeriodTops:
+    def __init__(self, top_count=10, body='Earth'):
+        self.top_count = top_count
+        self.body = body
+        self.days = {}                 # 'YYYY-MM-DD' -> TopK
+        self.months = {}               # 'YYYY-MM' -> TopK merged from its days
+        self.years = {}                # 'YYYY' -> TopK merged from its months
+        self.dirty_months = set()      # Rollups to rebuild after a day was replaced
+        self.dirty_years = set()
+        self.records = RecordCache()   # Entries are ApproachRecords, shared by a day, its month and year
+        self.undo = {}                 # (level, period) -> (level, period, list or None, its mark) before this page
+
+    # Add one approach; an entry missing its day's top (qty) cannot make the month's or year's
+    def add(self, distance, key, item, date_text):
+        for level, period in ((self.days, date_text), (self.months, date_text[:7]), (self.years, date_text[:4])):
+            top = level.get(period)
+            undo_key = (id(level), period)
+            if undo_key not in self.undo:
+                self.undo[undo_key] = (level, period, top, None if top is None else top.mark())
+            if top is None:
+                top = level[period] = TopK(self.top_count)
+            if not top.push(distance, key, item):
+                break
+
+    # Crawl consumer: every approach of the body goes to its day, month and year
+    def consume(self, neo, close_objects, page_api):
+        if close_objects["orbiting_body"] != self.body:
+            return
+        date_text = close_objects["close_approach_date"]
+        distance = float(close_objects["miss_distance"]["astronomical"])
+        day_top = self.days.get(date_text)
+        if day_top is not None and not day_top.accepts(distance):
+            return
+        self.add(distance, (neo["id"], close_objects["epoch_date_close_approach"]),
+                 self.records.approach(neo, close_objects), date_text)
+
+    def page_done(self, page_api):
+        self.undo = {}
+
+    # Put every list the page changed back as it was
+    def discard_page(self, page_api):
+        for level, period, top, mark in self.undo.values():
+            if top is None:
+                level.pop(period, None)
+            else:
+                top.rewind(mark)
+        self.undo = {}
+
+    # Replace a day's list (e.g. recomputed from the catalogue after NEO's changed); its month
+    # and year are rebuilt on the next read
+    def set_day(self, date_text, records):
+        day_top = TopK(self.top_count)
+        for distance, key, record in map(record_entry, records):
+            day_top.push(distance, key, record)
+        if len(day_top):
+            self.days[date_text] = day_top
+        else:
+            self.days.pop(date_text, None)
+        self.dirty_months.add(date_text[:7])
+        self.dirty_years.add(date_text[:4])
+
+    def rebuild(self):
+        self.rollup(self.days, self.months, self.dirty_months, 7)
+        self.rollup(self.months, self.years, self.dirty_years, 4)
+        self.dirty_months = set()
+        self.dirty_years = set()
+
+    # Merge the lower level's lists into each dirty period of the upper level, in date order
+    def rollup(self, lower, upper, dirty, key_length):
+        parts = {}
+        for period in sorted(lower):
+            if period[:key_length] in dirty:
+                parts.setdefault(period[:key_length], []).append(lower[period])
+        for period in dirty:
+            period_top = TopK(self.top_count)
+            for part_top in parts.get(period, []):
+                period_top.merge(part_top)
+            self.store(upper, period, period_top)
+
+    def store(self, level, period, top):
+        if len(top):
+            level[period] = top
+        else:
+            level.pop(period, None)
+
+    # Build from the catalogue's per-day lists (one indexed query)
+    @classmethod
+    def from_catalogue(cls, catalogue, top_count=10, body='Earth'):
+        period_tops = cls(top_count, body)
+        catalogue.take_changed_dates()
+        for date_text, records in catalogue.day_tops(top_count, body).items():
+            period_tops.set_day(date_text, records)
+        period_tops.rebuild()
+        return period_tops
+
+    # Recompute only the days the catalogue changed since the last build or refresh;
+    # returns whether anything changed
+    def refresh(self, catalogue):
+        changed_dates = catalogue.take_changed_dates()
+        for date_text in sorted(changed_dates):
+            self.set_day(date_text, catalogue.day_top(date_text, self.top_count, self.body))
+        self.rebuild()
+        return bool(changed_dates)
+
+    # Copy with the catalogue's changed days recomputed, leaving this one untouched so its
+    # readers need no lock. Unchanged periods share their lists, which are never modified in place
+    def refreshed(self, catalogue):
+        period_tops = copy.copy(self)
+        period_tops.days = dict(self.days)
+        period_tops.months = dict(self.months)
+        period_tops.years = dict(self.years)
+        period_tops.dirty_months = set(self.dirty_months)
+        period_tops.dirty_years = set(self.dirty_years)
+        period_tops.undo = {}
+        period_tops.refresh(catalogue)
+        return period_tops
+
+    # Closest (qty) approaches between two dates (inclusive), merged from the fewest lists;
+    # every list holds only top_count records, so more cannot be answered from them
+    def top(self, start_date, end_date, top_count=None):
+        top_count = self.top_count if top_count is None else top_count
+        if top_count > self.top_count:
+            raise ValueError(f'Aggregates keep the closest {self.top_count} approaches per period, not {top_count}')
+        if self.dirty_months or self.dirty_years:
+            self.rebuild()
+        levels = {'day': self.days, 'month': self.months, 'year': self.years}
+        merged = TopK(top_count)
+        for level, period in period_parts(start_date, end_date):
+            part_top = levels[level].get(period)
+            if part_top is not None:
+                merged.merge(part_top)
+        return [record.to_json() for record in merged.items()]
+
+    def period(self, text, top_count=None):
+        return self.top(*period_bounds(text), top_count)
+
+    def month(self, year, month, top_count=None):
+        return self.top(*month_span(year, month), top_count)
+
+    def quarter(self, year, quarter, top_count=None):
+        return self.period(f'{year:04d}-Q{quarter}', top_count)
+
+    def year(self, year, top_count=None):
+        return self.period(f'{year:04d}', top_count)
+
+    # Year-over-year report: 'YYYY' -> closest (qty) of that year
+    def yearly(self, start_year, end_year, top_count=None):
+        return {f'{year:04d}': self.year(year, top_count) for year in range(start_year, end_year + 1)}
+
+    # Day lists are the whole state; months and years are rebuilt from them
+    def state(self):
+        return {
+            'top_count': self.top_count,
+            'days': {date_text: [[distance, list(key), record.to_json()] for distance, key, record in day_top.entries()]
+                     for date_text, day_top in self.days.items()}
+        }
+
+    def restore(self, state):
+        for date_text in sorted(state['days']):
+            for distance, key, item in state['days'][date_text]:
+                self.add(distance, tuple(key), ApproachRecord.from_report(item), date_text)
+        self.undo = {}
+
+    # Fold in the days of another part of the crawl
+    def merge(self, other):
+        for date_text in sorted(other.days):
+            for distance, key, item in other.days[date_text].entries():
+                self.add(distance, key, item, date_text)
+        self.undo = {}
+        return self
+
+    def result(self):
+        return self
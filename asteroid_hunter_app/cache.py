@@ -0,0 +1,148 @@
+'''
+Asteroid Hunter API Pipeline
+cache.py
+Persistent on-disk cache of NeoWs responses (SQLite, zlib compressed bodies)
+with per-entry TTL, LRU size cap and conditional revalidation.
+'''
+
+import datetime, hashlib, json, sqlite3, threading, time, zlib
+from urllib.parse import urlencode
+from .metrics import metrics
+
+
+class ResponseCache:
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, browse_ttl=24 * 3600,
+                 feed_ttl=3600, clock=time.time):
+        self.path = path
+        self.max_bytes = max_bytes     # Size cap on stored (compressed) bodies
+        self.browse_ttl = browse_ttl   # Seconds before a browse page is revalidated
+        self.feed_ttl = feed_ttl       # Seconds before a current/future feed week is revalidated
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.connection = None         # Opened on first use
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                body BLOB,
+                etag TEXT,
+                last_modified TEXT,
+                expires_at REAL,
+                last_access REAL,
+                size INTEGER)''')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+            self.connection.commit()
+        return self.connection
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    # Endpoint plus sorted params, without the api_key, so every key shares entries
+    def cache_key(self, api, params):
+        kept = sorted((name, str(value)) for name, value in params.items() if name != 'api_key')
+        url = api + urlencode(kept)
+        return hashlib.sha1(url.encode()).hexdigest(), url
+
+    # Seconds an entry stays fresh; None never expires
+    def ttl_for(self, api, params):
+        if 'end_date' in params:
+            end_date = datetime.date.fromisoformat(str(params['end_date']))
+            if end_date < datetime.date.fromtimestamp(self.clock()):
+                return None            # Historical feed weeks never change
+            return self.feed_ttl
+        return self.browse_ttl
+
+    # Cached entry as dict(body, etag, last_modified, fresh) or None
+    def lookup(self, api, params):
+        key, _ = self.cache_key(api, params)
+        now = self.clock()
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute(
+                'SELECT body, etag, last_modified, expires_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+            connection.commit()
+        body, etag, last_modified, expires_at = row
+        return {
+            'body': zlib.decompress(body),
+            'etag': etag,
+            'last_modified': last_modified,
+            'fresh': expires_at is None or expires_at > now
+        }
+
+    def store(self, api, params, body, etag=None, last_modified=None):
+        key, url = self.cache_key(api, params)
+        now = self.clock()
+        ttl = self.ttl_for(api, params)
+        expires_at = None if ttl is None else now + ttl
+        compressed = zlib.compress(body, 6)
+        with self.lock:
+            connection = self.connect()
+            connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, url, compressed, etag, last_modified, expires_at, now, len(compressed)))
+            self.evict(connection)
+            connection.commit()
+
+    # Server answered 304: keep the body, restart its TTL
+    def refresh(self, api, params):
+        key, _ = self.cache_key(api, params)
+        now = self.clock()
+        ttl = self.ttl_for(api, params)
+        expires_at = None if ttl is None else now + ttl
+        with self.lock:
+            connection = self.connect()
+            connection.execute(
+                'UPDATE responses SET expires_at = ?, last_access = ? WHERE key = ?', (expires_at, now, key))
+            connection.commit()
+
+    # Drop least recently used entries until the cache fits in max_bytes
+    def evict(self, connection):
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in connection.execute(
+                'SELECT key, size FROM responses ORDER BY last_access').fetchall():
+            connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+# Wrap get_response(api, params, headers) into get_json(api, params) backed by cache
+def cached(get_response, cache, decode=json.loads):
+    def cached_get_json(api, params):
+        entry = cache.lookup(api, params)
+        if entry is not None and entry['fresh']:
+            metrics.count('cache_lookups', result='hit')
+            return decode(entry['body'])
+
+        # Stale entries are revalidated with the validators the server gave us
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = get_response(api, params, headers)
+        if response.status_code == 304 and entry is not None:
+            metrics.count('cache_lookups', result='revalidated')
+            cache.refresh(api, params)
+            return decode(entry['body'])
+        metrics.count('cache_lookups', result='miss')
+
+        # Decoded before it is stored, so a truncated body never poisons the cache
+        body = response.content
+        decoded = decode(body)
+        cache.store(api, params, body, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return decoded
+    return cached_get_json
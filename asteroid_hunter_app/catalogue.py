@@ -0,0 +1,209 @@
+'''
+Asteroid Hunter API Pipeline
+catalogue.py
+Local persistent NEO catalogue (SQLite) filled by the browse/feed crawls, with
+indexes on close approach epoch/date, miss distance and orbiting body.
+'''
+
+import sqlite3, threading
+from . import json_backend
+
+
+class NeoCatalogue:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.changed_dates = set()     # Approach dates touched by add() / replace_neos()
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS neos (
+                id TEXT PRIMARY KEY,
+                hazardous INTEGER,
+                neo TEXT,
+                from_browse INTEGER DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS approaches (
+                neo_id TEXT,
+                epoch INTEGER,
+                close_approach_date TEXT,
+                astronomical REAL,
+                kilometers REAL,
+                lunar REAL,
+                velocity REAL,
+                orbiting_body TEXT,
+                approach TEXT,
+                PRIMARY KEY (neo_id, epoch));
+            CREATE INDEX IF NOT EXISTS approaches_epoch ON approaches (epoch);
+            CREATE INDEX IF NOT EXISTS approaches_date ON approaches (close_approach_date, astronomical);
+            CREATE INDEX IF NOT EXISTS approaches_body_distance ON approaches (orbiting_body, astronomical);
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key TEXT PRIMARY KEY,
+                value TEXT);
+        ''')
+        # Catalogues written before from_browse existed; their rows are replaced by the next browse crawl
+        if 'from_browse' not in [column[1] for column in self.connection.execute('PRAGMA table_info(neos)')]:
+            self.connection.execute('ALTER TABLE neos ADD COLUMN from_browse INTEGER DEFAULT 0')
+        self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    # Insert or update NEO's and their close approaches; repeated (NEO id, epoch) rows are updated in place.
+    # Feed NEO's lack browse-only fields (orbital_data, designation, ...), so they never replace a browse row
+    def add(self, neo_rows, approach_rows):
+        with self.lock:
+            self.connection.executemany(
+                'INSERT INTO neos VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (id) DO UPDATE SET hazardous = excluded.hazardous, neo = excluded.neo, '
+                'from_browse = excluded.from_browse WHERE excluded.from_browse >= neos.from_browse',
+                neo_rows)
+            self.connection.executemany(
+                'INSERT INTO approaches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (neo_id, epoch) DO UPDATE SET '
+                'close_approach_date = excluded.close_approach_date, astronomical = excluded.astronomical, '
+                'kilometers = excluded.kilometers, lunar = excluded.lunar, velocity = excluded.velocity, '
+                'orbiting_body = excluded.orbiting_body, approach = excluded.approach',
+                approach_rows)
+            self.connection.commit()
+            self.changed_dates.update(approach_row[2] for approach_row in approach_rows)
+
+    # Replace everything stored for these NEO's, so approaches dropped upstream disappear too
+    def replace_neos(self, neo_rows, approach_rows):
+        with self.lock:
+            for neo_row in neo_rows:
+                self.changed_dates.update(date_text for date_text, in self.connection.execute(
+                    'SELECT close_approach_date FROM approaches WHERE neo_id = ?', (neo_row[0],)))
+            self.connection.executemany('DELETE FROM approaches WHERE neo_id = ?',
+                                        [(neo_row[0],) for neo_row in neo_rows])
+        self.add(neo_rows, approach_rows)
+
+    # Small JSON values kept between runs (sync high-water marks, running results)
+    def get_state(self, key, default=None):
+        with self.lock:
+            row = self.connection.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return default if row is None else json_backend.loads(row[0])
+
+    def set_state(self, key, value):
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?)',
+                                    (key, json_backend.dumps(value)))
+            self.connection.commit()
+
+    # from_browse: the NEO object of a browse page (False for the feed's)
+    def neo_row(self, neo, from_browse=True):
+        details = dict(neo)
+        details["close_approach_data"] = None   # Keeps the key's position for output
+        hazardous = neo["is_potentially_hazardous_asteroid"] in (True, 'true')
+        return (neo["id"], hazardous, json_backend.dumps(details), int(from_browse))
+
+    def approach_row(self, neo, close_objects):
+        miss_distance = close_objects["miss_distance"]
+        return (
+            neo["id"],
+            close_objects["epoch_date_close_approach"],
+            close_objects["close_approach_date"],
+            float(miss_distance["astronomical"]),
+            float(miss_distance["kilometers"]),
+            float(miss_distance["lunar"]),
+            float(close_objects["relative_velocity"]["kilometers_per_second"]),
+            close_objects["orbiting_body"],
+            json_backend.dumps(close_objects)
+        )
+
+    # NEO JSON objects with close_approach_data reduced to the matching approach
+    def query(self, where, params, top_count, order='a.astronomical'):
+        sql = ('SELECT n.neo, a.approach FROM approaches a JOIN neos n ON n.id = a.neo_id '
+               f'WHERE {where} ORDER BY {order}, a.rowid LIMIT ?')
+        with self.lock:
+            rows = self.connection.execute(sql, (*params, top_count)).fetchall()
+        records = []
+        for neo_json, approach_json in rows:
+            neo = json_backend.loads(neo_json)
+            neo["close_approach_data"] = json_backend.loads(approach_json)
+            records.append(neo)
+        return records
+
+    def closest(self, body='Earth'):
+        records = self.query('a.orbiting_body = ?', (body,), 1)
+        return records[0] if records else None
+
+    def nearest_misses(self, top_count, body='Earth'):
+        return self.query('a.orbiting_body = ?', (body,), top_count)
+
+    # Closest approaches between two ISO dates (inclusive)
+    def closest_between(self, start_date, end_date, top_count, body='Earth'):
+        return self.query('a.close_approach_date BETWEEN ? AND ? AND a.orbiting_body = ?',
+                          (start_date, end_date, body), top_count)
+
+    def month_closest(self, year, month, top_count, body='Earth'):
+        return self.closest_between(f'{year:04d}-{month:02d}-01', f'{year:04d}-{month:02d}-31', top_count, body)
+
+    # Closest (qty) approaches of every day in one pass: 'YYYY-MM-DD' -> records, closest first
+    def day_tops(self, top_count, body='Earth'):
+        sql = ('SELECT close_approach_date, neo, approach FROM ('
+               'SELECT a.close_approach_date, n.neo, a.approach, '
+               'ROW_NUMBER() OVER (PARTITION BY a.close_approach_date ORDER BY a.astronomical, a.rowid) AS day_rank '
+               'FROM approaches a JOIN neos n ON n.id = a.neo_id WHERE a.orbiting_body = ?) '
+               'WHERE day_rank <= ? ORDER BY close_approach_date, day_rank')
+        with self.lock:
+            rows = self.connection.execute(sql, (body, top_count)).fetchall()
+        day_tops = {}
+        for date_text, neo_json, approach_json in rows:
+            neo = json_backend.loads(neo_json)
+            neo["close_approach_data"] = json_backend.loads(approach_json)
+            day_tops.setdefault(date_text, []).append(neo)
+        return day_tops
+
+    def day_top(self, date_text, top_count, body='Earth'):
+        return self.query('a.close_approach_date = ? AND a.orbiting_body = ?', (date_text, body), top_count)
+
+    # Approach dates added, updated or removed since the last call (for aggregates.py)
+    def take_changed_dates(self):
+        with self.lock:
+            changed_dates, self.changed_dates = self.changed_dates, set()
+        return changed_dates
+
+    # Filters and ranking of an ApproachQuery (query.py) run inside SQLite
+    def search(self, approach_query):
+        where, params, order = approach_query.sql()
+        return self.query(where, params, approach_query.top_count, order)
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM approaches').fetchone()[0]
+
+
+# Crawl consumer writing every NEO and close approach to the catalogue, one batch per page
+class CatalogueIngest:
+    def __init__(self, catalogue, from_browse=True):
+        self.catalogue = catalogue
+        self.from_browse = from_browse   # False for feed windows (see NeoCatalogue.add)
+        self.neo_rows = {}
+        self.approach_rows = []
+
+    def consume(self, neo, close_objects, page_api):
+        if neo["id"] not in self.neo_rows:
+            self.neo_rows[neo["id"]] = self.catalogue.neo_row(neo, self.from_browse)
+        self.approach_rows.append(self.catalogue.approach_row(neo, close_objects))
+
+    def page_done(self, page_api):
+        self.catalogue.add(list(self.neo_rows.values()), self.approach_rows)
+        self.neo_rows = {}
+        self.approach_rows = []
+
+    def discard_page(self, page_api):
+        self.neo_rows = {}
+        self.approach_rows = []
+
+    # Pages are committed as they complete, so nothing is left to save
+    def state(self):
+        return {}
+
+    def restore(self, state):
+        pass
+
+    def merge(self, other):
+        return self
+
+    def result(self):
+        return self.catalogue
@@ -0,0 +1,70 @@
+'''
+Asteroid Hunter API Pipeline
+checkpoint.py
+Crawl checkpoints: the browse cursor and every consumer's partial results, written
+atomically every few pages so an interrupted crawl resumes where it stopped.
+'''
+
+import glob, os
+from . import json_backend
+
+
+class CrawlCheckpoint:
+    def __init__(self, path, every=50):
+        self.path = path
+        self.every = every            # Pages between checkpoints (0 = never write)
+
+    def due(self, page_api):
+        return self.every > 0 and (page_api + 1) % self.every == 0
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as checkpoint_file:
+                return json_backend.loads(checkpoint_file.read())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            print(f'Ignoring unreadable checkpoint {self.path}')
+            return None
+
+    # Write to a temporary file, then rename over the old checkpoint: a crash mid-write
+    # leaves the previous checkpoint intact
+    def save(self, state):
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w') as checkpoint_file:
+            checkpoint_file.write(json_backend.dumps(state))
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temporary_path, self.path)
+
+    # Append-only companion logs for consumer state that only grows (ColumnarIngest rows):
+    # each checkpoint appends what is new, and the checkpoint itself records how many lines count
+    def log_path(self, name):
+        return f'{self.path}.{name}.log'
+
+    def append_lines(self, name, lines):
+        with open(self.log_path(name), 'ab') as log_file:
+            for line in lines:
+                log_file.write(json_backend.dumps(line).encode() + b'\n')
+            log_file.flush()
+            os.fsync(log_file.fileno())
+
+    # First (count) lines of a log; anything after them (appended for a checkpoint that was
+    # never written) is cut off, so later appends continue from the restored state
+    def read_lines(self, name, count):
+        lines = []
+        if count == 0 and not os.path.exists(self.log_path(name)):
+            return lines
+        with open(self.log_path(name), 'r+b') as log_file:
+            for _ in range(count):
+                lines.append(json_backend.loads(log_file.readline()))
+            log_file.truncate()
+        return lines
+
+    def clear(self):
+        logs = glob.glob(f'{glob.escape(self.path)}.*.log')
+        for path in (self.path, f'{self.path}.tmp', *logs):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
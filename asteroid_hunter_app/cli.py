@@ -0,0 +1,191 @@
+'''
+Asteroid Hunter API Pipeline
+cli.py
+Command line entry point (asteroid-hunter). Only argparse is imported up front;
+the pipeline and its dependencies load when a report actually runs.
+'''
+
+import argparse, datetime
+
+
+# Parse 'YYYY-MM' command line months
+def year_month(text):
+    try:
+        year, month = (int(part) for part in text.split('-'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Expected YYYY-MM: {text}')
+    if not 1 <= month <= 12:
+        raise argparse.ArgumentTypeError(f'Invalid month: {text}')
+    return year, month
+
+def iso_date(text):
+    try:
+        return datetime.date.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Expected YYYY-MM-DD: {text}')
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='asteroid-hunter', description='Asteroid Hunter API Pipeline')
+    parser.add_argument('--workers', type=int, help='concurrent API requests (1 = sequential)')
+    parser.add_argument('--no-cache', action='store_true', help='always fetch from the API')
+    parser.add_argument('--stream', action='store_true', help='parse browse pages one NEO at a time')
+    parser.add_argument('--columnar', action='store_true', help='answer reports from a columnar table')
+    parser.add_argument('--from-catalogue', action='store_true', help='answer reports from the local catalogue, no crawl')
+    parser.add_argument('--resume', action='store_true', help='continue an interrupted browse crawl from its checkpoint')
+    parser.add_argument('--format', choices=('json', 'ndjson', 'parquet', 'arrow'), help='report file format')
+    parser.add_argument('--gzip', action='store_true', help='compress report files')
+    parser.add_argument('--no-echo', action='store_true', help='do not print whole reports to the console')
+    parser.add_argument('--quiet', action='store_true', help='no per-page console output and no report echo')
+    parser.add_argument('--metrics', metavar='PATH', help='write run metrics as Prometheus text')
+    parser.add_argument('--log-json', metavar='PATH', help='append one JSON line per request and page')
+    parser.add_argument('--profile', choices=('cprofile', 'tracemalloc'), help='profile the report run')
+    parser.add_argument('--profile-path', metavar='PATH', help='where the profile is written')
+    parser.add_argument('--shards', type=int, metavar='N', help='processes sharing a browse crawl or month range')
+    parser.add_argument('--queue', metavar='PATH', help='SQLite work queue for shards, shared with other hosts; '
+                        'workers run the crawl settings found there, so only share it with hosts you trust')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    commands.add_parser('closest', help='closest approach to Earth of any NEO -> closest_neo.json')
+    misses = commands.add_parser('misses', help='top (qty) nearest misses -> ten_closest_neo.json')
+    misses.add_argument('--top', type=int, help='number of nearest misses')
+    browse = commands.add_parser('browse', help='closest and nearest misses from one browse crawl')
+    browse.add_argument('--top', type=int, help='number of nearest misses')
+
+    month = commands.add_parser('month', help='top (qty) approaches in one month -> closest_neo_per_month.json')
+    month.add_argument('month', type=year_month, metavar='YYYY-MM')
+    month.add_argument('--top', type=int, help='approaches per month')
+
+    months = commands.add_parser('months', help='per-month report for a range -> closest_neo_per_month_range.json')
+    months.add_argument('start', type=year_month, metavar='START', help='first month (YYYY-MM)')
+    months.add_argument('end', type=year_month, metavar='END', help='last month (YYYY-MM)')
+    months.add_argument('--top', type=int, help='approaches per month')
+
+    between = commands.add_parser('between', help='closest approaches between two dates, from the catalogue')
+    between.add_argument('start', type=iso_date, metavar='START', help='first date (YYYY-MM-DD)')
+    between.add_argument('end', type=iso_date, metavar='END', help='last date (YYYY-MM-DD)')
+    between.add_argument('--top', type=int, help='number of approaches')
+
+    sync = commands.add_parser('sync', help='incrementally sync the catalogue and write the reports')
+    sync.add_argument('--feed-start', type=iso_date, help='first feed date to sync (YYYY-MM-DD)')
+    sync.add_argument('--feed-end', type=iso_date, help='last feed date to sync (default today)')
+
+    period = commands.add_parser('period', help='closest approaches in a period, from the catalogue -> closest_neo_period.json')
+    period.add_argument('start', metavar='START', help='first period (YYYY, YYYY-Qn, YYYY-MM or YYYY-MM-DD)')
+    period.add_argument('end', nargs='?', metavar='END', help='last period (default START)')
+    period.add_argument('--top', type=int, help='number of approaches')
+
+    years = commands.add_parser('years', help='year-over-year report, from the catalogue -> closest_neo_per_year.json')
+    years.add_argument('start', type=int, metavar='START', help='first year')
+    years.add_argument('end', type=int, metavar='END', help='last year')
+    years.add_argument('--top', type=int, help='approaches per year')
+
+    query = commands.add_parser('query', help='filtered, ranked close approaches -> query_results.json')
+    query.add_argument('--body', default='Earth', help="orbiting body ('any' for all, default Earth)")
+    hazard = query.add_mutually_exclusive_group()
+    hazard.add_argument('--hazardous', dest='hazardous', action='store_const', const=True, help='potentially hazardous only')
+    hazard.add_argument('--not-hazardous', dest='hazardous', action='store_const', const=False, help='not hazardous only')
+    query.add_argument('--min-diameter', type=float, metavar='KM', help='smallest mean estimated diameter')
+    query.add_argument('--max-diameter', type=float, metavar='KM', help='largest mean estimated diameter')
+    query.add_argument('--min-velocity', type=float, metavar='KM/S', help='slowest relative velocity')
+    query.add_argument('--max-velocity', type=float, metavar='KM/S', help='fastest relative velocity')
+    query.add_argument('--start', type=iso_date, help='first approach date (YYYY-MM-DD)')
+    query.add_argument('--end', type=iso_date, help='last approach date (YYYY-MM-DD)')
+    query.add_argument('--rank', choices=('miss_distance', 'velocity', 'diameter', 'kinetic_energy', 'magnitude'),
+                       default='miss_distance', help='ranking metric (largest first for velocity, diameter, energy)')
+    query.add_argument('--top', type=int, help='number of approaches')
+    query.add_argument('--store-matching', action='store_true', help='only store matching approaches in the catalogue')
+
+    serve = commands.add_parser('serve', help='long-running HTTP/JSON report service over the catalogue')
+    serve.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    serve.add_argument('--port', type=int, default=8080, help='port to listen on')
+    serve.add_argument('--refresh', type=float, metavar='SECONDS', help='catalogue sync interval (0 = never)')
+
+    worker = commands.add_parser('worker', help='run crawl shards from a work queue (see --queue)')
+    worker.add_argument('queue', metavar='QUEUE', help='work queue path')
+    worker.add_argument('--poll', type=float, default=5.0, help='seconds between checks for new shards (0 = exit when idle)')
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    # Shards are not checkpointed: a sharded crawl can neither save nor continue one
+    if args.resume and ((args.shards or 1) > 1 or args.queue):
+        parser.error('--resume continues a single-process crawl; it cannot be combined with --shards or --queue')
+
+    from . import main as pipeline
+    if args.workers is not None:
+        pipeline.fetch_workers = args.workers
+    if args.no_cache:
+        pipeline.use_cache = False
+    pipeline.stream_pages = args.stream
+    pipeline.columnar_reports = args.columnar
+    pipeline.resume_crawl = args.resume
+    if args.format is not None:
+        pipeline.output_format = args.format
+    pipeline.output_compress = args.gzip
+    pipeline.echo_reports = not (args.no_echo or args.quiet)
+    pipeline.quiet = args.quiet
+    pipeline.metrics_path = args.metrics
+    pipeline.profile_mode = args.profile
+    if args.profile_path:
+        pipeline.profile_path = args.profile_path
+    if args.shards is not None:
+        pipeline.shard_processes = args.shards
+    pipeline.shard_queue_path = args.queue
+    if args.log_json:
+        import logging
+        log_handler = logging.FileHandler(args.log_json)
+        log_handler.setFormatter(logging.Formatter('%(message)s'))
+        logger = logging.getLogger('asteroid_hunter_app')
+        logger.addHandler(log_handler)
+        logger.setLevel(logging.INFO)
+
+    pipeline.profiled(run_command, pipeline, args)
+    pipeline.write_metrics()
+
+def run_command(pipeline, args):
+    if getattr(args, 'top', None) is not None:
+        pipeline.top_count = pipeline.top_month_count = args.top
+
+    if args.command == 'closest':
+        pipeline.asteroid_closest_approach(args.from_catalogue)
+    elif args.command == 'misses':
+        pipeline.nearest_misses(args.from_catalogue)
+    elif args.command == 'browse':
+        pipeline.browse_reports(from_catalogue=args.from_catalogue)
+    elif args.command == 'month':
+        pipeline.year_to_test, pipeline.month_to_test = args.month
+        pipeline.month_closest_approaches(args.from_catalogue)
+    elif args.command == 'months':
+        pipeline.month_range_closest_approaches(*args.start, *args.end, pipeline.top_month_count)
+    elif args.command == 'between':
+        approaches = pipeline.closest_approaches_between(args.start.isoformat(), args.end.isoformat(),
+                                                         pipeline.top_count)
+        print(pipeline.json_backend.dumps(approaches))
+    elif args.command == 'sync':
+        pipeline.sync_reports(args.feed_start, args.feed_end)
+    elif args.command == 'period':
+        pipeline.period_closest_approaches(args.start, args.end or args.start, pipeline.top_count)
+    elif args.command == 'years':
+        pipeline.yearly_closest_approaches(args.start, args.end, pipeline.top_count)
+    elif args.command == 'query':
+        from .query import ApproachQuery
+        approach_query = ApproachQuery(
+            body=None if args.body == 'any' else args.body, hazardous=args.hazardous,
+            min_diameter=args.min_diameter, max_diameter=args.max_diameter,
+            min_velocity=args.min_velocity, max_velocity=args.max_velocity,
+            start_date=args.start and args.start.isoformat(), end_date=args.end and args.end.isoformat(),
+            rank=args.rank, top_count=pipeline.top_count)
+        if args.store_matching:
+            pipeline.ingest_filter = approach_query
+        pipeline.query_reports(approach_query, args.from_catalogue)
+    elif args.command == 'serve':
+        refresh_seconds = pipeline.service_refresh_seconds if args.refresh is None else args.refresh
+        pipeline.serve_reports(args.host, args.port, refresh_seconds)
+    elif args.command == 'worker':
+        from .shard import work
+        print(f'Shards completed: {work(args.queue, args.poll)}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+'''
+Asteroid Hunter API Pipeline
+columnar.py
+Typed columnar table of close approaches. Every approach is flattened once at
+ingestion; closest, top (qty) and per-month queries are vectorized with NumPy
+when it is installed, and fall back to plain loops over array columns otherwise.
+Only the text the numeric columns cannot give back (close_approach_date_full and
+the number text of the unit blocks) is kept, in an array-backed string column; the
+approach JSON is rebuilt for the rows a query returns.
+'''
+
+import heapq
+from array import array
+from . import json_backend
+from .records import NeoRecord, approach_fields, distance_keys, velocity_keys
+
+orbiting_bodies = ['Earth', 'Merc', 'Venus', 'Mars', 'Juptr', 'Satrn', 'Urnus', 'Neptn', 'Pluto', 'Moon']
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+# Strings stored back to back in one UTF-8 buffer, with the end offset of every row
+class TextColumn:
+    def __init__(self):
+        self.data = bytearray()
+        self.ends = array('q')
+
+    def __len__(self):
+        return len(self.ends)
+
+    def append(self, text):
+        self.data += text.encode()
+        self.ends.append(len(self.data))
+
+    def __getitem__(self, row):
+        start = self.ends[row - 1] if row else 0
+        return self.data[start:self.ends[row]].decode()
+
+    def truncate(self, rows):
+        del self.data[self.ends[rows - 1] if rows else 0:]
+        del self.ends[rows:]
+
+
+def date_text(date):
+    return f'{date // 10000:04d}-{date // 100 % 100:02d}-{date % 100:02d}'
+
+text_fields = 1 + len(velocity_keys) + len(distance_keys)
+
+# close_approach_date_full and the unit blocks' number text, tab separated, for an approach the
+# columns give back exactly: the NeoWs key layout, every number as text. None for any other.
+def approach_text(close_objects, date_digits):
+    relative_velocity = close_objects["relative_velocity"]
+    miss_distance = close_objects["miss_distance"]
+    date = close_objects["close_approach_date"]
+    if tuple(close_objects) != approach_fields or tuple(relative_velocity) != velocity_keys or \
+            tuple(miss_distance) != distance_keys or type(close_objects["epoch_date_close_approach"]) is not int or \
+            not (len(date) == 10 and date[4] == date[7] == '-' and date_digits.isascii() and date_digits.isdigit()):
+        return None
+    try:
+        text = '\t'.join((close_objects["close_approach_date_full"], *relative_velocity.values(), *miss_distance.values()))
+    except TypeError:
+        return None
+    return text if text.count('\t') == text_fields - 1 else None
+
+
+class ApproachTable:
+    def __init__(self):
+        self.neo_id = array('q')          # NEO id (numeric string in the API)
+        self.epoch = array('q')           # epoch_date_close_approach (ms)
+        self.date = array('l')            # close_approach_date as yyyymmdd
+        self.astronomical = array('d')    # Miss distance in au
+        self.kilometers = array('d')
+        self.lunar = array('d')
+        self.velocity = array('d')        # Relative velocity in km/s
+        self.body = array('B')            # Index into orbiting_bodies
+        self.hazardous = array('b')
+        self.approach_text = TextColumn()  # See approach_text()
+        self.approach_json = {}           # Row -> approach JSON, for the rare approach in any other layout
+        self.neos = {}                    # NEO id -> NeoRecord (records.py), without its close approaches
+        self.bodies = list(orbiting_bodies)
+        self.body_codes = {name: code for code, name in enumerate(self.bodies)}
+
+    def __len__(self):
+        return len(self.epoch)
+
+    def body_code(self, name):
+        code = self.body_codes.get(name)
+        if code is None:
+            code = self.body_codes[name] = len(self.bodies)
+            self.bodies.append(name)
+        return code
+
+    def append(self, neo, close_objects):
+        neo_id = int(neo["id"])
+        if neo_id not in self.neos:
+            self.neos[neo_id] = NeoRecord.from_json(neo)
+        relative_velocity = close_objects["relative_velocity"]
+        miss_distance = close_objects["miss_distance"]
+        date_digits = close_objects["close_approach_date"].replace('-', '')
+        date = int(date_digits)
+        self.neo_id.append(neo_id)
+        self.epoch.append(close_objects["epoch_date_close_approach"])
+        self.date.append(date)
+        self.astronomical.append(float(miss_distance["astronomical"]))
+        self.kilometers.append(float(miss_distance["kilometers"]))
+        self.lunar.append(float(miss_distance["lunar"]))
+        self.velocity.append(float(relative_velocity["kilometers_per_second"]))
+        self.body.append(self.body_code(close_objects["orbiting_body"]))
+        self.hazardous.append(neo["is_potentially_hazardous_asteroid"] in (True, 'true'))
+        text = approach_text(close_objects, date_digits)
+        if text is None:
+            self.approach_json[len(self.approach_text)] = json_backend.dumps(close_objects)
+            text = ''
+        self.approach_text.append(text)
+
+    # Drop every row from `rows` on, and the NEO's first seen after the first `neos`
+    def truncate(self, rows, neos):
+        for column in (self.neo_id, self.epoch, self.date, self.astronomical, self.kilometers, self.lunar,
+                       self.velocity, self.body, self.hazardous):
+            del column[rows:]
+        self.approach_text.truncate(rows)
+        for row in [row for row in self.approach_json if row >= rows]:
+            del self.approach_json[row]
+        while len(self.neos) > neos:
+            self.neos.popitem()
+
+    # Close approach JSON object of a row, in the NeoWs key order
+    def approach(self, row):
+        approach_json = self.approach_json.get(row)
+        if approach_json is not None:
+            return json_backend.loads(approach_json)
+        texts = self.approach_text[row].split('\t')
+        velocity_end = 1 + len(velocity_keys)
+        return {
+            "close_approach_date": date_text(self.date[row]),
+            "close_approach_date_full": texts[0],
+            "epoch_date_close_approach": self.epoch[row],
+            "relative_velocity": dict(zip(velocity_keys, texts[1:velocity_end])),
+            "miss_distance": dict(zip(distance_keys, texts[velocity_end:])),
+            "orbiting_body": self.bodies[self.body[row]]
+        }
+
+    # NEO JSON object with close_approach_data reduced to the approach in this row
+    def record(self, row):
+        return self.neos[self.neo_id[row]].to_json(self.approach(row))
+
+    # Row indexes passing the filters (a NumPy array, or a list without NumPy)
+    def select(self, body='Earth', year=None, month=None):
+        code = self.body_codes.get(body) if body is not None else None
+        if body is not None and code is None:
+            return []
+        numpy = _numpy()
+        if numpy is not None:
+            mask = numpy.ones(len(self), dtype=bool)
+            if code is not None:
+                mask &= numpy.frombuffer(self.body, dtype=numpy.uint8) == code
+            if year is not None:
+                dates = numpy.frombuffer(self.date, dtype=numpy.dtype(self.date.typecode))
+                if month is None:
+                    mask &= dates // 10000 == year
+                else:
+                    mask &= dates // 100 == year * 100 + month
+            return numpy.flatnonzero(mask)
+
+        rows = range(len(self))
+        if code is not None:
+            body_column = self.body
+            rows = [row for row in rows if body_column[row] == code]
+        if year is not None:
+            date_column = self.date
+            if month is None:
+                rows = [row for row in rows if date_column[row] // 10000 == year]
+            else:
+                period = year * 100 + month
+                rows = [row for row in rows if date_column[row] // 100 == period]
+        return rows
+
+    # Rows of the (qty) smallest miss distances, closest first; equal distances keep
+    # ingestion order and a repeated (NEO id, epoch) is only counted once
+    def nearest(self, rows, top_count):
+        if top_count <= 0 or len(rows) == 0:
+            return []
+        numpy = _numpy()
+        if numpy is not None:
+            rows = numpy.asarray(rows)
+            distances = numpy.frombuffer(self.astronomical, dtype=numpy.float64)[rows]
+            wanted = top_count
+            while True:
+                if wanted < len(rows):
+                    # Everything up to the wanted-th distance, ties at the cut included
+                    cutoff = distances[numpy.argpartition(distances, wanted)[wanted]]
+                    candidates = numpy.flatnonzero(distances <= cutoff)
+                else:
+                    candidates = numpy.arange(len(rows))
+                # Stable order: distance, then ingestion order
+                candidates = candidates[numpy.lexsort((rows[candidates], distances[candidates]))]
+                ordered = self.unique_rows(rows[candidates].tolist(), top_count)
+                if len(ordered) == top_count or len(candidates) == len(rows):
+                    return ordered
+                wanted *= 2
+
+        distance_column = self.astronomical
+        wanted = top_count
+        while True:
+            ordered = heapq.nsmallest(wanted, rows, key=lambda row: (distance_column[row], row))
+            unique = self.unique_rows(ordered, top_count)
+            if len(unique) == top_count or wanted >= len(rows):
+                return unique
+            wanted *= 2
+
+    def unique_rows(self, ordered, top_count):
+        seen = set()
+        unique = []
+        for row in ordered:
+            key = (self.neo_id[row], self.epoch[row])
+            if key in seen:
+                continue
+            seen.add(key)
+            unique.append(row)
+            if len(unique) == top_count:
+                break
+        return unique
+
+    # Report queries, returning NEO JSON objects as the crawl consumers do
+    def closest(self, body='Earth'):
+        rows = self.nearest(self.select(body), 1)
+        return self.record(rows[0]) if rows else None
+
+    def nearest_misses(self, top_count, body='Earth'):
+        return [self.record(row) for row in self.nearest(self.select(body), top_count)]
+
+    def month_closest(self, year, month, top_count, body='Earth'):
+        return [self.record(row) for row in self.nearest(self.select(body, year, month), top_count)]
+
+
+# Crawl consumer that flattens every close approach into an ApproachTable
+class ColumnarIngest:
+    def __init__(self, table=None):
+        self.table = table if table is not None else ApproachTable()
+        self.done_rows = len(self.table)   # Rows of completed pages; a page cut off mid-way is never saved
+        self.done_neos = len(self.table.neos)
+        self.logged_rows = 0               # Rows already in the checkpoint log
+        self.logged_neos = set()           # NEO ids whose JSON is already in the checkpoint log
+
+    def consume(self, neo, close_objects, page_api):
+        self.table.append(neo, close_objects)
+
+    def page_done(self, page_api):
+        self.done_rows = len(self.table)
+        self.done_neos = len(self.table.neos)
+
+    def discard_page(self, page_api):
+        self.table.truncate(self.done_rows, self.done_neos)
+
+    # Rows of completed pages as (NEO id, approach); restoring appends them again in the same order
+    def state(self):
+        table = self.table
+        rows = range(self.done_rows)
+        return {
+            'neos': {str(neo_id): neo.to_json() for neo_id, neo in table.neos.items()},
+            'rows': [[table.neo_id[row], table.approach(row)] for row in rows]
+        }
+
+    def restore(self, state):
+        for neo_id, close_objects in state['rows']:
+            self.table.append(state['neos'][str(neo_id)], close_objects)
+        self.done_rows = len(self.table)
+        self.done_neos = len(self.table.neos)
+
+    # Crawl checkpoints (crawl.py) only append the rows completed since the previous checkpoint to
+    # a log beside it, instead of writing the whole table every time
+    def checkpoint_state(self, checkpoint, name):
+        table = self.table
+        lines = []
+        for row in range(self.logged_rows, self.done_rows):
+            neo_id = table.neo_id[row]
+            neo = None
+            if neo_id not in self.logged_neos:
+                self.logged_neos.add(neo_id)
+                neo = table.neos[neo_id].to_json()
+            lines.append([neo_id, neo, table.approach(row)])
+        checkpoint.append_lines(name, lines)
+        self.logged_rows = self.done_rows
+        return {'logged_rows': self.logged_rows}
+
+    def checkpoint_restore(self, checkpoint, name, state):
+        neos = {}
+        for neo_id, neo, close_objects in checkpoint.read_lines(name, state['logged_rows']):
+            if neo is not None:
+                neos[neo_id] = neo
+            self.table.append(neos[neo_id], close_objects)
+        self.done_rows = self.logged_rows = len(self.table)
+        self.done_neos = len(self.table.neos)
+        self.logged_neos = set(neos)
+
+    # Rows of a later part of the crawl go after this one's
+    def merge(self, other):
+        self.restore(other.state())
+        return self
+
+    def result(self):
+        return self.table
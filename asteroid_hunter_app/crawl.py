@@ -0,0 +1,393 @@
+'''
+Asteroid Hunter API Pipeline
+crawl.py
+Single-pass crawls of the NeoWs browse and feed APIs: every page (or feed
+window) is fetched once and each close approach is streamed to all registered
+consumers. With a checkpoint (checkpoint.py) the browse crawl cursor and
+consumer states are saved as it goes.
+'''
+
+import math
+from .fetch import fetch_ordered, skip_failed
+from .metrics import metrics
+from .records import ApproachRecord, RecordCache, RecordError, validate
+from .top_k import TopK
+from .stream import load_streamed
+
+
+# The NEO's that pass validation (records.py). Any other is left out and recorded in failures
+# as (where + its id, error), like a skipped request, so one malformed NEO does not end the run
+def checked_neos(neos, where, failures):
+    for neo in neos:
+        try:
+            validate(neo)
+        except RecordError as err:
+            failures.append((dict(where, neo=neo.get("id") if isinstance(neo, dict) else None), err))
+            continue
+        yield neo
+
+
+class BrowseCrawl:
+    def __init__(self, get_json, browse_api, api_key, workers=1, stream=False, checkpoint=None, resume=False):
+        self.browse_api = browse_api
+        self.api_key = api_key
+        self.workers = workers        # Concurrent page requests (1 = sequential)
+        self.stream = stream          # Parse pages one NEO at a time instead of whole documents
+        # Callable (api, params) -> decoded JSON page; get_json returns the raw body chunks when streaming
+        self.get_json = load_streamed(get_json) if stream else get_json
+        self.consumers = []
+        self.failed_pages = []        # (params, error) of pages skipped after their retries, and of malformed NEO's
+        self.page_attempts = 2        # Reads of a streamed page cut off mid-body before it is skipped
+        self.checkpoint = checkpoint  # CrawlCheckpoint, or None
+        self.resume = resume          # Continue from the checkpoint's last completed page
+
+    # Add a consumer; every consumer sees every close approach of the crawl. Consumers take
+    # consume(), page_done() and discard_page(), which drops what they took from a page since
+    # its last page_done (a streamed page cut off mid-body)
+    def register(self, consumer):
+        self.consumers.append(consumer)
+        return consumer
+
+    def page_request(self, page_api):
+        params = {
+            'page':page_api,
+            'api_key':self.api_key
+        }
+        return self.browse_api, params
+
+    def get_page(self, page_api):
+        return self.get_json(*self.page_request(page_api))
+
+    # Stream all NEO's and close approaches of one page to the consumers;
+    # returns the page's "page" block (sizes and counts), or None for a skipped streamed page
+    def dispatch_page(self, page_api, load_json_per_page):
+        if self.stream:
+            return self.dispatch_streamed(page_api, load_json_per_page)
+        self.dispatch_neos(page_api, load_json_per_page["near_earth_objects"])
+        return load_json_per_page["page"]
+
+    # A streamed page is only read while it is dispatched, so a body cut off mid-stream (read
+    # error, bad JSON) fails part way through it: the consumers drop what they took from the page
+    # and it is fetched again, then skipped and listed in failed_pages like a failed request
+    def dispatch_streamed(self, page_api, streamed_page):
+        for attempt in range(self.page_attempts):
+            failure_count = len(self.failed_pages)
+            try:
+                if streamed_page is None:
+                    streamed_page = self.get_page(page_api)
+                self.dispatch_neos(page_api, streamed_page)
+                return streamed_page.header["page"]
+            except (OSError, ValueError) as err:
+                for consumer in self.consumers:
+                    consumer.discard_page(page_api)
+                del self.failed_pages[failure_count:]    # Malformed NEO's of the page are found again
+                page_error = err
+                streamed_page = None
+        self.failed_pages.append(({'page': page_api}, page_error))
+        return None
+
+    # Page 0 carries the page count, so it is dispatched instead of fetched twice; without it
+    # the crawl cannot go on
+    def dispatch_first_page(self):
+        page_block = self.dispatch_page(0, self.get_page(0))
+        if page_block is None:
+            raise self.failed_pages.pop()[1]
+        return page_block["total_pages"]
+
+    def dispatch_neos(self, page_api, neos):
+        consumers = self.consumers
+        approach_count = 0
+        for neo in checked_neos(neos, {'page': page_api}, self.failed_pages):
+            for close_objects in neo["close_approach_data"]:
+                approach_count += 1
+                for consumer in consumers:
+                    consumer.consume(neo, close_objects, page_api)
+
+        for consumer in consumers:
+            consumer.page_done(page_api)
+        metrics.count('pages', endpoint='browse')
+        metrics.count('approaches', approach_count, endpoint='browse')
+        metrics.event('page', endpoint='browse', page=page_api, approaches=approach_count)
+
+    # Crawl cursor plus every consumer's partial results
+    def save_checkpoint(self, next_page, number_pages):
+        self.checkpoint.save({
+            'browse_api': self.browse_api,
+            'consumers': [type(consumer).__name__ for consumer in self.consumers],
+            'next_page': next_page,
+            'total_pages': number_pages,
+            'failed_pages': [[params, str(err)] for params, err in self.failed_pages],
+            'states': [self.consumer_state(index, consumer) for index, consumer in enumerate(self.consumers)]
+        })
+
+    # Consumers that keep an append-only checkpoint log (ColumnarIngest) save only what is new
+    def consumer_state(self, index, consumer):
+        if hasattr(consumer, 'checkpoint_state'):
+            return consumer.checkpoint_state(self.checkpoint, str(index))
+        return consumer.state()
+
+    # Restore the consumers from a checkpoint of the same crawl; returns it, or None to start over
+    def restore_checkpoint(self):
+        state = self.checkpoint.load()
+        if state is None:
+            return None
+        if state['browse_api'] != self.browse_api or \
+                state['consumers'] != [type(consumer).__name__ for consumer in self.consumers]:
+            print(f'Checkpoint {self.checkpoint.path} is for a different crawl, starting over')
+            return None
+        for index, (consumer, consumer_state) in enumerate(zip(self.consumers, state['states'])):
+            if hasattr(consumer, 'checkpoint_restore'):
+                consumer.checkpoint_restore(self.checkpoint, str(index), consumer_state)
+            else:
+                consumer.restore(consumer_state)
+        self.failed_pages = [(params, err) for params, err in state['failed_pages']]
+        return state
+
+    def run(self):
+        state = self.restore_checkpoint() if self.checkpoint is not None and self.resume else None
+        if state is None:
+            if self.checkpoint is not None:
+                self.checkpoint.clear()   # Logs of an older crawl must not be appended to
+            number_pages = self.dispatch_first_page()
+            next_page = 1
+        else:
+            number_pages = state['total_pages']
+            next_page = state['next_page']
+            print('-------')
+            print(f'Resuming crawl at page {next_page} of {number_pages}')
+            print('-------')
+
+        self.crawl_pages(next_page, number_pages, number_pages)
+        if self.checkpoint is not None:
+            self.checkpoint.clear()
+        return [consumer.result() for consumer in self.consumers]
+
+    # Fetch and dispatch pages first_page .. stop_page - 1 (also the body of a shard, see shard.py)
+    def crawl_pages(self, first_page, stop_page, number_pages):
+        # Iterate search across the API pages; responses come back in page order.
+        # A page that keeps failing is skipped (see failed_pages) rather than ending the crawl
+        next_page = first_page
+        page_requests = (self.page_request(page_api) for page_api in range(first_page, stop_page))
+        pages = fetch_ordered(skip_failed(self.get_json, self.failed_pages), page_requests, self.workers)
+        try:
+            for page_api, load_json_per_page in enumerate(pages, start=next_page):
+                if load_json_per_page is not None:
+                    self.dispatch_page(page_api, load_json_per_page)
+                next_page = page_api + 1
+                if self.checkpoint is not None and self.checkpoint.due(page_api):
+                    self.save_checkpoint(next_page, number_pages)
+        except BaseException:
+            # Interrupted or failed: keep everything up to the last completed page
+            if self.checkpoint is not None and self.checkpoint.every > 0:
+                self.save_checkpoint(next_page, number_pages)
+            raise
+
+
+# Crawl of the feed windows of a WindowPlan (month_information.py). Every approach dated in the
+# plan's range goes to the registered consumers, and to the consumer of its bucket (a month, by
+# default) in buckets; each window ends with page_done. Every feed report runs through it.
+class FeedCrawl:
+    def __init__(self, get_json, feed_api, api_key, plan, workers=1, verbose=False):
+        self.get_json = get_json      # Callable (api, params) -> decoded JSON window
+        self.feed_api = feed_api
+        self.api_key = api_key
+        self.plan = plan
+        self.workers = workers        # Concurrent window requests (1 = sequential)
+        self.verbose = verbose        # Print the per-window block
+        self.consumers = []
+        self.buckets = {}             # Bucket -> consumer of the approaches dated in it
+        self.failed_windows = []      # (params, error) of windows skipped after their retries, and of malformed NEO's
+        self.date_done = None         # Callable (date) after each date's NEO's, for console blocks
+        self.element_count = 0        # NEO's in the windows dispatched so far
+
+    def register(self, consumer):
+        self.consumers.append(consumer)
+        return consumer
+
+    def window_request(self, idx):
+        window_start, window_end = self.plan.windows[idx]
+        params = {
+            'start_date': window_start.isoformat(),
+            'end_date': window_end.isoformat(),
+            'api_key': self.api_key
+        }
+        return self.feed_api, params
+
+    def dispatch_window(self, idx, load_json):
+        element_count = int(load_json["element_count"])
+        self.element_count += element_count
+        metrics.count('pages', endpoint='feed')
+        metrics.count('approaches', element_count, endpoint='feed')
+
+        # Verify search band for API request
+        if self.verbose:
+            window_start, window_end = self.plan.windows[idx]
+            print('-------')
+            print(f'First day of week {idx + 1}: {window_start.day}')
+            print(f'Last day of week {idx + 1}: {window_end.day}')
+            print(f'Elements in week {idx + 1}: {element_count}')
+            print(f'Total elements so far: {self.element_count}')
+            print('-------')
+
+        consumers = self.consumers
+        for bucket, date_check, neos_on_date in self.plan.route(load_json):
+            bucket_consumer = self.buckets.get(bucket)
+            for neo in checked_neos(neos_on_date, {'date': date_check}, self.failed_windows):
+                for close_objects in neo["close_approach_data"]:
+                    for consumer in consumers:
+                        consumer.consume(neo, close_objects, idx)
+                    if bucket_consumer is not None:
+                        bucket_consumer.consume(neo, close_objects, idx)
+            if self.date_done is not None:
+                self.date_done(date_check)
+
+        for consumer in consumers:
+            consumer.page_done(idx)
+        for consumer in self.buckets.values():
+            consumer.page_done(idx)
+
+    # Fetch and dispatch windows first .. stop - 1; responses come back in window order, and each
+    # window's index is yielded once it is dispatched (or skipped, see failed_windows)
+    def crawl_windows(self, first=0, stop=None):
+        stop = len(self.plan.windows) if stop is None else stop
+        window_requests = [self.window_request(idx) for idx in range(first, stop)]
+        window_responses = fetch_ordered(skip_failed(self.get_json, self.failed_windows), window_requests,
+                                         self.workers)
+        for idx, load_json in enumerate(window_responses, start=first):
+            if load_json is not None:
+                self.dispatch_window(idx, load_json)
+            yield idx
+
+    def run(self):
+        for _ in self.crawl_windows():
+            pass
+        return [consumer.result() for consumer in self.consumers]
+
+
+# Closest approach to Earth of any NEO
+class ClosestApproach:
+    def __init__(self, verbose=True):
+        self.verbose = verbose             # Print the per-page block
+        self.closest_distance = math.inf   # Start default value where any added value will be new closest
+        self.page_api_closest = 0          # Page of closest NEO JSON Object
+        self.closest_record = None         # ApproachRecord (records.py), not the page's dicts
+        self.records = RecordCache()
+        self.kept = self.closest_distance, self.closest_record, self.page_api_closest   # As of the last page_done
+
+    def state(self):
+        return {
+            'closest_distance': None if self.closest_record is None else self.closest_distance,
+            'page_api_closest': self.page_api_closest,
+            'closest': None if self.closest_record is None else self.closest_record.to_json()
+        }
+
+    def restore(self, state):
+        if state['closest'] is not None:
+            self.closest_distance = state['closest_distance']
+            self.closest_record = ApproachRecord.from_report(state['closest'])
+        self.page_api_closest = state['page_api_closest']
+        self.kept = self.closest_distance, self.closest_record, self.page_api_closest
+
+    # Fold in the result of a later part of the crawl; strict < keeps the earlier page on ties,
+    # as a single crawl would
+    def merge(self, other):
+        if other.closest_record is not None and other.closest_distance < self.closest_distance:
+            self.closest_distance = other.closest_distance
+            self.closest_record = other.closest_record
+            self.page_api_closest = other.page_api_closest
+        return self
+
+    def consume(self, neo, close_objects, page_api):
+        if close_objects["orbiting_body"] != "Earth":
+            return
+        approach_astro_float = float(close_objects["miss_distance"]["astronomical"])
+
+        # If NEO's closest approach is closer than previous, replace holder data
+        if approach_astro_float < self.closest_distance:
+            self.closest_distance = approach_astro_float
+            self.closest_record = self.records.approach(neo, close_objects)
+            self.page_api_closest = page_api
+
+    def page_done(self, page_api):
+        self.kept = self.closest_distance, self.closest_record, self.page_api_closest
+        if not self.verbose:
+            return
+        #Output Verification Block: page, closest distance, index of closest approach
+        print('-------')
+        print(f'Current page: {page_api}')
+        print(f'Closest astronomical distance: {self.closest_distance}')
+        print(f'Closest NEO page: {self.page_api_closest}')
+        print('-------')
+
+    def discard_page(self, page_api):
+        self.closest_distance, self.closest_record, self.page_api_closest = self.kept
+
+    # Closest NEO with its close_approach_data reduced to the closest approach
+    def result(self):
+        if self.closest_record is None:
+            return None
+        return self.closest_record.to_json()
+
+
+# Top (qty) nearest misses to Earth (past and future)
+class NearestMisses:
+    def __init__(self, top_count, verbose=True):
+        self.closest = TopK(top_count)   # ApproachRecords keyed on (NEO id, epoch) so repeat approaches are ignored
+        self.page_api_closest = 0
+        self.verbose = verbose            # Print the per-page block
+        self.inserts_counted = 0
+        self.records = RecordCache()
+        self.kept = self.closest.mark(), self.page_api_closest   # As of the last page_done
+
+    # Entries closest first, so restoring keeps first-arrival order among equal distances
+    def state(self):
+        return {
+            'entries': [[distance, list(key), record.to_json()] for distance, key, record in self.closest.entries()],
+            'page_api_closest': self.page_api_closest
+        }
+
+    def restore(self, state):
+        for distance, key, item in state['entries']:
+            self.closest.push(distance, tuple(key), ApproachRecord.from_report(item))
+        self.page_api_closest = state['page_api_closest']
+        self.kept = self.closest.mark(), self.page_api_closest
+
+    # Fold in the result of a later part of the crawl (entries already kept win ties)
+    def merge(self, other):
+        self.closest.merge(other.closest)
+        return self
+
+    def consume(self, neo, close_objects, page_api):
+        if close_objects["orbiting_body"] != "Earth":
+            return
+        approach_astro_float = float(close_objects["miss_distance"]["astronomical"])
+
+        # If current astronomical distance is larger than largest stored value, skip
+        if not self.closest.accepts(approach_astro_float):
+            return
+
+        key = (neo["id"], close_objects["epoch_date_close_approach"])
+        if key in self.closest.keys:
+            return
+        if self.closest.push(approach_astro_float, key, self.records.approach(neo, close_objects)):
+            self.page_api_closest = page_api
+
+    def page_done(self, page_api):
+        metrics.count('topk_inserts', self.closest.insert_count - self.inserts_counted)
+        self.inserts_counted = self.closest.insert_count
+        self.kept = self.closest.mark(), self.page_api_closest
+        if not self.verbose:
+            return
+        #Output Test Block: page, closest distance, index of closest approach
+        print('-------')
+        print(f'Current page: {page_api}')
+        print(f'Closest astronomical distance array: {self.closest.distances()}')
+        print(f'Closest NEO page: {self.page_api_closest}')
+        print('-------')
+
+    def discard_page(self, page_api):
+        mark, self.page_api_closest = self.kept
+        self.closest.rewind(mark)
+
+    def result(self):
+        return [record.to_json() for record in self.closest.items()]
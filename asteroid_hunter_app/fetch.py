@@ -0,0 +1,160 @@
+'''
+Asteroid Hunter API Pipeline
+fetch.py
+Concurrent page fetching with a bounded worker pool, per-host rate limiting
+and retries with jittered exponential backoff.
+'''
+
+import email.utils, random, threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+
+# Sliding window limiter: at most max_calls requests in any period (seconds)
+class RateLimiter:
+    def __init__(self, max_calls, period=3600.0, clock=time.monotonic, sleep=time.sleep):
+        self.max_calls = max_calls
+        self.period = period
+        self.clock = clock
+        self.sleep = sleep
+        self.calls = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                # Forget calls that fell out of the window
+                while self.calls and now - self.calls[0] >= self.period:
+                    self.calls.popleft()
+                if len(self.calls) < self.max_calls:
+                    self.calls.append(now)
+                    return
+                wait = self.period - (now - self.calls[0])
+            self.sleep(wait)
+
+    # Server says only `remaining` calls are left: count the difference as calls made now,
+    # so the window never allows more than the server will accept
+    def observe(self, remaining):
+        with self.lock:
+            now = self.clock()
+            while self.calls and now - self.calls[0] >= self.period:
+                self.calls.popleft()
+            for _ in range(self.max_calls - len(self.calls) - max(remaining, 0)):
+                self.calls.append(now)
+
+
+# One RateLimiter per host, so browse and feed share NASA's key quota
+class HostRateLimiter:
+    def __init__(self, max_calls, period=3600.0):
+        self.max_calls = max_calls
+        self.period = period
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def limiter(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            limiter = self.limiters.get(host)
+            if limiter is None:
+                limiter = self.limiters[host] = RateLimiter(self.max_calls, self.period)
+        return limiter
+
+    def acquire(self, url):
+        self.limiter(url).acquire()
+
+    def observe(self, url, remaining):
+        self.limiter(url).observe(remaining)
+
+
+# Wrap a fetch function taking the api url first so every call waits for its host's quota.
+# Responses carrying X-RateLimit-Remaining (NASA sends it on every call) resync the quota.
+def rate_limited(fetch, limiter):
+    def limited_fetch(api, *args, **kwargs):
+        limiter.acquire(api)
+        response = fetch(api, *args, **kwargs)
+        remaining = getattr(response, 'headers', {}).get('X-RateLimit-Remaining')
+        if remaining is not None and str(remaining).isdigit():
+            limiter.observe(api, int(remaining))
+        return response
+    return limited_fetch
+
+
+retry_statuses = (429, 500, 502, 503, 504)
+
+# Full jitter: uniform over [0, backoff * 2**attempt], capped at max_backoff
+def backoff_delay(attempt, backoff, max_backoff, random=random.random):
+    return random() * min(max_backoff, backoff * 2 ** attempt)
+
+# Seconds asked for by a Retry-After header (delta seconds or HTTP date), None if absent
+def retry_after(response, clock=time.time):
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - clock())
+    except (TypeError, ValueError):
+        return None
+
+# Wrap fetch(api, ...) -> response so connection errors (errors) and 429/5xx responses are
+# retried with backoff (Retry-After wins when given); the final response is raise_for_status()ed
+def retrying(fetch, retries=4, backoff=1.0, max_backoff=60.0, errors=(), sleep=time.sleep,
+             random=random.random):
+    def retried_fetch(api, *args, **kwargs):
+        for attempt in range(retries + 1):
+            try:
+                response = fetch(api, *args, **kwargs)
+            except errors:
+                if attempt == retries:
+                    raise
+                sleep(backoff_delay(attempt, backoff, max_backoff, random))
+                continue
+            if response.status_code not in retry_statuses or attempt == retries:
+                response.raise_for_status()
+                return response
+            delay = retry_after(response)
+            sleep(delay if delay is not None else backoff_delay(attempt, backoff, max_backoff, random))
+    return retried_fetch
+
+
+# Page-level retry on top of retrying(): a page that still fails (HTTP error after its retries,
+# or a body that does not decode) is fetched again, then recorded in failures (params without
+# the api_key) and returned as None, so one bad page never ends a crawl
+def skip_failed(get_json, failures, attempts=2):
+    def get_json_or_none(api, params):
+        for attempt in range(attempts):
+            try:
+                return get_json(api, params)
+            except (OSError, ValueError) as err:
+                if attempt == attempts - 1:
+                    failures.append(({key: value for key, value in params.items() if key != 'api_key'}, err))
+        return None
+    return get_json_or_none
+
+
+# Fetch every (api, params) request and yield the responses in request order.
+# At most `workers` requests are in flight; workers <= 1 is the sequential path.
+def fetch_ordered(get_json, requests_list, workers=1):
+    if workers <= 1:
+        for api, params in requests_list:
+            yield get_json(api, params)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        requests_iter = iter(requests_list)
+
+        # Keep the pool full, but never buffer more than `workers` responses ahead
+        for api, params in requests_iter:
+            pending.append(executor.submit(get_json, api, params))
+            if len(pending) >= workers:
+                break
+        while pending:
+            response = pending.popleft().result()
+            for api, params in requests_iter:
+                pending.append(executor.submit(get_json, api, params))
+                break
+            yield response
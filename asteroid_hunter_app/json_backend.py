@@ -0,0 +1,58 @@
+'''
+Asteroid Hunter API Pipeline
+json_backend.py
+Pluggable JSON decoder/encoder: orjson or ujson when installed, stdlib json otherwise.
+'''
+
+import json
+
+
+def _stdlib_loads(data):
+    return json.loads(data)
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, separators=(',', ':'))
+
+def _load_backend(name):
+    if name == 'orjson':
+        import orjson
+        return orjson.loads, lambda obj: orjson.dumps(obj).decode()
+    if name == 'ujson':
+        import ujson
+        return ujson.loads, lambda obj: ujson.dumps(obj, escape_forward_slashes=False)
+    if name == 'json':
+        return _stdlib_loads, _stdlib_dumps
+    raise ValueError(f'Unknown JSON backend: {name}')
+
+# Select a backend by name; returns the name actually in use
+def set_backend(name=None):
+    global backend, _loads, _dumps
+    candidates = [name] if name else ['orjson', 'ujson', 'json']
+    for candidate in candidates:
+        try:
+            _loads, _dumps = _load_backend(candidate)
+        except ImportError:
+            continue
+        backend = candidate
+        return backend
+    raise ImportError(f'JSON backend {name} is not installed')
+
+backend = None
+_loads, _dumps = _stdlib_loads, _stdlib_dumps
+set_backend()
+
+# Decode a str or bytes body; called exactly once per response
+def loads(data):
+    return _loads(data)
+
+# Compact encoding for machine-read outputs
+def dumps(obj):
+    return _dumps(obj)
+
+# Indented report files (closest_neo.json etc.) keep the stdlib layout, so their
+# bytes do not depend on which backend is installed (number and unicode escaping differ)
+def dump_report(obj, file, indent=2):
+    json.dump(obj, file, indent=indent)
+
+def dumps_report(obj, indent=2):
+    return json.dumps(obj, indent=indent)
@@ -2,16 +2,17 @@
 Asteroid Hunter API Pipeline
 Author: Dominic DiMarco
 main.py
-Rev. 1.2
+Rev. 1.8
 Input: NASA API 
 Output: .json files as per below function calls:
     asteroid_closest_approach() -> closest_neo.json
     month_closest_approaches() -> closest_neo_per_month.json
         Currently outputs element_count to console and variable: element_count
     nearest_misses() -> ten_closest_neo.json
+    browse_reports() -> closest_neo.json and ten_closest_neo.json from one browse crawl
+    month_range_closest_approaches() -> closest_neo_per_month_range.json
 
 *** Proposed Modifications on future revisions ***
--Change month_closest_approaches() to month_closest_approaches(topQty, year, month)
 -Modify nearest_misses() algorithm to nearest_misses(topQty)
 
 *** Revised Modifications on Rev 1.1 ***
@@ -22,14 +23,83 @@ Output: .json files as per below function calls:
 
 *** Revised Modifications on Rev 1.3 ***
 -Revised variable convention
+
+*** Revised Modifications on Rev 1.4 ***
+-asteroid_closest_approach() and nearest_misses() share a single browse crawl (crawl.py) via browse_reports()
+-Browse crawl walks page.total_pages instead of page.size
+-Browse pages and feed weeks are fetched concurrently (fetch_workers) under a per-host hourly quota (requests_per_hour)
+-nearest_misses() and month_closest_approaches() keep their top (qty) in a heap-based TopK (top_k.py), de-duplicated by (NEO id, epoch)
+-Responses are cached on disk (cache.py, cache_path); past feed weeks never expire, browse pages are revalidated after browse_ttl
+-Responses are decoded once from bytes by the fastest installed JSON backend (json_backend.py); no json.dumps/json.loads round-trip
+-Optional streaming parse of browse pages (stream_pages, stream.py), one NEO at a time
+-Optional columnar table of close approaches (columnar_reports, columnar.py) answering every report with vectorized queries
+-Crawls populate a local indexed NEO catalogue (catalogue.py, catalogue_path); report functions take from_catalogue=True to skip the crawl
+-closest_approaches_between() answers ad-hoc date range queries from the catalogue
+-sync_reports() incrementally syncs the catalogue (sync.py): changed browse pages by content hash, new feed weeks past a high-water mark
+-Added month_range_closest_approaches(start_year, start_month, end_year, end_month, top_qty)
+-Reports only run when main.py is executed, not on import
+
+*** Revised Modifications on Rev 1.5 ***
+-Package imports; requests is only imported when a request is made
+-Command line moved to cli.py: asteroid-hunter {closest,misses,browse,month,months,between,sync}
+-http_transport swaps requests for an offline NeoWs stand-in (replay.py); benchmarks/ measures every report against it
+
+*** Revised Modifications on Rev 1.6 ***
+-One pooled keep-alive requests.Session for every request, with request_timeout
+-Connection errors, timeouts, 429 and 5xx responses are retried with jittered exponential backoff (Retry-After honoured)
+-X-RateLimit-Remaining resyncs the hourly quota limiter
+-A page that still fails is fetched once more, then skipped and listed instead of ending the crawl
+-Browse crawls checkpoint their cursor and partial results every checkpoint_every pages (checkpoint.py);
+ resume_crawl (asteroid-hunter --resume) continues an interrupted crawl from its last completed page.
+ Sharded crawls are not checkpointed, so resume_crawl cannot be combined with sharding
+-Reports are written through output sinks (sinks.py): output_format json (default, same bytes as before),
+ ndjson, parquet or arrow, optionally gzip (output_compress); records are written as they are final
+-Output files are always closed (month_closest_approaches() called file.close without parentheses)
+-echo_reports = False skips pretty-printing whole reports to the console
+
+*** Revised Modifications on Rev 1.7 ***
+-Request latency, bytes, decode time, pages, approaches, cache lookups and top (qty) inserts are recorded
+ in metrics.py; write_metrics() dumps them as Prometheus text, JSON log lines go to the asteroid_hunter_app logger
+-quiet = True turns off the per-page, per-week and per-date console blocks
+-profile_mode ('cprofile' or 'tracemalloc') captures a profile of a report run to profile_path
+
+*** Revised Modifications on Rev 1.8 ***
+-shard_processes > 1 splits the browse pages and the month range feed windows into shards run by a
+ process pool (shard.py); partial closest / top (qty) results are merged in page and window order
+-shard_queue_path puts the shards in a SQLite work queue that workers on other hosts can share
+ (asteroid-hunter worker QUEUE)
+-Feed windows come from the window planner (month_information.py): the fewest <= 7 day queries for a
+ range, memoised, with each response routed to the months it covers (replaces the math.floor week count)
+-MonthInfo follows the Gregorian leap rule (1900 and 2100 have a 28 day February)
+-query_reports() answers filtered / ranked queries (query.py): hazardous, diameter and velocity bands,
+ any orbiting body, date window, ranked on miss distance, velocity, diameter, magnitude or a
+ kinetic energy proxy -> query_results.json; ingest_filter keeps non-matching approaches out of the catalogue
+-serve_reports() runs a long-lived HTTP/JSON report service (service.py) over a warm in-memory snapshot,
+ refreshed by an incremental catalogue sync every service_refresh_seconds
+-Top (qty) approaches per day, month and year are materialised (aggregates.py) and maintained from the
+ days the catalogue changed; month (from the catalogue), period and yearly reports merge those lists
+-Kept approaches are typed, immutable records (records.py) validated against the NeoWs shape, instead of
+ shallow dict copies sharing nested dicts with the page; malformed NEO's raise RecordError
 '''
 
-import math, requests, json, os, sys
+import datetime, os, sys
 import pprint as pretty_print
-from month_information import MonthInfo
-from requests.exceptions import HTTPError
-from apikey import user_api_key
-from collections import deque
+from .month_information import MonthInfo, month_range_plan, month_span, window_plan
+from .apikey import user_api_key
+from .crawl import BrowseCrawl, ClosestApproach, FeedCrawl, NearestMisses
+from .columnar import ColumnarIngest
+from .catalogue import CatalogueIngest, NeoCatalogue
+from .sync import CatalogueSync
+from .fetch import HostRateLimiter, rate_limited, retrying
+from .cache import ResponseCache, cached
+from .checkpoint import CrawlCheckpoint
+from .sinks import open_sink, output_path
+from .metrics import instrumented, metrics, profile_capture, timed_decode
+from .shard import sharded_browse, sharded_feed
+from .query import QueryResults, filtered
+from .service import ReportIndex, serve
+from .aggregates import PeriodTops, period_bounds
+from . import json_backend
 
 # Parameters
 top_month_count = 10  # Count for top (qty) of asteroids in month
@@ -37,6 +107,34 @@ top_count = 10       # Top nearest misses value
 month_to_test = 1     # Test integer representation of month (i.e. 1 = January)
 year_to_test = 2021   # Test integer representation of year
 days_per_query = 7    # Max return on Feed API
+fetch_workers = 4     # Concurrent API requests (1 = sequential)
+requests_per_hour = 1000  # NASA hourly request quota per API key
+request_timeout = (5, 30)  # Seconds to connect, and between bytes read
+fetch_retries = 4     # Retries of a failed request (connection error, timeout, 429, 5xx)
+retry_backoff = 1.0   # Seconds; the backoff doubles per retry, with full jitter
+use_cache = True      # Serve repeat requests from the on-disk response cache
+cache_path = 'neows_cache.sqlite'
+cache_max_bytes = 512 * 1024 * 1024  # Least recently used responses are evicted past this size
+browse_ttl = 24 * 3600  # Seconds before a cached browse page is revalidated
+stream_pages = False  # Parse browse pages one NEO at a time off the socket (no whole raw body, not cached)
+columnar_reports = False  # Flatten approaches into a columnar table and answer reports with vectorized queries
+use_catalogue = True  # Store every crawled NEO and close approach in the local catalogue
+catalogue_path = 'neo_catalogue.sqlite'
+checkpoint_path = 'browse_checkpoint.json'
+checkpoint_every = 50  # Browse pages between checkpoints (0 = no checkpoints)
+resume_crawl = False  # Continue the crawl saved at checkpoint_path instead of starting over
+output_format = 'json'  # Report files: json, ndjson, parquet or arrow (parquet/arrow need pyarrow)
+output_compress = False  # gzip text reports (.gz); parquet/arrow compress internally
+echo_reports = True   # Pretty-print finished reports to the console
+quiet = False         # No per-page / per-week / per-date console blocks
+metrics_path = None   # Prometheus text dump of the run's metrics (see write_metrics())
+profile_mode = None   # 'cprofile' or 'tracemalloc' capture of a report run (see profiled())
+profile_path = 'asteroid_hunter.prof'
+ingest_filter = None  # ApproachQuery (query.py) an approach must match to be stored in the catalogue
+shard_processes = 1   # Processes sharing a browse crawl or month range (1 = no sharding)
+shard_queue_path = None  # SQLite work queue for shards, shared with workers on other hosts
+service_refresh_seconds = 3600  # Report service catalogue sync interval
+http_transport = None  # requests-like object with get(); None = requests (see replay.py for offline runs)
 browse_api = 'https://api.nasa.gov/neo/rest/v1/neo/browse?'
 feed_api = 'https://api.nasa.gov/neo/rest/v1/feed?'
 
@@ -48,285 +146,483 @@ def error_block(err):
     fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
     print(exc_type, fname, exc_tb.tb_lineno)
 
-# Get all asteroids and closest approach to Earth
-def asteroid_closest_approach():
-    try:
-        closest_distance = math.inf      # Start default value where any added value will be new closest
-        page_api = 0                     # API page start at 0
-        page_api_closest = 0              # Page of closest NEO JSON Object
-
-        # Writing to external JSON file for extraction
-        file_closest_neo = open("closest_neo.json","w")
-
-        # API Get request for number of pages to loop
-        params = {
-            'api_key':user_api_key
-        }
-        response = requests.get(browse_api, params=params).json() 
-        response_str = json.dumps(response)
-        load_json = json.loads(response_str)
-        number_pages = load_json["page"]["size"]  # Extract available API pages
-
-        # Iterate search across all API pages
-        for page_api in range(0,number_pages+1):
-
-            # API request for each page
-            params = {
-                'page':page_api,
-                'api_key':user_api_key
-            }
-            response_per_page = requests.get(browse_api, params=params).json() 
-            response_str_per_page = json.dumps(response_per_page)
-            load_json_per_page = json.loads(response_str_per_page)
-
-            # Iterate through all NEO's 
-            for count, neo in enumerate(load_json_per_page["near_earth_objects"]):
-                close_approach_data = neo["close_approach_data"]
-                
-                # Iterate through each NEO's close approach data
-                for close_objects in close_approach_data:  
-                    # Filtering parameters       
-                    orbiting_body = close_objects["orbiting_body"]
-                    approach_astro_float = float(close_objects["miss_distance"]["astronomical"])
-
-                    # If NEO's closest approach is closer than previous, replace holder data and JSON output
-                    if (approach_astro_float < closest_distance and orbiting_body == "Earth"):
-                        closest_neo = load_json_per_page["near_earth_objects"][count]
-                        closest_distance = approach_astro_float
-                        page_api_closest = page_api
-                        closest_neo["close_approach_data"] = close_objects
-
-            #Output Verification Block: page, closest distance, index of closest approach
-            print('-------')
-            print(f'Current page: {page_api}')
-            print(f'Closest astronomical distance: {closest_distance}')
-            print(f'Closest NEO page: {page_api_closest}')
-            print('-------')
+# requests is imported on the first real request, so importing the package stays cheap.
+# One Session keeps connections alive and pooled for every request and worker.
+http_session = None
+
+def transport():
+    global http_session
+    if http_transport is not None:
+        return http_transport
+    if http_session is None:
+        import requests
+        http_session = requests.Session()
+        pool_adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(fetch_workers, 10))
+        http_session.mount('https://', pool_adapter)
+        http_session.mount('http://', pool_adapter)
+    return http_session
+
+# Connection errors and timeouts worth a retry
+def transport_errors():
+    errors = (ConnectionError, TimeoutError)
+    if http_transport is None:
+        import requests
+        errors += (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                   requests.exceptions.ChunkedEncodingError)
+    return errors
+
+# Status is checked by the retry wrapper (see fetch_stack)
+def get_response(api, params, headers=None, stream=False):
+    return transport().get(api, params=params, headers=headers, stream=stream, timeout=request_timeout)
+
+# Response bodies are decoded once, straight from bytes
+def get_json(fetch_response):
+    decode = timed_decode(json_backend.loads)
+    def fetch_json(api, params):
+        return decode(fetch_response(api, params).content)
+    return fetch_json
+
+# Raw body read off the socket in chunks, for the streaming page parser
+def get_body_chunks(fetch_response):
+    def fetch_body(api, params):
+        return fetch_response(api, params, stream=True).iter_content(chunk_size=64 * 1024)
+    return fetch_body
+
+# HTTP errors can only come from requests once it has been imported (or from the replay transport)
+def http_errors():
+    errors = ()
+    requests_module = sys.modules.get('requests')
+    if requests_module is not None:
+        errors += (requests_module.exceptions.HTTPError,)
+    replay_module = sys.modules.get(__package__ + '.replay')
+    if replay_module is not None:
+        errors += (replay_module.ReplayHTTPError,)
+    return errors
+
+# Fetch functions (get_json, get_body, get_chunks) built from the parameters above on first use.
+# Shared across all crawls so the hourly key quota is respected process-wide;
+# cache hits never reach the network and so never count against the quota.
+# Every attempt of a retried request waits for the quota. get_chunks, for streamed browse
+# pages, always reads off the socket: the cache stores and serves whole bodies.
+api_fetchers = None
+response_cache = None
+
+def fetch_stack():
+    global api_fetchers, response_cache
+    if api_fetchers is None:
+        api_limiter = HostRateLimiter(requests_per_hour)
+        # Every attempt is measured, so retries show up in the request metrics
+        fetch_response = retrying(rate_limited(instrumented(get_response), api_limiter), fetch_retries,
+                                  retry_backoff, errors=transport_errors())
+        if use_cache:
+            response_cache = ResponseCache(cache_path, cache_max_bytes, browse_ttl)
+            api_fetchers = (
+                cached(fetch_response, response_cache, timed_decode(json_backend.loads)),
+                cached(fetch_response, response_cache, bytes),
+                get_body_chunks(fetch_response)
+            )
+        else:
+            api_fetchers = (get_json(fetch_response), get_body_chunks(fetch_response), get_body_chunks(fetch_response))
+    return api_fetchers
+
+# Browse page fetch function for BrowseCrawl: decoded pages, or body chunks when streaming
+def page_fetcher():
+    limited_get_json, _, limited_get_chunks = fetch_stack()
+    return limited_get_chunks if stream_pages else limited_get_json
+
+# Pages skipped after their retries, as (params without api_key, error)
+def report_failures(failures):
+    if failures:
+        print('-------')
+        print(f'Skipped {len(failures)} request(s) after retries, or malformed NEO(s):')
+        for params, err in failures:
+            print(f'{params}: {err}')
+        print('-------')
 
-        # Output JSON to file and console, then close file
-        json.dump(closest_neo, file_closest_neo, indent = 2)
-        pretty_print.pprint(closest_neo)
-        file_closest_neo.close
-        print('**********')
+# Catalogue is opened on first use and shared by every report
+neo_catalogue = None
+
+def open_catalogue():
+    global neo_catalogue
+    if neo_catalogue is None:
+        neo_catalogue = NeoCatalogue(catalogue_path)
+    return neo_catalogue
+
+# Day / month / year top (qty) aggregates over the catalogue (aggregates.py), built on first use
+# and then brought up to date with only the days this process has changed in the catalogue
+period_aggregates = None
+
+def open_aggregates():
+    global period_aggregates
+    if period_aggregates is None:
+        period_aggregates = PeriodTops.from_catalogue(open_catalogue(), max(top_count, top_month_count))
+    else:
+        period_aggregates.refresh(open_catalogue())
+    return period_aggregates
+
+# Write a report file through the configured sink: 'single' writes one object,
+# 'list' and 'object' write each record (or (key, value) pair) of an iterable as it comes
+def write_report(stem, records, layout='list'):
+    with open_sink(output_path(stem, output_format, output_compress), layout, output_format, output_compress) as sink:
+        if layout == 'single':
+            sink.write(records)
+        else:
+            for record in records:
+                sink.write(record)
+
+def echo_report(report):
+    if echo_reports:
+        pretty_print.pprint(report)
+
+# Prometheus text dump of everything recorded so far (metrics_path, if set)
+def write_metrics(path=None):
+    path = path or metrics_path
+    if path:
+        with open(path, 'w') as file_metrics:
+            file_metrics.write(metrics.prometheus_text())
+
+# Parameters a shard process needs to fetch the way this one does (see shard.py). Pool processes
+# share this process's API key, so each gets a share of the hourly quota; queue workers use their own key.
+def shard_settings():
+    return {
+        'http_transport': http_transport,
+        'browse_api': browse_api,
+        'feed_api': feed_api,
+        'use_cache': use_cache,
+        'cache_path': cache_path,
+        'cache_max_bytes': cache_max_bytes,
+        'browse_ttl': browse_ttl,
+        'requests_per_hour': requests_per_hour if shard_queue_path else max(1, requests_per_hour // shard_processes),
+        'request_timeout': request_timeout,
+        'fetch_retries': fetch_retries,
+        'retry_backoff': retry_backoff,
+        'fetch_workers': fetch_workers,
+        'stream_pages': stream_pages,
+        'use_catalogue': use_catalogue,
+        'catalogue_path': catalogue_path
+    }
+
+def sharding():
+    return shard_processes > 1 or shard_queue_path is not None
+
+# Feed crawl over a window plan; every feed report stores what it fetches in the catalogue
+def feed_crawl(plan, verbose=False):
+    crawl = FeedCrawl(fetch_stack()[0], feed_api, user_api_key, plan, fetch_workers, verbose)
+    if use_catalogue:
+        crawl.register(filtered(CatalogueIngest(open_catalogue(), from_browse=False), ingest_filter))
+    return crawl
+
+# Run a report under the profile_mode capture (no-op when profile_mode is None)
+def profiled(report, *args, **kwargs):
+    with profile_capture(profile_mode, profile_path):
+        return report(*args, **kwargs)
+
+# Crawl the browse API once, feeding every requested report from the same pages.
+# from_catalogue answers the reports from the local catalogue without any crawl.
+def browse_reports(closest=True, misses=True, from_catalogue=False):
+    try:
+        if from_catalogue:
+            catalogue = open_catalogue()
+            closest_neo = catalogue.closest() if closest else None
+            closest_neos_array = catalogue.nearest_misses(top_count) if misses else None
+        else:
+            if resume_crawl and sharding():
+                raise ValueError('A sharded crawl is not checkpointed, so it cannot resume one '
+                                 '(resume_crawl needs shard_processes = 1 and no shard_queue_path)')
+            crawl = BrowseCrawl(page_fetcher(), browse_api, user_api_key, fetch_workers, stream=stream_pages,
+                                checkpoint=CrawlCheckpoint(checkpoint_path, checkpoint_every), resume=resume_crawl)
+            if use_catalogue:
+                crawl.register(filtered(CatalogueIngest(open_catalogue()), ingest_filter))
+            if columnar_reports:
+                table = crawl.register(ColumnarIngest()).table
+            else:
+                if closest:
+                    closest_consumer = crawl.register(ClosestApproach(verbose=not quiet))
+                if misses:
+                    misses_consumer = crawl.register(NearestMisses(top_count, verbose=not quiet))
+            if sharding():
+                sharded_browse(crawl, shard_settings(), shard_processes, shard_queue_path)
+            else:
+                crawl.run()
+            report_failures(crawl.failed_pages)
+
+            if closest:
+                closest_neo = table.closest() if columnar_reports else closest_consumer.result()
+            if misses:
+                closest_neos_array = table.nearest_misses(top_count) if columnar_reports else misses_consumer.result()
+
+        # Output JSON to file and console
+        if closest:
+            write_report('closest_neo', closest_neo, 'single')
+            echo_report(closest_neo)
+            print('**********')
+        if misses:
+            write_report('ten_closest_neo', closest_neos_array)
+            echo_report(closest_neos_array)
+            print('**********')
 
     # Ensure no issues on API site
-    except HTTPError as http_err:
+    except http_errors() as http_err:
         print(f'HTTP error occured: {http_err}')
     # General error handler
     except Exception as err:
         error_block(err)
 
+# Get all asteroids and closest approach to Earth
+def asteroid_closest_approach(from_catalogue=False):
+    browse_reports(closest=True, misses=False, from_catalogue=from_catalogue)
+
 # Get top 10 nearest misses to Earth (past and future)
-def nearest_misses():
+def nearest_misses(from_catalogue=False):
+    browse_reports(closest=False, misses=True, from_catalogue=from_catalogue)
+
+
+# Get closest 10 asteroids to Earth in given month
+def month_closest_approaches(from_catalogue=False):
     try:
-        # Start default value where any added value will be new closest
-        closest_distance_array = deque([math.inf] * top_count)      
-        closest_neos_array = deque([None] * top_count)
-        closest_neos_epoch = deque([None] * top_count)
-        page_api = 0                     # API page start at 0
-        page_api_closest = 0              # Page of closest NEO JSON Object
-
-        # Writing to external JSON file for extraction
-        file_ten_closest_neo = open("ten_closest_neo.json","w")
-
-        # API Get request for number of pages to loop
-        params = {
-            'api_key':user_api_key
-        }
-        response = requests.get(browse_api, params=params).json() 
-        response_str = json.dumps(response)      
-        load_json = json.loads(response_str)
-        number_pages = load_json["page"]["size"]  # Extract available API pages
-
-        # Iterate search across all API pages
-        for page_api in range(0,number_pages+1):
-
-            # API request for each page
-            params = {
-                'page':page_api,
-                'api_key':user_api_key
-            }
-            response_per_page = requests.get(browse_api, params=params).json() 
-            response_str_per_page = json.dumps(response_per_page)
-            load_json_per_page = json.loads(response_str_per_page)
-
-            # Iterate through all NEO's
-            for count, neo in enumerate(load_json_per_page["near_earth_objects"]):
-                close_approach_data = neo["close_approach_data"]
-                
-                # Iterate through all NEO's close approach data
-                for close_objects in close_approach_data:
-                    # Filtering parameters
-                    orbiting_body = close_objects["orbiting_body"]
-                    epoch_date_close_approach = close_objects["epoch_date_close_approach"]
-                    approach_astro_float = float(close_objects["miss_distance"]["astronomical"])
-
-                    # If current astronomical distance is larger than largest stored value, skip
-                    if (approach_astro_float > max(closest_distance_array)):
-                        continue
-                    
-                    # If current astronomical distance is smaller than smallest stored value, append to first index
-                    if (approach_astro_float < closest_distance_array[0] and orbiting_body == "Earth" ):
-                        closest_neo = load_json_per_page["near_earth_objects"][count]
-                        closest_neo["close_approach_data"] = close_objects
-                        closest_distance_array.appendleft(approach_astro_float)
-                        closest_distance_array.pop()
-                        closest_neos_array.appendleft(closest_neo)
-                        closest_neos_array.pop()
-                        closest_neos_epoch.appendleft(epoch_date_close_approach)
-                        closest_neos_epoch.pop()
-                        page_api_closest = page_api
-
-                    # If distance is between values in current close distance array, 
-                    # find where it goes and insert (JSON and distance arrays) and pop off rightmost values
-                    if (approach_astro_float > closest_distance_array[0] and approach_astro_float < max(closest_distance_array) and orbiting_body == "Earth"):
-                        for jdx in range(0, len(closest_distance_array)-1):
-                            if (approach_astro_float > closest_distance_array[jdx] and (approach_astro_float in closest_distance_array) and (epoch_date_close_approach in closest_neos_epoch)):
-                                continue
-                            if (approach_astro_float < closest_distance_array[jdx] and (approach_astro_float not in closest_distance_array) and (epoch_date_close_approach not in closest_neos_epoch)):
-                                closest_neos_array.insert(jdx, closest_neo)
-                                closest_neos_array.pop()
-                                closest_distance_array.insert(jdx,approach_astro_float)
-                                closest_distance_array.pop()
-                                closest_neos_epoch.appendleft(epoch_date_close_approach)
-                                closest_neos_epoch.pop()
-
-            #Output Test Block: page, closest distance, index of closest approach
+        if from_catalogue:
+            # Writing to external JSON file for extraction; merged from the month's precomputed day lists
+            write_report('closest_neo_per_month', open_aggregates().month(year_to_test, month_to_test, top_month_count))
+            print('**********')
+            return
+
+        MonthClass = MonthInfo(year_to_test, month_to_test)
+        
+        # Object Testing Block: Date Generation
+        if not quiet:
             print('-------')
-            print(f'Current page: {page_api}')
-            print(f'Closest astronomical distance array: {closest_distance_array}')
-            print(f'Closest NEO page: {page_api_closest}')
+            print(f'Starting day: {MonthClass.start_date}')
+            print(f'Ending day: {MonthClass.end_date}')
             print('-------')
 
-        json.dump(list(closest_neos_array), file_ten_closest_neo, indent = 2)
-        pretty_print.pprint(closest_neos_array)
+        # One feed request per week in month, from the window planner; responses come back in week order
+        crawl = feed_crawl(window_plan(*month_span(year_to_test, month_to_test), days_per_query), verbose=not quiet)
 
-        file_ten_closest_neo.close
+        # Top (qty) Earth approaches in month, same selector as nearest_misses()
+        month_closest = crawl.register(ColumnarIngest() if columnar_reports else NearestMisses(top_month_count, verbose=False))
+
+        #Output Test Block: page, closest distance, index of closest approach
+        def date_block(date_check):
+            print('-------')
+            print(f'{date_check}')
+            print(f'Array of closest Neo distances: {month_closest.closest.distances()}')
+            print('-------')
+        if not columnar_reports and not quiet:
+            crawl.date_done = date_block
+
+        crawl.run()
+        report_failures(crawl.failed_windows)
+
+        # Output JSON to external file for extraction (closed by the sink)
+        if columnar_reports:
+            month_neos = month_closest.table.month_closest(year_to_test, month_to_test, top_month_count)
+        else:
+            month_neos = month_closest.result()
+        write_report('closest_neo_per_month', month_neos)
+        print('**********')
+        
+    # Ensure no issues on API site        
+    except http_errors() as http_err:
+        print(f'HTTP error occured: {http_err}')
+    # General error handler
+    except Exception as err:
+        error_block(err)
+
+# Bring the local catalogue up to date with only the changed browse pages and the
+# feed weeks after the last synced date, then write the running reports
+def sync_reports(feed_start_date=None, feed_end_date=None):
+    try:
+        limited_get_body = fetch_stack()[1]
+        catalogue_sync = CatalogueSync(open_catalogue(), limited_get_body, browse_api, feed_api,
+                                       user_api_key, top_count, fetch_workers, days_per_query)
+        changed_pages = catalogue_sync.sync_browse()
+        if feed_start_date is not None:
+            feed_end_date = feed_end_date or datetime.date.today()
+            feed_dates = catalogue_sync.sync_feed(feed_start_date, feed_end_date)
+        report_failures(catalogue_sync.failures)
+        print('-------')
+        print(f'Browse pages changed: {len(changed_pages)}')
+        if feed_start_date is not None:
+            print(f'Feed dates synced: {feed_dates}')
+        print('-------')
+
+        closest_neos_array = catalogue_sync.nearest_misses()
+        write_report('closest_neo', catalogue_sync.closest(), 'single')
+        write_report('ten_closest_neo', closest_neos_array)
         print('**********')
 
     # Ensure no issues on API site
-    except HTTPError as http_err:
+    except http_errors() as http_err:
         print(f'HTTP error occured: {http_err}')
     # General error handler
     except Exception as err:
         error_block(err)
 
+# Get closest (qty) approaches to Earth between two ISO dates, from the local catalogue
+def closest_approaches_between(start_date, end_date, top_qty=top_count):
+    return open_catalogue().closest_between(start_date, end_date, top_qty)
 
-# Get closest 10 asteroids to Earth in given month
-def month_closest_approaches():
+# Top (qty) approaches matching an ApproachQuery (query.py), ranked on its metric. The filters run
+# as approaches stream in (or inside the catalogue's SQL), so non-matching approaches are never kept.
+# A date-bounded query on Earth approaches only fetches the feed windows of its dates.
+def query_reports(approach_query, from_catalogue=False):
     try:
-        # Writing to external JSON file for extraction
-        file_closest_neo_month = open("closest_neo_per_month.json","w")
-
-        # Start default value where any added value will be new closest
-        closest_distance_array = deque([math.inf] * top_month_count) 
-        closest_neos_array = deque([None] * top_month_count)
-        closest_neos_epoch = deque([None] * top_month_count)  
-        total_neos_in_month = 0 
-        MonthClass = MonthInfo(year_to_test, month_to_test)
-        
-        # Object Testing Block: Date Generation
-        print('-------')
-        print(f'Starting day: {MonthClass.start_date}')
-        print(f'Ending day: {MonthClass.end_date}')
-        print('-------')
+        if from_catalogue:
+            query_records = open_catalogue().search(approach_query)
+        elif approach_query.start_date and approach_query.end_date and approach_query.body == 'Earth':
+            crawl = feed_crawl(window_plan(datetime.date.fromisoformat(approach_query.start_date),
+                                           datetime.date.fromisoformat(approach_query.end_date), days_per_query))
+            query_consumer = crawl.register(QueryResults(approach_query))
+            crawl.run()
+            report_failures(crawl.failed_windows)
+            query_records = query_consumer.result()
+        else:
+            crawl = BrowseCrawl(page_fetcher(), browse_api, user_api_key, fetch_workers, stream=stream_pages)
+            if use_catalogue:
+                crawl.register(filtered(CatalogueIngest(open_catalogue()), ingest_filter))
+            query_consumer = crawl.register(QueryResults(approach_query, verbose=not quiet))
+            if sharding():
+                sharded_browse(crawl, shard_settings(), shard_processes, shard_queue_path)
+            else:
+                crawl.run()
+            report_failures(crawl.failed_pages)
+            query_records = query_consumer.result()
+
+        write_report('query_results', query_records)
+        echo_report(query_records)
+        print('**********')
+        return query_records
+
+    # Ensure no issues on API site
+    except http_errors() as http_err:
+        print(f'HTTP error occured: {http_err}')
+    # General error handler
+    except Exception as err:
+        error_block(err)
+
+# Closest (qty) approaches to Earth between two dates from the aggregates, which keep
+# max(top_count, top_month_count) per period; a longer list is queried from the catalogue
+def aggregate_top(start_date, end_date, top_qty):
+    period_tops = open_aggregates()
+    if top_qty > period_tops.top_count:
+        return closest_approaches_between(start_date.isoformat(), end_date.isoformat(), top_qty)
+    return period_tops.top(start_date, end_date, top_qty)
+
+# Closest (qty) approaches to Earth between the start of one period and the end of another
+# ('YYYY', 'YYYY-Qn', 'YYYY-MM' or 'YYYY-MM-DD'), from the catalogue's precomputed aggregates
+def period_closest_approaches(start_period, end_period, top_qty=top_count):
+    try:
+        start_date, _ = period_bounds(start_period)
+        _, end_date = period_bounds(end_period)
+        period_neos = aggregate_top(start_date, end_date, top_qty)
+        write_report('closest_neo_period', period_neos)
+        echo_report(period_neos)
+        print('**********')
+        return period_neos
+    # General error handler
+    except Exception as err:
+        error_block(err)
 
-        # Determine number of weeks in month for iteration
-        number_weeks_month = math.floor(int(MonthClass.end_day) / days_per_query)
-
-        # Iterate search across all weeks in month
-        for idx in range(0,number_weeks_month+1):
-            beginning_day = (idx * days_per_query) + 1
-            ending_day = (idx * days_per_query) + 7
-            if ending_day > int(MonthClass.end_day):
-                ending_day = int(MonthClass.end_day)
-            if beginning_day > int(MonthClass.end_day):
-                break
-
-            # API Get request for each week to get API data
-            params = {
-                'start_date': f'{year_to_test:04d}-{month_to_test:02d}-{beginning_day:02d}',
-                'end_date': f'{year_to_test:04d}-{month_to_test:02d}-{ending_day:02d}',
-                'api_key':user_api_key
-            }
-            response = requests.get(feed_api, params=params).json() 
-            response_str = json.dumps(response)
-            load_json = json.loads(response_str)  
-
-            # Output for Element Count of NEO's in month
-            element_count = int(load_json["element_count"])
-            total_neos_in_month += element_count
-
-            # Verify search band for API request
+# Year-over-year report: closest (qty) approaches to Earth of every year in a range
+def yearly_closest_approaches(start_year, end_year, top_qty=top_count):
+    try:
+        year_reports = {f'{year:04d}': aggregate_top(*period_bounds(f'{year:04d}'), top_qty)
+                        for year in range(start_year, end_year + 1)}
+        write_report('closest_neo_per_year', year_reports.items(), 'object')
+        echo_report(year_reports)
+        print('**********')
+        return year_reports
+    # General error handler
+    except Exception as err:
+        error_block(err)
+
+# Long-running report service (service.py): closest, top (qty) and per-month reports kept warm
+# in memory and served over HTTP/JSON, while a background thread syncs the catalogue every
+# refresh_seconds and rebuilds the reports when a browse page changed
+def serve_reports(host='127.0.0.1', port=8080, refresh_seconds=service_refresh_seconds, block=True):
+    catalogue = open_catalogue()
+    limited_get_body = fetch_stack()[1]
+
+    def sync_catalogue():
+        catalogue_sync = CatalogueSync(catalogue, limited_get_body, browse_api, feed_api,
+                                       user_api_key, top_count, fetch_workers, days_per_query)
+        changed_pages = catalogue_sync.sync_browse()
+        if not quiet:
+            report_failures(catalogue_sync.failures)
             print('-------')
-            print(f'First day of week {int(idx) + 1}: {beginning_day}')
-            print(f'Last day of week{int(idx) + 1}: {ending_day}')
-            print(f'Elements in week {int(idx) + 1}: {element_count}')
-            print(f'Total elements so far: {total_neos_in_month}')
+            print(f'Browse pages changed: {len(changed_pages)}')
             print('-------')
-            
-            # Iterate through all NEO's by date
-            for date_neo in load_json["near_earth_objects"]:
-                date_check = date_neo
-
-                for count, neo_choice in enumerate(load_json["near_earth_objects"][f'{date_check}']):
-                    close_approach_data = neo_choice["close_approach_data"]
-
-                    for close_objects in close_approach_data:
-                        orbiting_body = str(close_objects["orbiting_body"])
-                        epoch_date_close_approach = close_objects["epoch_date_close_approach"]
-                        approach_astro_float = float(close_objects["miss_distance"]["astronomical"])
-
-                        # If distance is larger than largest value in current close distance array, skip
-                        if (approach_astro_float > max(closest_distance_array)):
-                            continue
-
-                        # If current astronomical distance is smaller than smallest stored value, append to first index
-                        if (approach_astro_float < closest_distance_array[0] and orbiting_body == "Earth"):
-                            close_neo = load_json["near_earth_objects"][f'{date_check}'][count]
-                            close_neo["close_approach_data"] = close_objects
-                            closest_neos_array.appendleft(close_neo)
-                            closest_neos_array.pop()
-                            closest_distance_array.appendleft(approach_astro_float)
-                            closest_distance_array.pop()
-                            closest_neos_epoch.appendleft(epoch_date_close_approach)
-                            closest_neos_epoch.pop()
-            
-                        
-                        # If distance is between values in current close distance array, 
-                        # find where it goes and insert (JSON and distance arrays) and pop off rightmost values
-                        if (approach_astro_float > closest_distance_array[0] and approach_astro_float < max(closest_distance_array) and orbiting_body == "Earth"):
-                            for jdx in range(0, len(closest_distance_array)-1):
-                                if (approach_astro_float > closest_distance_array[jdx] and (approach_astro_float in closest_distance_array) and (epoch_date_close_approach in closest_neos_epoch)):
-                                    continue
-                                if (approach_astro_float < closest_distance_array[jdx] and (approach_astro_float not in closest_distance_array) and (epoch_date_close_approach not in closest_neos_epoch)):
-                                    closest_neos_array.insert(jdx, close_neo)
-                                    closest_neos_array.pop()
-                                    closest_distance_array.insert(jdx,approach_astro_float)
-                                    closest_distance_array.pop()
-                                    closest_neos_epoch.appendleft(epoch_date_close_approach)
-                                    closest_neos_epoch.pop()
-    
-                #Output Test Block: page, closest distance, index of closest approach
-                print('-------')
-                print(f'{date_check}')
-                print(f'Array of closest Neo distances: {closest_distance_array}')
-                print('-------')
-             
-        # Output JSON to file and console, then close file
-        json.dump(list(closest_neos_array), file_closest_neo_month, indent = 2)
-        file_closest_neo_month.close
+        return bool(changed_pages)
+
+    index = ReportIndex(catalogue, top_count, top_month_count, sync_catalogue, refresh_seconds).start()
+    server, base_url = serve(index, host, port)
+    print('-------')
+    print(f'Serving reports at {base_url} (/closest, /top?count=N, /months/YYYY-MM, /quarters/YYYY-Qn, '
+          '/years/YYYY, /range?start=&end=, /health, /metrics)')
+    print('-------')
+    if not block:
+        return index, server, base_url
+    try:
+        index.stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        index.stop()
+        server.shutdown()
+
+# Get closest (qty) asteroids to Earth for every month from (start_year, start_month) to
+# (end_year, end_month). Feed windows run straight across month boundaries, so no day is
+# fetched twice, and every window of the range is fetched in one concurrent batch.
+def month_range_closest_approaches(start_year, start_month, end_year, end_month, top_qty=top_month_count):
+    try:
+        if (end_year, end_month) < (start_year, start_month):
+            raise ValueError(f'Month range ends before it starts: {start_year:04d}-{start_month:02d} - '
+                             f'{end_year:04d}-{end_month:02d}')
+        range_plan = month_range_plan(start_year, start_month, end_year, end_month, days_per_query)
+
+        # One top (qty) selector per month, filled from whichever windows cover it
+        crawl = feed_crawl(range_plan)
+        crawl.buckets = {month_key: NearestMisses(top_qty, verbose=False) for month_key in range_plan.buckets}
+
+        if not quiet:
+            print('-------')
+            print(f'Months: {len(crawl.buckets)}')
+            print(f'Feed requests: {len(range_plan.windows)}')
+            print('-------')
+
+        # Route every approach to the month of its date; responses come back in window order,
+        # so each month is written out as soon as the windows have passed its last day
+        month_reports = {}
+        range_path = output_path('closest_neo_per_month_range', output_format, output_compress)
+        with open_sink(range_path, 'object', output_format, output_compress) as sink:
+            def finish_months(idx):
+                for month_key in range_plan.completed(idx):
+                    month_reports[month_key] = crawl.buckets.pop(month_key).result()
+                    sink.write((month_key, month_reports[month_key]))
+
+            if sharding():
+                # Shards come back in window order, already merged into the crawl's consumers
+                for first_window, stop_window in sharded_feed(crawl, top_qty, shard_settings(), shard_processes,
+                                                              shard_queue_path):
+                    for idx in range(first_window, stop_window):
+                        finish_months(idx)
+            else:
+                for idx in crawl.crawl_windows():
+                    finish_months(idx)
+
+        report_failures(crawl.failed_windows)
         print('**********')
-        
-    # Ensure no issues on API site        
-    except HTTPError as http_err:
+        return month_reports
+
+    # Ensure no issues on API site
+    except http_errors() as http_err:
         print(f'HTTP error occured: {http_err}')
     # General error handler
     except Exception as err:
         error_block(err)
 
 # Function Calls
-# Uncomment (if present) for accessing functions
-asteroid_closest_approach()
-nearest_misses()
-month_closest_approaches()
+# Run as a module or through the asteroid-hunter console script (see cli.py)
+if __name__ == '__main__':
+    from .cli import main
+    main()
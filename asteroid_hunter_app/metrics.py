@@ -0,0 +1,198 @@
+'''
+Asteroid Hunter API Pipeline
+metrics.py
+Instrumentation for the crawl hot path: counters and latency histograms kept in
+one registry, dumped as Prometheus text, with optional JSON log lines per event
+and a cProfile/tracemalloc capture switch.
+'''
+
+import contextlib, json, logging, threading, time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger('asteroid_hunter_app')
+second_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+descriptions = {
+    'requests': 'API requests made, by endpoint and status',
+    'request_seconds': 'API request latency',
+    'response_bytes': 'Response body bytes received',
+    'decode_seconds': 'Time spent decoding response JSON',
+    'pages': 'Browse pages and feed windows processed',
+    'approaches': 'Close approaches processed',
+    'cache_lookups': 'Response cache lookups, by result (hit, revalidated, miss)',
+    'topk_inserts': 'Entries inserted into top (qty) selectors',
+    'index_build_seconds': 'Report service snapshot rebuild time',
+    'service_seconds': 'Report service request handling time, by status',
+}
+
+
+class Metrics:
+    def __init__(self, prefix='asteroid_hunter', clock=time.perf_counter):
+        self.prefix = prefix
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.counters = {}       # (name, labels) -> total
+        self.histograms = {}     # (name, labels) -> [bucket counts, sum, count]
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(second_buckets), 0.0, 0]
+            for index, bound in enumerate(second_buckets):
+                if seconds <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    # Structured log line, only built when the logger is listening
+    def event(self, name, **fields):
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(dict(event=name, **fields)))
+
+    def total(self, name, **labels):
+        with self.lock:
+            return sum(value for (counter, counter_labels), value in self.counters.items()
+                       if counter == name and set(labels.items()) <= set(counter_labels))
+
+    def cache_hit_ratio(self):
+        lookups = self.total('cache_lookups')
+        if not lookups:
+            return None
+        return (self.total('cache_lookups', result='hit') + self.total('cache_lookups', result='revalidated')) / lookups
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+    # Plain copy of everything recorded, e.g. to send back from a shard process
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters), {key: [list(histogram[0]), histogram[1], histogram[2]]
+                                         for key, histogram in self.histograms.items()}
+
+    def merge(self, snapshot):
+        counters, histograms = snapshot
+        with self.lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, (bucket_counts, total, count) in histograms.items():
+                histogram = self.histograms.setdefault(key, [[0] * len(second_buckets), 0.0, 0])
+                histogram[0] = [mine + theirs for mine, theirs in zip(histogram[0], bucket_counts)]
+                histogram[1] += total
+                histogram[2] += count
+
+    # Prometheus text exposition format
+    def prometheus_text(self):
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        described = set()
+        for (name, labels), value in counters:
+            metric = f'{self.prefix}_{name}_total'
+            if metric not in described:
+                described.add(metric)
+                lines.append(f'# HELP {metric} {descriptions.get(name, name)}')
+                lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric}{label_text(labels)} {value}')
+        for (name, labels), (bucket_counts, total, count) in histograms:
+            metric = f'{self.prefix}_{name}'
+            if metric not in described:
+                described.add(metric)
+                lines.append(f'# HELP {metric} {descriptions.get(name, name)}')
+                lines.append(f'# TYPE {metric} histogram')
+            for bound, bucket_count in zip(second_buckets, bucket_counts):
+                lines.append(f'{metric}_bucket{label_text(labels, [("le", bound)])} {bucket_count}')
+            lines.append(f'{metric}_bucket{label_text(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{metric}_sum{label_text(labels)} {total}')
+            lines.append(f'{metric}_count{label_text(labels)} {count}')
+        ratio = self.cache_hit_ratio()
+        if ratio is not None:
+            lines.append(f'# HELP {self.prefix}_cache_hit_ratio Cache lookups served without a new body')
+            lines.append(f'# TYPE {self.prefix}_cache_hit_ratio gauge')
+            lines.append(f'{self.prefix}_cache_hit_ratio {ratio}')
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry used by the pipeline
+metrics = Metrics()
+
+
+def endpoint(api):
+    return urlsplit(api).path.rstrip('?').rstrip('/').rsplit('/', 1)[-1] or 'api'
+
+# Wrap fetch(api, ...) -> response with request latency, status and body size
+def instrumented(fetch, registry=None):
+    registry = registry or metrics
+    def measured_fetch(api, *args, **kwargs):
+        start = registry.clock()
+        response = fetch(api, *args, **kwargs)
+        seconds = registry.clock() - start
+        name = endpoint(api)
+        if kwargs.get('stream'):
+            size = int(response.headers.get('Content-Length') or 0)   # Body not read yet
+        else:
+            size = len(response.content)
+        registry.count('requests', endpoint=name, status=response.status_code)
+        registry.count('response_bytes', size, endpoint=name)
+        registry.observe('request_seconds', seconds, endpoint=name)
+        registry.event('request', endpoint=name, status=response.status_code, seconds=round(seconds, 6), bytes=size)
+        return response
+    return measured_fetch
+
+# Wrap a decode function with the time it takes
+def timed_decode(decode, registry=None):
+    registry = registry or metrics
+    def measured_decode(body):
+        start = registry.clock()
+        decoded = decode(body)
+        registry.observe('decode_seconds', registry.clock() - start)
+        return decoded
+    return measured_decode
+
+
+# Profile the enclosed block: 'cprofile' dumps pstats to path (top functions printed),
+# 'tracemalloc' writes the top allocation sites and the peak to path
+@contextlib.contextmanager
+def profile_capture(mode, path, top=20):
+    if mode is None:
+        yield
+        return
+    if mode == 'cprofile':
+        import cProfile, pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
+    elif mode == 'tracemalloc':
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(path, 'w') as profile_file:
+                profile_file.write(f'current {current} bytes, peak {peak} bytes\n')
+                for statistic in snapshot.statistics('lineno')[:top]:
+                    profile_file.write(f'{statistic}\n')
+    else:
+        raise ValueError(f'Unknown profile mode: {mode}')
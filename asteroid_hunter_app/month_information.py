@@ -1,3 +1,5 @@
+import calendar, datetime, functools
+
 class MonthInfo:
     def __init__(self, year, month):
         self.year = f'{year:04d}'
@@ -7,37 +9,98 @@ class MonthInfo:
 
         self.start_date = f'{self.year}-{self.month}-{self.start_day}'
         self.end_date = f'{self.year}-{self.month}-{self.end_day}'
-    
+
+    # Gregorian calendar (1900 and 2100 are not leap years, 2000 is); 0 for an invalid month
     def days_in_month(self, year, month):
-        if year % 4 == 0:
-            monthSwitch = {
-                1: 31,
-                2: 29,
-                3: 31,
-                4: 30,
-                5: 31,
-                6: 30,
-                7: 31,
-                8: 31,
-                9: 30,
-                10: 31,
-                11: 30,
-                12: 31,
-            }
-        else:
-            monthSwitch = {
-                1: 31,
-                2: 28,
-                3: 31,
-                4: 30,
-                5: 31,
-                6: 30,
-                7: 31,
-                8: 31,
-                9: 30,
-                10: 31,
-                11: 30,
-                12: 31,
-            }
-
-        return monthSwitch.get(month, 0)
+        if not 1 <= month <= 12:
+            return 0
+        return calendar.monthrange(year, month)[1]
+
+
+# First and last date of a month
+def month_span(year, month):
+    return datetime.date(year, month, 1), datetime.date(year, month, calendar.monthrange(year, month)[1])
+
+
+# Contiguous feed windows of at most days_per_query days covering start_date..end_date;
+# windows run across month boundaries, so no day is requested twice and the count is the
+# minimum, ceil(days / days_per_query). Memoised per range, so shared as a tuple.
+@functools.lru_cache(maxsize=256)
+def feed_windows(start_date, end_date, days_per_query=7):
+    windows = []
+    window_start = start_date
+    while window_start <= end_date:
+        window_end = min(window_start + datetime.timedelta(days=days_per_query - 1), end_date)
+        windows.append((window_start, window_end))
+        window_start = window_end + datetime.timedelta(days=1)
+    return tuple(windows)
+
+
+# Report buckets a feed date ('YYYY-MM-DD') belongs to
+def day_bucket(date_text):
+    return date_text
+
+def month_bucket(date_text):
+    return date_text[:7]
+
+def year_bucket(date_text):
+    return date_text[:4]
+
+
+# Feed windows for a date range plus the report buckets (months by default) they cover:
+# every date of a feed response is routed to its bucket, and each bucket is complete
+# after exactly one window, the one holding its last day
+class WindowPlan:
+    def __init__(self, start_date, end_date, days_per_query=7, bucket=month_bucket):
+        if end_date < start_date:
+            raise ValueError(f'Date range ends before it starts: {start_date} - {end_date}')
+        self.start_date = start_date
+        self.end_date = end_date
+        self.days_per_query = days_per_query
+        self.bucket = bucket
+        self.windows = feed_windows(start_date, end_date, days_per_query)
+
+        # Buckets in date order, and the window completing each of them
+        completed = [[] for _ in self.windows]
+        self.buckets = []
+        for idx, (window_start, window_end) in enumerate(self.windows):
+            for offset in range((window_end - window_start).days + 1):
+                day = window_start + datetime.timedelta(days=offset)
+                key = bucket(day.isoformat())
+                if not self.buckets or self.buckets[-1] != key:
+                    self.buckets.append(key)
+                if day == end_date or bucket((day + datetime.timedelta(days=1)).isoformat()) != key:
+                    completed[idx].append(key)
+        self.buckets = tuple(self.buckets)
+        self.completed_by = tuple(tuple(keys) for keys in completed)
+
+    # (start_date, end_date) request parameters of every window
+    def params(self):
+        return [{'start_date': window_start.isoformat(), 'end_date': window_end.isoformat()}
+                for window_start, window_end in self.windows]
+
+    # Buckets of the range a window's dates fall in
+    def window_buckets(self, idx):
+        window_start, window_end = self.windows[idx]
+        return list(dict.fromkeys(self.bucket((window_start + datetime.timedelta(days=offset)).isoformat())
+                                  for offset in range((window_end - window_start).days + 1)))
+
+    # Buckets whose last day is in window idx (ready to report once it is processed)
+    def completed(self, idx):
+        return self.completed_by[idx]
+
+    # (bucket, date, NEO's on date) for every date of a feed response inside the range
+    def route(self, load_json):
+        start_text, end_text = self.start_date.isoformat(), self.end_date.isoformat()
+        for date_check, neos_on_date in load_json["near_earth_objects"].items():
+            if start_text <= date_check <= end_text:
+                yield self.bucket(date_check), date_check, neos_on_date
+
+
+# Plans are memoised per range and bucket, so repeat batch jobs reuse them
+@functools.lru_cache(maxsize=64)
+def window_plan(start_date, end_date, days_per_query=7, bucket=month_bucket):
+    return WindowPlan(start_date, end_date, days_per_query, bucket)
+
+def month_range_plan(start_year, start_month, end_year, end_month, days_per_query=7):
+    return window_plan(month_span(start_year, start_month)[0], month_span(end_year, end_month)[1], days_per_query)
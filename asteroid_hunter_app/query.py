@@ -0,0 +1,225 @@
+'''
+Asteroid Hunter API Pipeline
+query.py
+Filtered and ranked close approach queries. An ApproachQuery holds the filters
+(hazardous, diameter band, velocity band, orbiting body, date window) and the
+ranking metric; it runs during ingestion (QueryResults, or filtered() in front
+of another consumer), or is pushed down into the catalogue's SQL.
+'''
+
+from .records import ApproachRecord, RecordCache
+from .top_k import TopK
+
+
+# Derived values of one close approach; diameters in km, velocities in km/s
+def miss_distance(neo, close_objects):
+    return float(close_objects["miss_distance"]["astronomical"])
+
+def velocity(neo, close_objects):
+    return float(close_objects["relative_velocity"]["kilometers_per_second"])
+
+def diameter(neo, close_objects=None):
+    diameter_km = neo["estimated_diameter"]["kilometers"]
+    return (diameter_km["estimated_diameter_min"] + diameter_km["estimated_diameter_max"]) / 2
+
+# Proportional to mass * velocity ** 2 for a fixed density (mass ~ diameter ** 3)
+def kinetic_energy(neo, close_objects):
+    return diameter(neo) ** 3 * velocity(neo, close_objects) ** 2
+
+def absolute_magnitude(neo, close_objects):
+    return neo["absolute_magnitude_h"]
+
+def hazardous(neo):
+    return neo["is_potentially_hazardous_asteroid"] in (True, 'true')
+
+
+# Ranking metrics: name -> (value, largest first, SQL over the catalogue's approaches a / neos n)
+catalogue_diameter = ("((json_extract(n.neo, '$.estimated_diameter.kilometers.estimated_diameter_min') + "
+                      "json_extract(n.neo, '$.estimated_diameter.kilometers.estimated_diameter_max')) / 2)")
+rank_metrics = {
+    'miss_distance': (miss_distance, False, 'a.astronomical'),
+    'velocity': (velocity, True, 'a.velocity'),
+    'diameter': (diameter, True, catalogue_diameter),
+    'kinetic_energy': (kinetic_energy, True,
+                       f'{catalogue_diameter} * {catalogue_diameter} * {catalogue_diameter} * a.velocity * a.velocity'),
+    'magnitude': (absolute_magnitude, False, "json_extract(n.neo, '$.absolute_magnitude_h')"),
+}
+
+
+class ApproachQuery:
+    def __init__(self, body='Earth', hazardous=None, min_diameter=None, max_diameter=None,
+                 min_velocity=None, max_velocity=None, start_date=None, end_date=None,
+                 rank='miss_distance', top_count=10):
+        if rank not in rank_metrics:
+            raise ValueError(f'Unknown ranking metric: {rank}')
+        self.body = body                  # Orbiting body, None for any
+        self.hazardous = hazardous        # True / False, None for either
+        self.min_diameter = min_diameter  # km, mean of the estimated min and max
+        self.max_diameter = max_diameter
+        self.min_velocity = min_velocity  # km/s
+        self.max_velocity = max_velocity
+        self.start_date = start_date      # ISO dates, inclusive
+        self.end_date = end_date
+        self.rank = rank
+        self.top_count = top_count
+
+    # Constructor arguments, e.g. to rebuild the query in a shard process
+    def arguments(self):
+        return dict(self.__dict__)
+
+    # Filters on the NEO alone, so its approaches can be skipped together
+    def neo_matches(self, neo):
+        if self.hazardous is not None and hazardous(neo) != self.hazardous:
+            return False
+        if self.min_diameter is not None or self.max_diameter is not None:
+            neo_diameter = diameter(neo)
+            if self.min_diameter is not None and neo_diameter < self.min_diameter:
+                return False
+            if self.max_diameter is not None and neo_diameter > self.max_diameter:
+                return False
+        return True
+
+    # Cheapest filters first: body and date are plain string compares
+    def approach_matches(self, close_objects):
+        if self.body is not None and close_objects["orbiting_body"] != self.body:
+            return False
+        if self.start_date is not None and close_objects["close_approach_date"] < self.start_date:
+            return False
+        if self.end_date is not None and close_objects["close_approach_date"] > self.end_date:
+            return False
+        if self.min_velocity is not None or self.max_velocity is not None:
+            approach_velocity = velocity(None, close_objects)
+            if self.min_velocity is not None and approach_velocity < self.min_velocity:
+                return False
+            if self.max_velocity is not None and approach_velocity > self.max_velocity:
+                return False
+        return True
+
+    def matches(self, neo, close_objects):
+        return self.approach_matches(close_objects) and self.neo_matches(neo)
+
+    # TopK keeps the smallest scores, so metrics ranked largest first are negated
+    def score(self, neo, close_objects):
+        value, largest_first, _ = rank_metrics[self.rank]
+        score = value(neo, close_objects)
+        return -score if largest_first else score
+
+    # (WHERE clause, parameters, ORDER BY) for NeoCatalogue.query
+    def sql(self):
+        clauses, params = [], []
+        if self.body is not None:
+            clauses.append('a.orbiting_body = ?')
+            params.append(self.body)
+        if self.start_date is not None:
+            clauses.append('a.close_approach_date >= ?')
+            params.append(self.start_date)
+        if self.end_date is not None:
+            clauses.append('a.close_approach_date <= ?')
+            params.append(self.end_date)
+        if self.min_velocity is not None:
+            clauses.append('a.velocity >= ?')
+            params.append(self.min_velocity)
+        if self.max_velocity is not None:
+            clauses.append('a.velocity <= ?')
+            params.append(self.max_velocity)
+        if self.hazardous is not None:
+            clauses.append('n.hazardous = ?')
+            params.append(int(self.hazardous))
+        if self.min_diameter is not None:
+            clauses.append(f'{catalogue_diameter} >= ?')
+            params.append(self.min_diameter)
+        if self.max_diameter is not None:
+            clauses.append(f'{catalogue_diameter} <= ?')
+            params.append(self.max_diameter)
+        _, largest_first, expression = rank_metrics[self.rank]
+        order = f'{expression} DESC' if largest_first else expression
+        return ' AND '.join(clauses) or '1', params, order
+
+
+# Crawl consumer answering a query: approaches are filtered as they stream past and only
+# the top (qty) matches are kept, ranked on the query's metric
+class QueryResults:
+    def __init__(self, query, verbose=False):
+        self.query = query
+        self.closest = TopK(query.top_count)   # ApproachRecords keyed on (NEO id, epoch)
+        self.verbose = verbose
+        self.matched = 0
+        self.records = RecordCache()
+        self.kept = self.closest.mark(), self.matched   # As of the last page_done
+
+    def state(self):
+        return {
+            'entries': [[score, list(key), record.to_json()] for score, key, record in self.closest.entries()],
+            'matched': self.matched
+        }
+
+    def restore(self, state):
+        for score, key, item in state['entries']:
+            self.closest.push(score, tuple(key), ApproachRecord.from_report(item))
+        self.matched += state['matched']
+        self.kept = self.closest.mark(), self.matched
+
+    # Fold in the result of a later part of the crawl (entries already kept win ties)
+    def merge(self, other):
+        self.closest.merge(other.closest)
+        self.matched += other.matched
+        return self
+
+    def consume(self, neo, close_objects, page_api):
+        if not self.query.matches(neo, close_objects):
+            return
+        self.matched += 1
+        score = self.query.score(neo, close_objects)
+        key = (neo["id"], close_objects["epoch_date_close_approach"])
+        if not self.closest.accepts(score) or key in self.closest.keys:
+            return
+        self.closest.push(score, key, self.records.approach(neo, close_objects))
+
+    def page_done(self, page_api):
+        self.kept = self.closest.mark(), self.matched
+        if not self.verbose:
+            return
+        print('-------')
+        print(f'Current page: {page_api}')
+        print(f'Matching approaches: {self.matched}')
+        print('-------')
+
+    def discard_page(self, page_api):
+        mark, self.matched = self.kept
+        self.closest.rewind(mark)
+
+    def result(self):
+        return [record.to_json() for record in self.closest.items()]
+
+
+# Consumer seeing only the approaches matching the query, so nothing else is ever stored
+class FilteredConsumer:
+    def __init__(self, consumer, query):
+        self.consumer = consumer
+        self.query = query
+
+    def consume(self, neo, close_objects, page_api):
+        if self.query.matches(neo, close_objects):
+            self.consumer.consume(neo, close_objects, page_api)
+
+    def page_done(self, page_api):
+        self.consumer.page_done(page_api)
+
+    def discard_page(self, page_api):
+        self.consumer.discard_page(page_api)
+
+    def state(self):
+        return self.consumer.state()
+
+    def restore(self, state):
+        self.consumer.restore(state)
+
+    def merge(self, other):
+        self.consumer.merge(other.consumer)
+        return self
+
+    def result(self):
+        return self.consumer.result()
+
+def filtered(consumer, query):
+    return consumer if query is None else FilteredConsumer(consumer, query)
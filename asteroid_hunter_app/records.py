@@ -0,0 +1,308 @@
+'''
+Asteroid Hunter API Pipeline
+records.py
+Typed, immutable NEO and close approach records, validated against the NeoWs
+shape in json_example.py. Only the fields the pipeline computes with are
+required; other fields, and keys the API adds later, are carried through.
+Numbers used for ranking are parsed once, repeated strings (orbiting bodies,
+dates, key layouts) are interned, and the nested unit blocks are flattened into
+tuples. to_json() rebuilds fresh NeoWs dicts with the original key order and
+number text, so report files do not change.
+'''
+
+import sys
+from collections import namedtuple
+from . import json_backend
+
+diameter_units = ('kilometers', 'meters', 'miles', 'feet')
+diameter_bounds = ('estimated_diameter_min', 'estimated_diameter_max')
+velocity_keys = ('kilometers_per_second', 'kilometers_per_hour', 'miles_per_hour')
+distance_keys = ('astronomical', 'lunar', 'kilometers', 'miles')
+neo_fields = ('links', 'id', 'neo_reference_id', 'name', 'nasa_jpl_url', 'absolute_magnitude_h',
+              'estimated_diameter', 'is_potentially_hazardous_asteroid', 'close_approach_data', 'is_sentry_object')
+approach_fields = ('close_approach_date', 'close_approach_date_full', 'epoch_date_close_approach',
+                   'relative_velocity', 'miss_distance', 'orbiting_body')
+# Fields the reports, catalogue, columnar table and queries compute with
+neo_required = ('id', 'absolute_magnitude_h', 'estimated_diameter', 'is_potentially_hazardous_asteroid',
+                'close_approach_data')
+approach_required = ('close_approach_date', 'epoch_date_close_approach', 'relative_velocity', 'miss_distance',
+                     'orbiting_body')
+velocity_required = ('kilometers_per_second',)
+distance_required = ('astronomical', 'kilometers', 'lunar')
+boolean_values = (True, False, 'true', 'false')
+
+
+class RecordError(ValueError):
+    pass
+
+
+def require(condition, neo_id, message):
+    if not condition:
+        raise RecordError(f'NEO {neo_id}: {message}')
+
+def require_keys(block, keys, neo_id, message):
+    for key in keys:
+        if key not in block:
+            raise RecordError(f'NEO {neo_id}: {message}{key}')
+
+def number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def numeric_text(value):
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+# Key layouts repeat across every NEO, so each distinct one is kept once
+_layouts = {}
+
+def layout_of(keys):
+    keys = tuple(keys)
+    layout = _layouts.get(keys)
+    if layout is None:
+        layout = _layouts[keys] = tuple(sys.intern(key) for key in keys)
+    return layout
+
+# A unit block in the usual NeoWs layout is flattened to a tuple of its values; any other
+# layout (a unit added upstream, an optional one missing) is kept whole as JSON text
+def flatten(block, keys):
+    if tuple(block) == keys:
+        return tuple(block.values())
+    return json_backend.dumps(block)
+
+def unflatten(values, keys):
+    if isinstance(values, tuple):
+        return dict(zip(keys, values))
+    return json_backend.loads(values)
+
+
+class CloseApproach(namedtuple('CloseApproach', ('date', 'date_full', 'epoch', 'velocity_text', 'distance_text',
+                                                 'orbiting_body', 'astronomical', 'velocity', 'layout', 'extra'))):
+    __slots__ = ()
+
+    @staticmethod
+    def check(close_objects, neo_id=None):
+        require(isinstance(close_objects, dict), neo_id, 'close approach is not an object')
+        require_keys(close_objects, approach_required, neo_id, 'close approach without ')
+        relative_velocity = close_objects["relative_velocity"]
+        miss_distance = close_objects["miss_distance"]
+        require(isinstance(relative_velocity, dict), neo_id, 'relative_velocity is not an object')
+        require_keys(relative_velocity, velocity_required, neo_id, 'relative_velocity without ')
+        require(isinstance(miss_distance, dict), neo_id, 'miss_distance is not an object')
+        require_keys(miss_distance, distance_required, neo_id, 'miss_distance without ')
+        require(isinstance(close_objects["epoch_date_close_approach"], int), neo_id,
+                'epoch_date_close_approach is not an integer')
+        date = close_objects["close_approach_date"]
+        if not (isinstance(date, str) and len(date) == 10 and date[4] == date[7] == '-'):
+            raise RecordError(f'NEO {neo_id}: close_approach_date is not YYYY-MM-DD: {date!r}')
+        require(isinstance(close_objects["orbiting_body"], str), neo_id, 'orbiting_body is not a string')
+        require(numeric_text(miss_distance["astronomical"]) and numeric_text(miss_distance["kilometers"]) and
+                numeric_text(miss_distance["lunar"]) and numeric_text(relative_velocity["kilometers_per_second"]),
+                neo_id, 'miss distance or velocity is not a number')
+
+    @classmethod
+    def from_json(cls, close_objects, neo_id=None):
+        cls.check(close_objects, neo_id)
+        relative_velocity = close_objects["relative_velocity"]
+        miss_distance = close_objects["miss_distance"]
+        date = close_objects["close_approach_date"]
+
+        # Fields added upstream are kept as JSON text, in their place in the layout
+        extra = tuple(json_backend.dumps(value) for key, value in close_objects.items() if key not in approach_fields)
+        return cls(sys.intern(date), close_objects.get("close_approach_date_full"),
+                   close_objects["epoch_date_close_approach"],
+                   flatten(relative_velocity, velocity_keys), flatten(miss_distance, distance_keys),
+                   sys.intern(close_objects["orbiting_body"]), float(miss_distance["astronomical"]),
+                   float(relative_velocity["kilometers_per_second"]), layout_of(close_objects), extra)
+
+    def to_json(self):
+        extra = iter(self.extra)
+        close_objects = {}
+        for key in self.layout:
+            if key == 'close_approach_date':
+                close_objects[key] = self.date
+            elif key == 'close_approach_date_full':
+                close_objects[key] = self.date_full
+            elif key == 'epoch_date_close_approach':
+                close_objects[key] = self.epoch
+            elif key == 'relative_velocity':
+                close_objects[key] = unflatten(self.velocity_text, velocity_keys)
+            elif key == 'miss_distance':
+                close_objects[key] = unflatten(self.distance_text, distance_keys)
+            elif key == 'orbiting_body':
+                close_objects[key] = self.orbiting_body
+            else:
+                close_objects[key] = json_backend.loads(next(extra))
+        return close_objects
+
+
+class NeoRecord(namedtuple('NeoRecord', ('id', 'neo_reference_id', 'name', 'nasa_jpl_url', 'absolute_magnitude_h',
+                                         'diameters', 'hazardous_value', 'sentry_value', 'links', 'layout',
+                                         'extra'))):
+    __slots__ = ()
+
+    @staticmethod
+    def check(neo):
+        require(isinstance(neo, dict), None, 'NEO is not an object')
+        neo_id = neo.get("id")
+        require_keys(neo, neo_required, neo_id, 'missing ')
+        for field in ('id', 'neo_reference_id', 'name', 'nasa_jpl_url'):
+            if field in neo and not isinstance(neo[field], str):
+                raise RecordError(f'NEO {neo_id}: {field} is not a string')
+        require(number(neo["absolute_magnitude_h"]), neo_id, 'absolute_magnitude_h is not a number')
+        require(neo["is_potentially_hazardous_asteroid"] in boolean_values, neo_id,
+                'is_potentially_hazardous_asteroid is not a boolean')
+        require('is_sentry_object' not in neo or neo["is_sentry_object"] in boolean_values, neo_id,
+                'is_sentry_object is not a boolean')
+        require('links' not in neo or isinstance(neo["links"], dict), neo_id, 'links is not an object')
+        # A list from the API, one approach in report records, None in the columnar table
+        require(isinstance(neo["close_approach_data"], (list, dict, type(None))), neo_id,
+                'close_approach_data is not a list')
+
+        # Kilometers give the diameter (queries); the usual four units flatten to eight numbers
+        estimated_diameter = neo["estimated_diameter"]
+        kilometers = estimated_diameter.get('kilometers') if isinstance(estimated_diameter, dict) else None
+        require(isinstance(kilometers, dict), neo_id, 'estimated_diameter without kilometers')
+        require(number(kilometers.get('estimated_diameter_min')) and number(kilometers.get('estimated_diameter_max')),
+                neo_id, 'estimated_diameter.kilometers is not a pair of numbers')
+
+    # NEO fields without its close approaches (kept by ApproachRecord / the columnar table)
+    @classmethod
+    def from_json(cls, neo):
+        cls.check(neo)
+        neo_id = neo["id"]
+        estimated_diameter = neo["estimated_diameter"]
+        if tuple(estimated_diameter) == diameter_units and \
+                all(isinstance(estimated_diameter[unit], dict) and tuple(estimated_diameter[unit]) == diameter_bounds
+                    and all(number(value) for value in estimated_diameter[unit].values()) for unit in diameter_units):
+            diameters = tuple(value for unit in diameter_units for value in estimated_diameter[unit].values())
+        else:
+            diameters = json_backend.dumps(estimated_diameter)
+
+        # Optional fields (name_limited, designation, orbital_data, ...) are kept as JSON text,
+        # so nothing mutable is shared with the source dict
+        extra = tuple(json_backend.dumps(value) for key, value in neo.items() if key not in neo_fields)
+        links = neo.get("links")
+        return cls(neo_id, neo.get("neo_reference_id"), neo.get("name"), neo.get("nasa_jpl_url"),
+                   neo["absolute_magnitude_h"], diameters, neo["is_potentially_hazardous_asteroid"],
+                   neo.get("is_sentry_object"), None if links is None else tuple(links.items()), layout_of(neo), extra)
+
+    @property
+    def hazardous(self):
+        return self.hazardous_value in (True, 'true')
+
+    # Mean of the estimated min and max, in km
+    @property
+    def diameter(self):
+        if isinstance(self.diameters, tuple):
+            return (self.diameters[0] + self.diameters[1]) / 2
+        kilometers = json_backend.loads(self.diameters)['kilometers']
+        return (kilometers['estimated_diameter_min'] + kilometers['estimated_diameter_max']) / 2
+
+    def estimated_diameter(self):
+        if not isinstance(self.diameters, tuple):
+            return json_backend.loads(self.diameters)
+        return {unit: {'estimated_diameter_min': self.diameters[2 * index],
+                       'estimated_diameter_max': self.diameters[2 * index + 1]}
+                for index, unit in enumerate(diameter_units)}
+
+    # NeoWs dict with close_approach_data set to the given JSON (one approach, a list, or None)
+    def to_json(self, close_approach_data=None):
+        extra = iter(self.extra)
+        neo = {}
+        for key in self.layout:
+            if key == 'links':
+                neo[key] = dict(self.links)
+            elif key == 'id':
+                neo[key] = self.id
+            elif key == 'neo_reference_id':
+                neo[key] = self.neo_reference_id
+            elif key == 'name':
+                neo[key] = self.name
+            elif key == 'nasa_jpl_url':
+                neo[key] = self.nasa_jpl_url
+            elif key == 'absolute_magnitude_h':
+                neo[key] = self.absolute_magnitude_h
+            elif key == 'estimated_diameter':
+                neo[key] = self.estimated_diameter()
+            elif key == 'is_potentially_hazardous_asteroid':
+                neo[key] = self.hazardous_value
+            elif key == 'close_approach_data':
+                neo[key] = close_approach_data
+            elif key == 'is_sentry_object':
+                neo[key] = self.sentry_value
+            else:
+                neo[key] = json_backend.loads(next(extra))
+        return neo
+
+
+# Raise RecordError unless the NEO and every one of its close approaches make records
+# (see crawl.checked_neos, which skips such NEO's instead of ending the run). Every NEO of
+# a crawl passes through here, so the usual case is one pass of plain lookups; the checks
+# with messages only run when that pass trips
+def validate(neo):
+    try:
+        kilometers = neo["estimated_diameter"]["kilometers"]
+        valid = (isinstance(neo["id"], str) and number(neo["absolute_magnitude_h"])
+                 and neo["is_potentially_hazardous_asteroid"] in boolean_values
+                 and number(kilometers["estimated_diameter_min"]) and number(kilometers["estimated_diameter_max"])
+                 and type(neo["close_approach_data"]) is list
+                 and all(isinstance(neo.get(field, ''), str) for field in ('neo_reference_id', 'name', 'nasa_jpl_url'))
+                 and neo.get("is_sentry_object", False) in boolean_values and isinstance(neo.get("links", {}), dict))
+        for close_objects in neo["close_approach_data"] if valid else ():
+            miss_distance = close_objects["miss_distance"]
+            float(miss_distance["astronomical"])
+            float(miss_distance["kilometers"])
+            float(miss_distance["lunar"])
+            float(close_objects["relative_velocity"]["kilometers_per_second"])
+            date = close_objects["close_approach_date"]
+            if not (type(close_objects["epoch_date_close_approach"]) is int and type(date) is str and len(date) == 10
+                    and date[4] == date[7] == '-' and type(close_objects["orbiting_body"]) is str):
+                valid = False
+                break
+    except (KeyError, TypeError, ValueError):
+        valid = False
+    if valid:
+        return
+    NeoRecord.check(neo)
+    require(isinstance(neo["close_approach_data"], list), neo["id"], 'close_approach_data is not a list')
+    for close_objects in neo["close_approach_data"]:
+        CloseApproach.check(close_objects, neo["id"])
+
+
+# One close approach of one NEO, as kept by the top (qty) selectors
+class ApproachRecord(namedtuple('ApproachRecord', ('neo', 'approach'))):
+    __slots__ = ()
+
+    @classmethod
+    def from_json(cls, neo, close_objects, neo_record=None):
+        if neo_record is None:
+            neo_record = NeoRecord.from_json(neo)
+        return cls(neo_record, CloseApproach.from_json(close_objects, neo_record.id))
+
+    # NeoWs report record: the NEO with close_approach_data reduced to this approach
+    @classmethod
+    def from_report(cls, record):
+        return cls.from_json(record, record["close_approach_data"])
+
+    @property
+    def key(self):
+        return self.neo.id, self.approach.epoch
+
+    def to_json(self):
+        return self.neo.to_json(self.approach.to_json())
+
+
+# The last NEO converted, so the approaches of one NEO share a single record
+class RecordCache:
+    def __init__(self):
+        self.neo = None
+        self.neo_record = None
+
+    def approach(self, neo, close_objects):
+        if neo is not self.neo:
+            self.neo_record = NeoRecord.from_json(neo)
+            self.neo = neo
+        return ApproachRecord.from_json(neo, close_objects, self.neo_record)
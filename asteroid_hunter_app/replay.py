@@ -0,0 +1,294 @@
+'''
+Asteroid Hunter API Pipeline
+replay.py
+Offline stand-in for the NeoWs API: recorded or synthetic browse/feed pages served
+through a requests-like transport (main.http_transport) or a local HTTP server.
+'''
+
+import datetime, hashlib, json, math, os, random, threading
+from array import array
+from urllib.parse import parse_qsl, urlsplit
+
+orbiting_bodies = ['Earth', 'Earth', 'Earth', 'Mars', 'Venus', 'Merc', 'Juptr']
+month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+epoch_day = datetime.date(1970, 1, 1)
+
+
+def encode(payload):
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+# Deterministic generated catalogue shaped like json_example.py; NEO's are built on demand,
+# so even 1M NEO catalogues cost nothing until pages are requested
+class SyntheticCatalogue:
+    def __init__(self, neo_count, page_size=20, seed=0, start_date=datetime.date(1900, 1, 1),
+                 end_date=datetime.date(2200, 12, 31), max_approaches=8, memoize=False):
+        self.neo_count = neo_count
+        self.page_size = page_size
+        self.seed = seed
+        self.start_date = start_date
+        self.days = (end_date - start_date).days
+        self.max_approaches = max_approaches
+        self.date_index = None
+        self.lock = threading.Lock()
+        self.rendered = {} if memoize else None   # Request -> (body, NEO count, approach count)
+        self.neos_served = 0          # NEO's and approaches handed out, for throughput figures
+        self.approaches_served = 0
+
+    # Picklable for shard processes (shard.py); locks and the date index are rebuilt there
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['lock']
+        state['date_index'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def neo(self, index):
+        rng = random.Random(f'{self.seed}-{index}')
+        neo_id = str(2000000 + index)
+        diameter_min = rng.uniform(0.001, 5.0)
+        diameter_max = diameter_min * 2.2360679775
+        close_approach_data = []
+        for _ in range(rng.randint(1, self.max_approaches)):
+            date = self.start_date + datetime.timedelta(days=rng.randrange(self.days))
+            minute = rng.randrange(24 * 60)
+            astronomical = rng.uniform(0.00005, 0.5)
+            velocity = rng.uniform(1.0, 40.0)
+            close_approach_data.append({
+                "close_approach_date": date.isoformat(),
+                "close_approach_date_full": f'{date.year:04d}-{month_names[date.month - 1]}-{date.day:02d} {minute // 60:02d}:{minute % 60:02d}',
+                "epoch_date_close_approach": ((date - epoch_day).days * 1440 + minute) * 60000,
+                "relative_velocity": {
+                    "kilometers_per_second": f'{velocity:.10f}',
+                    "kilometers_per_hour": f'{velocity * 3600:.10f}',
+                    "miles_per_hour": f'{velocity * 2236.9362920544:.10f}'
+                },
+                "miss_distance": {
+                    "astronomical": f'{astronomical:.10f}',
+                    "lunar": f'{astronomical * 389.1730284333:.10f}',
+                    "kilometers": f'{astronomical * 149597870.7:.9f}',
+                    "miles": f'{astronomical * 92955807.2730:.10f}'
+                },
+                "orbiting_body": rng.choice(orbiting_bodies)
+            })
+        close_approach_data.sort(key=lambda close_objects: close_objects["epoch_date_close_approach"])
+        return {
+            "links": {"self": f'http://www.neowsapp.com/rest/v1/neo/{neo_id}'},
+            "id": neo_id,
+            "neo_reference_id": neo_id,
+            "name": f'({index} SYN)',
+            "nasa_jpl_url": f'http://ssd.jpl.nasa.gov/sbdb.cgi?sstr={neo_id}',
+            "absolute_magnitude_h": round(rng.uniform(10.0, 30.0), 2),
+            "estimated_diameter": {
+                "kilometers": {"estimated_diameter_min": diameter_min, "estimated_diameter_max": diameter_max},
+                "meters": {"estimated_diameter_min": diameter_min * 1000, "estimated_diameter_max": diameter_max * 1000},
+                "miles": {"estimated_diameter_min": diameter_min * 0.6213711922, "estimated_diameter_max": diameter_max * 0.6213711922},
+                "feet": {"estimated_diameter_min": diameter_min * 3280.8399, "estimated_diameter_max": diameter_max * 3280.8399}
+            },
+            "is_potentially_hazardous_asteroid": rng.random() < 0.1,
+            "close_approach_data": close_approach_data,
+            "is_sentry_object": False
+        }
+
+    def neos(self):
+        for index in range(self.neo_count):
+            yield self.neo(index)
+
+    def browse(self, page):
+        total_pages = math.ceil(self.neo_count / self.page_size)
+        first = page * self.page_size
+        return {
+            "links": {"self": f'http://www.neowsapp.com/rest/v1/neo/browse?page={page}&size={self.page_size}'},
+            "page": {"size": self.page_size, "total_elements": self.neo_count,
+                     "total_pages": total_pages, "number": page},
+            "near_earth_objects": [self.neo(index) for index in range(first, min(first + self.page_size, self.neo_count))]
+        }
+
+    # Date -> indexes of NEO's with an approach that day, built on the first feed request
+    def dates(self):
+        with self.lock:
+            if self.date_index is None:
+                date_index = {}
+                for index in range(self.neo_count):
+                    for close_objects in self.neo(index)["close_approach_data"]:
+                        date_index.setdefault(close_objects["close_approach_date"], array('l')).append(index)
+                self.date_index = date_index
+        return self.date_index
+
+    def feed(self, start_date, end_date):
+        date_index = self.dates()
+        near_earth_objects = {}
+        element_count = 0
+        date = datetime.date.fromisoformat(start_date)
+        while date <= datetime.date.fromisoformat(end_date):
+            date_key = date.isoformat()
+            neos_on_date = []
+            for index in sorted(set(date_index.get(date_key, ()))):
+                neo = self.neo(index)
+                for close_objects in neo["close_approach_data"]:
+                    if close_objects["close_approach_date"] == date_key:
+                        feed_neo = dict(neo)
+                        feed_neo["close_approach_data"] = [close_objects]
+                        neos_on_date.append(feed_neo)
+            if neos_on_date:
+                near_earth_objects[date_key] = neos_on_date
+                element_count += len(neos_on_date)
+            date += datetime.timedelta(days=1)
+        return {"links": {}, "element_count": element_count, "near_earth_objects": near_earth_objects}
+
+    def render(self, path, params):
+        if path.endswith('/browse'):
+            payload = self.browse(int(params.get('page', 0)))
+            neos = payload["near_earth_objects"]
+        elif path.endswith('/feed'):
+            payload = self.feed(str(params['start_date']), str(params['end_date']))
+            neos = [neo for neos_on_date in payload["near_earth_objects"].values() for neo in neos_on_date]
+        else:
+            return None
+        return encode(payload), len(neos), sum(len(neo["close_approach_data"]) for neo in neos)
+
+    # memoize keeps every rendered body, so repeat runs measure the pipeline rather than the generator
+    def body(self, path, params):
+        key = (path, str(params.get('page')), str(params.get('start_date')), str(params.get('end_date')))
+        rendered = self.rendered.get(key) if self.rendered is not None else None
+        if rendered is None:
+            rendered = self.render(path, params)
+            if rendered is None:
+                return None
+            if self.rendered is not None:
+                self.rendered[key] = rendered
+        with self.lock:
+            self.neos_served += rendered[1]
+            self.approaches_served += rendered[2]
+        return rendered[0]
+
+
+# Responses recorded to a directory (one file per request, see RecordingTransport)
+class RecordedResponses:
+    def __init__(self, directory):
+        self.directory = directory
+
+    @staticmethod
+    def file_name(path, params):
+        if path.endswith('/browse'):
+            return f'browse-{int(params.get("page", 0))}.json'
+        return f'feed-{params["start_date"]}-{params["end_date"]}.json'
+
+    def body(self, path, params):
+        try:
+            with open(os.path.join(self.directory, self.file_name(path, params)), 'rb') as recorded:
+                return recorded.read()
+        except (FileNotFoundError, KeyError):
+            return None
+
+
+# One error type whether or not requests is installed: a requests HTTPError when it is,
+# so main.http_errors() and callers expecting either type catch it
+try:
+    from requests.exceptions import HTTPError as _HTTPError
+except ImportError:
+    _HTTPError = IOError
+
+class ReplayHTTPError(_HTTPError):
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+
+class ReplayResponse:
+    def __init__(self, status_code, content=b'', headers=None, url=''):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise ReplayHTTPError(f'{self.status_code} replay error for {self.url}', response=self)
+
+    def close(self):
+        pass
+
+
+# requests-like transport: main.http_transport = ReplayTransport(SyntheticCatalogue(10000))
+class ReplayTransport:
+    def __init__(self, source):
+        self.source = source
+        self.request_count = 0
+        self.bytes_served = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        path = urlsplit(url).path.rstrip('?').rstrip('/')
+        params = dict(parse_qsl(urlsplit(url).query), **(params or {}))
+        body = self.source.body(path, params)
+        with self.lock:
+            self.request_count += 1
+        if body is None:
+            return ReplayResponse(404, b'{"error": "not recorded"}', url=url)
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if headers and headers.get('If-None-Match') == etag:
+            return ReplayResponse(304, b'', {'ETag': etag}, url)
+        with self.lock:
+            self.bytes_served += len(body)
+        return ReplayResponse(200, body, {'ETag': etag, 'Content-Type': 'application/json'}, url)
+
+
+# Wraps a live transport and saves every successful response for later replay
+class RecordingTransport:
+    def __init__(self, transport, directory):
+        self.transport = transport
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        response = self.transport.get(url, params=params, headers=headers)
+        if response.status_code == 200:
+            path = urlsplit(url).path.rstrip('?').rstrip('/')
+            file_name = RecordedResponses.file_name(path, dict(params or {}))
+            with open(os.path.join(self.directory, file_name), 'wb') as recorded:
+                recorded.write(response.content)
+        return response
+
+
+# Local HTTP stand-in for api.nasa.gov; point main.browse_api/feed_api at the returned url
+def serve(source, host='127.0.0.1', port=0):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    transport = ReplayTransport(source)
+
+    class NeoWsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            response = transport.get(self.path, headers={'If-None-Match': self.headers.get('If-None-Match')})
+            self.send_response(response.status_code)
+            for name, value in response.headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(response.content)))
+            self.end_headers()
+            self.wfile.write(response.content)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), NeoWsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://{server.server_address[0]}:{server.server_address[1]}/neo/rest/v1'
+    return server, base_url
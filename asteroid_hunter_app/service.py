@@ -0,0 +1,176 @@
+'''
+Asteroid Hunter API Pipeline
+service.py
+Long-running report service: the closest, top (qty), per-month, per-quarter and
+per-year reports are kept warm in memory as one immutable snapshot with
+pre-encoded JSON bodies, rebuilt in the background after each incremental sync
+(only the changed days are recomputed, see aggregates.py), and served over a
+small HTTP/JSON API to any number of concurrent readers.
+'''
+
+import datetime, threading, time
+from urllib.parse import parse_qsl, urlsplit
+from . import json_backend
+from .aggregates import PeriodTops
+from .metrics import metrics
+
+
+# Everything a reader can ask for, encoded once per refresh. Readers take a reference
+# to the current snapshot and never lock; a refresh swaps in a whole new one.
+class ReportSnapshot:
+    def __init__(self, nearest_misses, period_tops, approach_count, built_at):
+        self.nearest_misses = nearest_misses   # Closest first, up to the service's top (qty)
+        self.period_tops = period_tops         # Day / month / year aggregates (/range); never changed once built
+        self.approach_count = approach_count
+        self.built_at = built_at
+        self.top_bodies = {}                   # count -> encoded top (count), filled on first request
+        self.bodies = {
+            '/closest': self.encode(nearest_misses[0] if nearest_misses else None),
+            '/top': self.encode(nearest_misses),
+            '/months': self.encode(sorted(period_tops.months)),
+            '/years': self.encode(sorted(period_tops.years)),
+        }
+        for month_key, month_top in period_tops.months.items():
+            self.bodies[f'/months/{month_key}'] = self.encode([record.to_json() for record in month_top.items()])
+        for year_key, year_top in period_tops.years.items():
+            self.bodies[f'/years/{year_key}'] = self.encode([record.to_json() for record in year_top.items()])
+            for quarter in range(1, 5):
+                self.bodies[f'/quarters/{year_key}-Q{quarter}'] = self.encode(
+                    period_tops.quarter(int(year_key), quarter))
+
+    def encode(self, obj):
+        return json_backend.dumps(obj).encode()
+
+    def top(self, count):
+        body = self.top_bodies.get(count)
+        if body is None:
+            body = self.top_bodies[count] = self.encode(self.nearest_misses[:count])
+        return body
+
+
+class ReportIndex:
+    def __init__(self, catalogue, top_count=10, month_top_count=10, refresh=None, refresh_seconds=3600.0,
+                 clock=time.time):
+        self.catalogue = catalogue
+        self.top_count = top_count
+        self.month_top_count = month_top_count
+        self.refresh = refresh                 # Callable syncing the catalogue; True when anything changed
+        self.refresh_seconds = refresh_seconds
+        self.clock = clock
+        self.snapshot = None
+        self.build_lock = threading.Lock()     # One build at a time; readers never take it
+        self.refresh_count = 0
+        self.last_error = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    # Build new aggregates (fully the first time, then a copy with only the changed days
+    # recomputed) and swap in a new snapshot holding them
+    def build(self):
+        start = time.perf_counter()
+        with self.build_lock:
+            if self.snapshot is None:
+                period_tops = PeriodTops.from_catalogue(self.catalogue, self.month_top_count)
+            else:
+                period_tops = self.snapshot.period_tops.refreshed(self.catalogue)
+            snapshot = ReportSnapshot(self.catalogue.nearest_misses(self.top_count), period_tops,
+                                      self.catalogue.count(), self.clock())
+            self.snapshot = snapshot
+        metrics.observe('index_build_seconds', time.perf_counter() - start)
+        return snapshot
+
+    # One background step: sync, and rebuild only if the catalogue changed
+    def refresh_once(self):
+        try:
+            if self.refresh is None or self.refresh():
+                self.build()
+            self.last_error = None
+        except Exception as err:
+            # The previous snapshot keeps being served
+            self.last_error = f'{type(err).__name__}: {err}'
+        self.refresh_count += 1
+
+    def start(self):
+        if self.snapshot is None:
+            self.build()
+        if self.refresh is not None and self.refresh_seconds:
+            self.thread = threading.Thread(target=self.refresh_loop, daemon=True)
+            self.thread.start()
+        return self
+
+    # First sync straight away (the catalogue may be empty or stale), then every refresh_seconds
+    def refresh_loop(self):
+        while not self.stopped.is_set():
+            self.refresh_once()
+            self.stopped.wait(self.refresh_seconds)
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    # (status, body) for a request path; everything but the health check is served from the snapshot
+    def answer(self, path):
+        url = urlsplit(path)
+        route = url.path.rstrip('/') or '/'
+        snapshot = self.snapshot
+        if route == '/top':
+            params = dict(parse_qsl(url.query))
+            try:
+                count = int(params.get('count', self.top_count))
+            except ValueError:
+                return 400, snapshot.encode({'error': f'Invalid count: {params["count"]}'})
+            if not 0 <= count <= self.top_count:
+                return 400, snapshot.encode({'error': f'count must be between 0 and {self.top_count}'})
+            return 200, snapshot.top(count)
+        if route == '/range':
+            params = dict(parse_qsl(url.query))
+            try:
+                start_date = datetime.date.fromisoformat(params['start'])
+                end_date = datetime.date.fromisoformat(params['end'])
+            except (KeyError, ValueError):
+                return 400, snapshot.encode({'error': 'start and end dates (YYYY-MM-DD) are required'})
+            return 200, snapshot.encode(snapshot.period_tops.top(start_date, end_date))
+        if route == '/health':
+            return 200, snapshot.encode({
+                'approaches': snapshot.approach_count,
+                'built_at': snapshot.built_at,
+                'refreshes': self.refresh_count,
+                'last_error': self.last_error
+            })
+        body = snapshot.bodies.get(route)
+        if body is None:
+            if route.startswith(('/months/', '/years/', '/quarters/')):
+                return 200, snapshot.encode([])   # Period with no approaches in the catalogue
+            return 404, snapshot.encode({'error': f'Unknown report: {route}'})
+        return 200, body
+
+
+# HTTP server on a background thread; returns (server, base_url). /metrics serves Prometheus text.
+def serve(index, host='127.0.0.1', port=0):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class ReportHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'          # Keep-alive, so dashboards reuse connections
+        disable_nagle_algorithm = True         # Headers and body go out without waiting on delayed ACKs
+
+        def do_GET(self):
+            start = time.perf_counter()
+            if self.path == '/metrics':
+                status, body, content_type = 200, metrics.prometheus_text().encode(), 'text/plain; version=0.0.4'
+            else:
+                (status, body), content_type = index.answer(self.path), 'application/json'
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            metrics.observe('service_seconds', time.perf_counter() - start, status=status)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), ReportHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{server.server_address[0]}:{server.server_address[1]}'
@@ -0,0 +1,307 @@
+'''
+Asteroid Hunter API Pipeline
+shard.py
+Sharded crawls: browse pages and feed windows are split into contiguous shards
+run by a process pool, or by workers on several hosts pulling shards from a
+shared SQLite work queue. Each shard returns partial consumer states; merged in
+shard order they give the same result as one sequential crawl.
+'''
+
+import datetime, os, socket, sqlite3, time, uuid
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from . import json_backend
+from .catalogue import CatalogueIngest, NeoCatalogue
+from .columnar import ColumnarIngest
+from .crawl import BrowseCrawl, ClosestApproach, FeedCrawl, NearestMisses
+from .metrics import metrics
+from .month_information import window_plan
+from .query import ApproachQuery, FilteredConsumer, QueryResults
+
+
+# Contiguous (start, stop) ranges covering start..stop - 1, at most `shards` of them
+def split_range(start, stop, shards):
+    count = stop - start
+    shards = max(1, min(shards, count))
+    bounds = [start + count * index // shards for index in range(shards + 1)]
+    return [(first, last) for first, last in zip(bounds, bounds[1:]) if first < last]
+
+
+# Consumers are rebuilt in the shard from (type name, arguments)
+def consumer_spec(consumer):
+    if isinstance(consumer, FilteredConsumer):
+        return 'FilteredConsumer', {'consumer': consumer_spec(consumer.consumer), 'query': consumer.query.arguments()}
+    if isinstance(consumer, QueryResults):
+        return 'QueryResults', {'query': consumer.query.arguments()}
+    if isinstance(consumer, NearestMisses):
+        return 'NearestMisses', {'top_count': consumer.closest.k}
+    if isinstance(consumer, CatalogueIngest):
+        return 'CatalogueIngest', {'path': consumer.catalogue.path, 'from_browse': consumer.from_browse}
+    return type(consumer).__name__, {}
+
+def build_consumer(spec):
+    name, arguments = spec
+    if name == 'ClosestApproach':
+        return ClosestApproach(verbose=False)
+    if name == 'NearestMisses':
+        return NearestMisses(arguments['top_count'], verbose=False)
+    if name == 'ColumnarIngest':
+        return ColumnarIngest()
+    if name == 'CatalogueIngest':
+        return CatalogueIngest(NeoCatalogue(arguments['path']), arguments['from_browse'])
+    if name == 'QueryResults':
+        return QueryResults(ApproachQuery(**arguments['query']))
+    if name == 'FilteredConsumer':
+        return FilteredConsumer(build_consumer(arguments['consumer']), ApproachQuery(**arguments['query']))
+    raise ValueError(f'Unknown consumer: {name}')
+
+
+# Pipeline parameters (main.py) applied once per shard process; the fetch stack is
+# rebuilt there with the process's share of the hourly quota
+def apply_settings(settings):
+    from . import main as pipeline
+    for name, value in settings.items():
+        setattr(pipeline, name, value)
+    pipeline.api_fetchers = None
+    pipeline.neo_catalogue = None
+    return pipeline
+
+
+# Run one shard task; returns partial states plus the shard's metrics
+def run_task(task):
+    from . import main as pipeline
+    # The shard's metrics are returned on their own; anything recorded before is put back
+    recorded = metrics.snapshot()
+    metrics.reset()
+    try:
+        states, failures = shard_states(pipeline, task)
+        shard_metrics = metrics.snapshot()
+    finally:
+        metrics.reset()
+        metrics.merge(recorded)
+    return {
+        'states': states,
+        'failures': [(params, str(err)) for params, err in failures],
+        'metrics': shard_metrics
+    }
+
+def shard_states(pipeline, task):
+    failures = []
+
+    if task['kind'] == 'browse':
+        crawl = BrowseCrawl(pipeline.page_fetcher(), pipeline.browse_api, pipeline.user_api_key, pipeline.fetch_workers,
+                            stream=pipeline.stream_pages)
+        for spec in task['consumers']:
+            crawl.register(build_consumer(spec))
+        first_page, stop_page = task['pages']
+        crawl.crawl_pages(first_page, stop_page, None)
+        states = [consumer.state() for consumer in crawl.consumers]
+        failures = crawl.failed_pages
+    else:
+        # Feed windows of the month range plan: one NearestMisses per month they cover
+        plan = window_plan(datetime.date.fromisoformat(task['start_date']),
+                           datetime.date.fromisoformat(task['end_date']), task['days_per_query'])
+        crawl = FeedCrawl(pipeline.fetch_stack()[0], pipeline.feed_api, pipeline.user_api_key, plan,
+                          pipeline.fetch_workers)
+        for spec in task['consumers']:
+            crawl.register(build_consumer(spec))
+        first_window, stop_window = task['windows']
+        crawl.buckets = {month_key: NearestMisses(task['top_count'], verbose=False)
+                         for idx in range(first_window, stop_window) for month_key in plan.window_buckets(idx)}
+        for _ in crawl.crawl_windows(first_window, stop_window):
+            pass
+        states = {
+            'consumers': [consumer.state() for consumer in crawl.consumers],
+            'months': {month_key: consumer.state() for month_key, consumer in crawl.buckets.items()}
+        }
+        failures = crawl.failed_windows
+    return states, failures
+
+
+# Shard results in task order from a local process pool (spawned, so nothing but the
+# settings is shared with the parent)
+def run_pool(tasks, settings, processes):
+    with ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn'),
+                             initializer=apply_settings, initargs=(settings,)) as executor:
+        yield from executor.map(run_task, tasks)
+
+
+# Metrics snapshots (metrics.py) are keyed on (name, labels) tuples; in the queue they are
+# stored as [[name, labels], value] lists
+def metrics_json(snapshot):
+    return [[[list(key), value] for key, value in table.items()] for table in snapshot]
+
+def metrics_snapshot(tables):
+    return tuple({(name, tuple(tuple(label) for label in labels)): value for (name, labels), value in table}
+                 for table in tables)
+
+
+# Work queue in a SQLite file: any process or host that can open the file claims shards.
+# A claimed shard whose lease runs out (worker died) is handed out again. Every coordinator
+# run is its own job, so several can share a queue. Tasks, settings and results are stored
+# as JSON, so opening a queue written by another host never runs its code.
+class WorkQueue:
+    def __init__(self, path, lease=600.0, clock=time.time):
+        self.path = path
+        self.lease = lease
+        self.clock = clock
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS shard_tasks (
+                id INTEGER PRIMARY KEY,
+                job TEXT,
+                task TEXT,
+                settings TEXT,
+                owner TEXT,
+                leased_until REAL,
+                result TEXT);
+            CREATE INDEX IF NOT EXISTS shard_tasks_job ON shard_tasks (job);
+        ''')
+
+    def close(self):
+        self.connection.close()
+
+    # Publish a new job's shards; returns its job id
+    def put(self, tasks, settings):
+        job = uuid.uuid4().hex
+        settings_json = json_backend.dumps(settings)
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO shard_tasks (job, task, settings) VALUES (?, ?, ?)',
+                [(job, json_backend.dumps(task), settings_json) for task in tasks])
+        return job
+
+    # Atomically lease the next unfinished shard, of any job or only of `job`;
+    # returns (id, task, settings JSON) or None
+    def claim(self, owner, job=None):
+        now = self.clock()
+        job_filter, params = ('', (now,)) if job is None else (' AND job = ?', (now, job))
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.connection.execute(
+                'SELECT id, task, settings FROM shard_tasks WHERE result IS NULL AND '
+                f'(leased_until IS NULL OR leased_until < ?){job_filter} ORDER BY id LIMIT 1', params).fetchone()
+            if row is not None:
+                self.connection.execute('UPDATE shard_tasks SET owner = ?, leased_until = ? WHERE id = ?',
+                                        (owner, now + self.lease, row[0]))
+            self.connection.execute('COMMIT')
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        return row[0], json_backend.loads(row[1]), row[2]
+
+    def complete(self, task_id, result):
+        with self.connection:
+            self.connection.execute('UPDATE shard_tasks SET result = ? WHERE id = ?',
+                                    (json_backend.dumps(result), task_id))
+
+    # (finished results by position, shards in the job)
+    def results(self, job):
+        rows = self.connection.execute('SELECT result FROM shard_tasks WHERE job = ? ORDER BY id', (job,)).fetchall()
+        return [None if result is None else json_backend.loads(result) for result, in rows], len(rows)
+
+    def clear(self, job):
+        with self.connection:
+            self.connection.execute('DELETE FROM shard_tasks WHERE job = ?', (job,))
+
+
+# Worker loop (asteroid-hunter worker QUEUE): run shards until none are left to claim,
+# or keep polling for new ones every `poll` seconds. The coordinator works only its own
+# job, with apply=False, as its pipeline is already set up.
+def work(queue_path, poll=0.0, apply=True, job=None):
+    queue = WorkQueue(queue_path)
+    owner = f'{socket.gethostname()}:{os.getpid()}'
+    applied = None
+    done = 0
+    try:
+        while True:
+            claimed = queue.claim(owner, job)
+            if claimed is None:
+                if not poll:
+                    return done
+                time.sleep(poll)
+                continue
+            task_id, task, settings = claimed
+            if apply and settings != applied:
+                apply_settings(json_backend.loads(settings))
+                applied = settings
+            result = run_task(task)
+            queue.complete(task_id, dict(result, metrics=metrics_json(result['metrics'])))
+            done += 1
+    finally:
+        queue.close()
+
+# Coordinator side of the queue: publish the shards as a new job, work on them too, and
+# yield the results in task order as they become available (other workers may finish them).
+# The transport object stays in this process; workers on other hosts fetch with their own.
+def run_queue(tasks, settings, queue_path, poll=1.0):
+    queue = WorkQueue(queue_path)
+    job = queue.put(tasks, {name: value for name, value in settings.items() if name != 'http_transport'})
+    try:
+        work(queue_path, apply=False, job=job)
+        position = 0
+        while position < len(tasks):
+            results, _ = queue.results(job)
+            while position < len(tasks) and results[position] is not None:
+                yield dict(results[position], metrics=metrics_snapshot(results[position]['metrics']))
+                position += 1
+            if position < len(tasks):
+                time.sleep(poll)
+                work(queue_path, apply=False, job=job)      # Pick up shards whose lease ran out
+    finally:
+        queue.clear(job)
+        queue.close()
+
+
+def run_shards(tasks, settings, processes=1, queue_path=None):
+    if queue_path is not None:
+        return run_queue(tasks, settings, queue_path)
+    if processes <= 1:
+        return (run_task(task) for task in tasks)
+    return run_pool(tasks, settings, processes)
+
+
+# Fold a shard's states into the crawl's consumers, rebuilt from their specs
+def merge_states(consumers, specs, states):
+    for consumer, spec, state in zip(consumers, specs, states):
+        partial = build_consumer(spec)
+        partial.restore(state)
+        consumer.merge(partial)
+
+
+# Browse crawl split across shards: page 0 (for the page count) is dispatched here,
+# pages 1 .. total_pages - 1 by the shards; their partial states are merged in page order
+def sharded_browse(crawl, settings, processes, queue_path=None):
+    number_pages = crawl.dispatch_first_page()
+    specs = [consumer_spec(consumer) for consumer in crawl.consumers]
+    tasks = [{'kind': 'browse', 'pages': pages, 'consumers': specs}
+             for pages in split_range(1, number_pages, processes * 4)]
+    for result in run_shards(tasks, settings, processes, queue_path):
+        merge_states(crawl.consumers, specs, result['states'])
+        crawl.failed_pages.extend(result['failures'])
+        metrics.merge(result['metrics'])
+    return [consumer.result() for consumer in crawl.consumers]
+
+# Month range feed crawl (FeedCrawl with a NearestMisses of top_count per month in buckets) split
+# across shards of its windows. Each shard's partial months and consumers are merged into the
+# crawl's as it comes in, in window order; yields its (first window, stop window), so months can
+# be finalised as soon as every shard covering them is in
+def sharded_feed(crawl, top_count, settings, processes, queue_path=None):
+    plan = crawl.plan
+    specs = [consumer_spec(consumer) for consumer in crawl.consumers]
+    shard_ranges = split_range(0, len(plan.windows), processes * 4)
+    tasks = [{'kind': 'feed', 'start_date': plan.start_date.isoformat(), 'end_date': plan.end_date.isoformat(),
+              'days_per_query': plan.days_per_query, 'windows': [first, last], 'top_count': top_count,
+              'consumers': specs}
+             for first, last in shard_ranges]
+    for shard_range, result in zip(shard_ranges, run_shards(tasks, settings, processes, queue_path)):
+        metrics.merge(result['metrics'])
+        merge_states(crawl.consumers, specs, result['states']['consumers'])
+        for month_key, state in result['states']['months'].items():
+            partial = NearestMisses(top_count, verbose=False)
+            partial.restore(state)
+            crawl.buckets[month_key].merge(partial)
+        crawl.failed_windows.extend(result['failures'])
+        yield shard_range
@@ -0,0 +1,200 @@
+'''
+Asteroid Hunter API Pipeline
+sinks.py
+Report output sinks: indented JSON (the original layout), compact NDJSON, gzip,
+and Parquet/Arrow when pyarrow is installed. Records are written as they are
+finalised, so a report never has to be held whole in memory. A report cut
+short by an exception is never finished: a JSON document is left without its
+closing bracket, and a Parquet/Arrow file is not written at all.
+'''
+
+import gzip, os
+from . import json_backend
+
+output_formats = ('json', 'ndjson', 'parquet', 'arrow')
+extensions = {'json': 'json', 'ndjson': 'ndjson', 'parquet': 'parquet', 'arrow': 'arrow'}
+
+
+# Report file name for a stem (e.g. 'ten_closest_neo'); gzip adds .gz to text formats only,
+# Parquet and Arrow compress internally
+def output_path(stem, format='json', compress=False):
+    path = f'{stem}.{extensions[format]}'
+    if compress and format in ('json', 'ndjson'):
+        path += '.gz'
+    return path
+
+def open_text(path, compress):
+    if compress:
+        return gzip.open(path, 'wt')
+    return open(path, 'w')
+
+
+# Layouts: 'single' (one object), 'list' (records), 'object' ((key, value) records)
+class JsonSink:
+    def __init__(self, path, layout='list', compress=False):
+        self.file = open_text(path, compress)
+        self.layout = layout
+        self.compress = compress
+        self.count = 0
+
+    # Byte for byte the layout of json.dump(whole_result, indent=2), one record at a time
+    def write(self, record):
+        if self.layout == 'single':
+            self.file.write(json_backend.dumps_report(record))
+        elif self.layout == 'list':
+            self.file.write(('[\n  ' if self.count == 0 else ',\n  ') +
+                            json_backend.dumps_report(record).replace('\n', '\n  '))
+        else:
+            key, value = record
+            self.file.write(('{\n  ' if self.count == 0 else ',\n  ') + json_backend.dumps_report(key) + ': ' +
+                            json_backend.dumps_report(value).replace('\n', '\n  '))
+        self.count += 1
+        if not self.compress:
+            self.file.flush()     # Readers further down see every finished record
+
+    # complete=False (an exception ended the report) leaves the document unterminated, so readers
+    # further down fail on it instead of taking the records so far for the whole report
+    def close(self, complete=True):
+        if complete and self.layout == 'list':
+            self.file.write('[]' if self.count == 0 else '\n]')
+        elif complete and self.layout == 'object':
+            self.file.write('{}' if self.count == 0 else '\n}')
+        elif complete and self.count == 0:
+            self.file.write('null')
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(complete=exc_type is None)
+
+
+# One compact record per line; (key, value) records become {key: value} lines. NDJSON has no
+# document end, so the lines of a report cut short are all complete records
+class NdjsonSink(JsonSink):
+    def write(self, record):
+        if self.layout == 'object':
+            record = {record[0]: record[1]}
+        if record is not None:
+            self.file.write(json_backend.dumps(record) + '\n')
+        self.count += 1
+        if not self.compress:
+            self.file.flush()
+
+    def close(self, complete=True):
+        self.file.close()
+
+
+# Flat columns per close approach; the whole record is kept as JSON in the last column
+flat_columns = (
+    ('id', 'string'),
+    ('name', 'string'),
+    ('is_potentially_hazardous_asteroid', 'bool_'),
+    ('absolute_magnitude_h', 'float64'),
+    ('estimated_diameter_km_min', 'float64'),
+    ('estimated_diameter_km_max', 'float64'),
+    ('close_approach_date', 'string'),
+    ('epoch_date_close_approach', 'int64'),
+    ('miss_distance_astronomical', 'float64'),
+    ('miss_distance_kilometers', 'float64'),
+    ('miss_distance_lunar', 'float64'),
+    ('relative_velocity_km_s', 'float64'),
+    ('orbiting_body', 'string'),
+    ('record', 'string'),
+)
+
+def flat_row(record, group=None):
+    close_objects = record["close_approach_data"]
+    miss_distance = close_objects["miss_distance"]
+    diameter = record.get("estimated_diameter", {}).get("kilometers", {})
+    row = {} if group is None else {'group': group}
+    row.update({
+        'id': record["id"],
+        'name': record.get("name"),
+        'is_potentially_hazardous_asteroid': record.get("is_potentially_hazardous_asteroid") in (True, 'true'),
+        'absolute_magnitude_h': record.get("absolute_magnitude_h"),
+        'estimated_diameter_km_min': diameter.get("estimated_diameter_min"),
+        'estimated_diameter_km_max': diameter.get("estimated_diameter_max"),
+        'close_approach_date': close_objects["close_approach_date"],
+        'epoch_date_close_approach': close_objects["epoch_date_close_approach"],
+        'miss_distance_astronomical': float(miss_distance["astronomical"]),
+        'miss_distance_kilometers': float(miss_distance["kilometers"]),
+        'miss_distance_lunar': float(miss_distance["lunar"]),
+        'relative_velocity_km_s': float(close_objects["relative_velocity"]["kilometers_per_second"]),
+        'orbiting_body': close_objects["orbiting_body"],
+        'record': json_backend.dumps(record),
+    })
+    return row
+
+
+# Parquet or Arrow IPC file written in row groups of batch_size records (needs pyarrow);
+# compress is gzip for Parquet, zstd for Arrow (the codecs each format supports). Both are
+# only readable once their footer is written, so the file is built as path.tmp and renamed
+# to path on a complete close; the writers cannot leave a file unterminated
+class ArrowSink:
+    def __init__(self, path, layout='list', format='parquet', compress=False, batch_size=10000):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError(f'{format} output needs pyarrow (pip install pyarrow)')
+        self.pyarrow = pyarrow
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.layout = layout
+        self.format = format
+        self.compression = 'gzip' if compress else None
+        self.batch_size = batch_size
+        self.rows = []
+        self.count = 0
+        columns = ([('group', 'string')] if layout == 'object' else []) + list(flat_columns)
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, type_name)()) for name, type_name in columns])
+        if format == 'parquet':
+            import pyarrow.parquet
+            self.writer = pyarrow.parquet.ParquetWriter(self.tmp_path, self.schema,
+                                                        compression=self.compression or 'none')
+        else:
+            import pyarrow.ipc
+            options = pyarrow.ipc.IpcWriteOptions(compression='zstd' if compress else None)
+            self.writer = pyarrow.ipc.new_file(self.tmp_path, self.schema, options=options)
+
+    def write(self, record):
+        if self.layout == 'object':
+            group, records = record
+            self.rows.extend(flat_row(neo, group) for neo in records)
+        elif record is not None:
+            self.rows.append(flat_row(record))
+        self.count += 1
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        self.writer.write_table(self.pyarrow.Table.from_pylist(self.rows, schema=self.schema))
+        self.rows = []
+
+    def close(self, complete=True):
+        if complete:
+            self.flush()
+        self.writer.close()
+        if complete:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(complete=exc_type is None)
+
+
+def open_sink(path, layout='list', format='json', compress=False):
+    if format == 'json':
+        return JsonSink(path, layout, compress)
+    if format == 'ndjson':
+        return NdjsonSink(path, layout, compress)
+    if format in ('parquet', 'arrow'):
+        return ArrowSink(path, layout, format, compress)
+    raise ValueError(f'Unknown output format: {format}')
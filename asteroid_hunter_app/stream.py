@@ -0,0 +1,112 @@
+'''
+Asteroid Hunter API Pipeline
+stream.py
+Incremental parsing of NeoWs pages: NEO's are decoded one at a time from the
+raw body chunks, so the raw body is never held whole next to its decoded page.
+'''
+
+import codecs, json
+
+chunk_size = 64 * 1024
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+
+
+# Split a whole body into chunks so it is decoded incrementally as well
+def iter_chunks(body, size=chunk_size):
+    if isinstance(body, (bytes, bytearray, str)):
+        for start in range(0, len(body), size):
+            yield body[start:start + size]
+    else:
+        yield from body
+
+
+class StreamedPage:
+    def __init__(self, body, array_key='near_earth_objects'):
+        self.chunks = iter_chunks(body)
+        self.array_key = array_key
+        self.header = {}          # Every other top-level field, e.g. "page" and "links"
+        self.text = ''
+        self.pos = 0
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+
+    # Pull the next chunk into the buffer, dropping everything already parsed
+    def read_more(self):
+        for chunk in self.chunks:
+            if isinstance(chunk, (bytes, bytearray)):
+                chunk = self.utf8.decode(chunk)
+            self.text = self.text[self.pos:] + chunk
+            self.pos = 0
+            return True
+        return False
+
+    def skip(self, separators=_whitespace):
+        while True:
+            text = self.text
+            pos = self.pos
+            while pos < len(text) and text[pos] in separators:
+                pos += 1
+            self.pos = pos
+            if pos < len(text) or not self.read_more():
+                return
+
+    def expect(self, token):
+        self.skip()
+        if self.text[self.pos:self.pos + 1] != token:
+            raise ValueError(f'Expected {token!r} at offset {self.pos}')
+        self.pos += 1
+
+    def peek(self):
+        self.skip()
+        return self.text[self.pos:self.pos + 1]
+
+    # Decode one complete JSON value, reading more chunks while it is cut off
+    def value(self):
+        self.skip()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self.read_more():
+                    raise
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.text) and self.read_more():
+                continue
+            self.pos = end
+            return value
+
+    # Yield each element of the streamed array; other fields are kept in header
+    def __iter__(self):
+        self.expect('{')
+        while self.peek() != '}':
+            key = self.value()
+            self.expect(':')
+            if key == self.array_key:
+                yield from self.array_items()
+            else:
+                self.header[key] = self.value()
+            self.skip(_whitespace + ',')
+        self.pos += 1
+
+    def array_items(self):
+        self.expect('[')
+        while self.peek() != ']':
+            yield self.value()
+            self.skip(_whitespace + ',')
+        self.pos += 1
+
+
+# Fetch function (api, params) -> StreamedPage over get_body's chunks. Nothing is decoded
+# until the page is iterated, so each NEO reaches the consumers before the next is read
+# (a body cut off mid-stream is handled by BrowseCrawl.dispatch_streamed)
+def load_streamed(get_body):
+    def get_json(api, params):
+        return StreamedPage(get_body(api, params))
+    return get_json
+
+# Every (neo, close approach) pair on a page, one NEO decoded at a time
+def iter_close_approaches(page):
+    for neo in page:
+        for close_objects in neo["close_approach_data"]:
+            yield neo, close_objects
@@ -0,0 +1,160 @@
+'''
+Asteroid Hunter API Pipeline
+sync.py
+Incremental catalogue sync: only browse pages whose content changed and feed
+weeks past the last synced date are ingested, and the deltas are merged into
+the running nearest misses kept in the catalogue.
+'''
+
+import datetime, hashlib
+from . import json_backend
+from .crawl import checked_neos
+from .fetch import fetch_ordered, skip_failed
+from .month_information import feed_windows
+from .records import ApproachRecord, RecordCache
+from .top_k import TopK
+
+
+def body_bytes(body):
+    if isinstance(body, (bytes, bytearray)):
+        return bytes(body)
+    return b''.join(body)
+
+
+class CatalogueSync:
+    def __init__(self, catalogue, get_body, browse_api, feed_api, api_key, top_count=10,
+                 workers=1, days_per_query=7):
+        self.catalogue = catalogue
+        self.get_body = get_body          # Callable (api, params) -> raw body (bytes or chunks)
+        self.browse_api = browse_api
+        self.feed_api = feed_api
+        self.api_key = api_key
+        self.top_count = top_count
+        self.workers = workers
+        self.days_per_query = days_per_query
+        self.failures = []                # (params, error) of requests skipped after their retries, and of malformed NEO's
+
+    # Running nearest misses (ApproachRecords, records.py), restored from the last run
+    def load_running(self):
+        running = TopK(self.top_count)
+        state = self.catalogue.get_state('nearest_misses')
+        if state is not None and state['top_count'] == self.top_count:
+            for distance, key, record in state['entries']:
+                running.push(distance, tuple(key), ApproachRecord.from_report(record))
+        return running
+
+    def save_running(self, running):
+        entries = [[distance, list(key), record.to_json()] for distance, key, record in running.entries()]
+        self.catalogue.set_state('nearest_misses', {'top_count': self.top_count, 'entries': entries})
+
+    # Store changed NEO's and fold their Earth approaches into the running results; replace is set
+    # for browse pages (whole NEO's), not for feed windows. where ({'page': ...} or {'date': ...})
+    # goes with the failure of a malformed NEO
+    def merge(self, running, neos, replace, where):
+        catalogue = self.catalogue
+        neos = list(checked_neos(neos, where, self.failures))
+        neo_rows = {}
+        approach_rows = []
+        for neo in neos:
+            neo_rows[neo["id"]] = catalogue.neo_row(neo, from_browse=replace)
+            for close_objects in neo["close_approach_data"]:
+                approach_rows.append(catalogue.approach_row(neo, close_objects))
+        if replace:
+            catalogue.replace_neos(list(neo_rows.values()), approach_rows)
+        else:
+            catalogue.add(list(neo_rows.values()), approach_rows)
+
+        # A kept NEO that changed may have moved away; only then ask the catalogue's distance index
+        if replace and any(key[0] in neo_rows for key in running.keys):
+            rebuilt = TopK(self.top_count)
+            for record in map(ApproachRecord.from_report, catalogue.nearest_misses(self.top_count)):
+                rebuilt.push(record.approach.astronomical, record.key, record)
+            return rebuilt
+
+        # Kept records share nothing with the page
+        records = RecordCache()
+        for neo in neos:
+            for close_objects in neo["close_approach_data"]:
+                if close_objects["orbiting_body"] != "Earth":
+                    continue
+                distance = float(close_objects["miss_distance"]["astronomical"])
+                if running.accepts(distance):
+                    running.push(distance, (neo["id"], close_objects["epoch_date_close_approach"]),
+                                 records.approach(neo, close_objects))
+        return running
+
+    def browse_request(self, page_api):
+        return self.browse_api, {'page': page_api, 'api_key': self.api_key}
+
+    # Walk the browse pages, ingesting only pages whose body hash changed; returns changed pages
+    def sync_browse(self):
+        page_hashes = self.catalogue.get_state('browse_page_hashes', {})
+        running = self.load_running()
+        changed_pages = []
+
+        def ingest(page_api, body):
+            nonlocal running
+            if body is None:
+                return None               # Hash is left as is, so the page is retried next sync
+            body = body_bytes(body)
+            digest = hashlib.sha1(body).hexdigest()
+            # Unchanged pages are not even decoded, except page 0 for the page count
+            if page_hashes.get(str(page_api)) == digest and page_api != 0:
+                return None
+            page = json_backend.loads(body)
+            if page_hashes.get(str(page_api)) != digest:
+                running = self.merge(running, page["near_earth_objects"], True, {'page': page_api})
+                page_hashes[str(page_api)] = digest
+                changed_pages.append(page_api)
+            return page["page"]
+
+        number_pages = ingest(0, self.get_body(*self.browse_request(0)))["total_pages"]
+        page_requests = (self.browse_request(page_api) for page_api in range(1, number_pages))
+        get_body = skip_failed(lambda api, params: body_bytes(self.get_body(api, params)), self.failures)
+        for page_api, body in enumerate(fetch_ordered(get_body, page_requests, self.workers), start=1):
+            ingest(page_api, body)
+
+        self.catalogue.set_state('browse_page_hashes', page_hashes)
+        self.save_running(running)
+        return changed_pages
+
+    # Fetch feed weeks after the last synced date up to end_date; returns the dates fetched
+    def sync_feed(self, start_date, end_date):
+        last_feed_date = self.catalogue.get_state('last_feed_date')
+        if last_feed_date is not None:
+            start_date = max(start_date, datetime.date.fromisoformat(last_feed_date) + datetime.timedelta(days=1))
+        if start_date > end_date:
+            return None
+
+        week_requests = []
+        for week_start, week_end in feed_windows(start_date, end_date, self.days_per_query):
+            week_requests.append((self.feed_api, {
+                'start_date': week_start.isoformat(),
+                'end_date': week_end.isoformat(),
+                'api_key': self.api_key
+            }))
+
+        # High-water mark stops before the first week that failed, so it is fetched next sync
+        running = self.load_running()
+        synced_date = None
+        get_json = skip_failed(lambda api, params: json_backend.loads(body_bytes(self.get_body(api, params))),
+                               self.failures)
+        for (_, params), load_json in zip(week_requests, fetch_ordered(get_json, week_requests, self.workers)):
+            if load_json is None:
+                break
+            for date_check, neos_on_date in load_json["near_earth_objects"].items():
+                running = self.merge(running, neos_on_date, False, {'date': date_check})
+            synced_date = params['end_date']
+
+        self.save_running(running)
+        if synced_date is None:
+            return None
+        self.catalogue.set_state('last_feed_date', synced_date)
+        return start_date, datetime.date.fromisoformat(synced_date)
+
+    def nearest_misses(self):
+        return [record.to_json() for record in self.load_running().items()]
+
+    def closest(self):
+        items = self.nearest_misses()
+        return items[0] if items else None
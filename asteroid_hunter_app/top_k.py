@@ -0,0 +1,75 @@
+'''
+Asteroid Hunter API Pipeline
+top_k.py
+Bounded top-K selector keyed on miss distance (smallest K kept).
+'''
+
+import heapq, itertools
+
+
+class TopK:
+    def __init__(self, k):
+        self.k = k
+        # Max-heap of the K best entries: (-distance, -sequence, key, item).
+        # Root is the worst kept entry; on equal distance the later arrival is worse,
+        # so ties are broken by first arrival.
+        self.heap = []
+        self.keys = set()                 # Keys kept, e.g. (NEO id, epoch) for de-duplication
+        self.sequence = itertools.count()
+        self.insert_count = 0
+        self.marked = None                # Last mark(), reused while nothing new got in
+
+    def __len__(self):
+        return len(self.heap)
+
+    # Largest distance still kept (inf until K entries are held)
+    def threshold(self):
+        if len(self.heap) < self.k:
+            return float('inf')
+        return -self.heap[0][0]
+
+    # Cheap pre-check so callers can skip building items that cannot get in
+    def accepts(self, distance):
+        return self.k > 0 and (len(self.heap) < self.k or distance < -self.heap[0][0])
+
+    def push(self, distance, key, item):
+        if key in self.keys or not self.accepts(distance):
+            return False
+        entry = (-distance, -next(self.sequence), key, item)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        else:
+            evicted = heapq.heapreplace(self.heap, entry)
+            self.keys.discard(evicted[2])
+        self.keys.add(key)
+        self.insert_count += 1
+        return True
+
+    # Kept entries as (distance, key, item), closest first
+    def entries(self):
+        ordered = sorted(self.heap, key=lambda entry: (-entry[0], -entry[1]))
+        return [(-entry[0], entry[2], entry[3]) for entry in ordered]
+
+    def items(self):
+        return [item for _, _, item in self.entries()]
+
+    def distances(self):
+        return [distance for distance, _, _ in self.entries()]
+
+    # Kept entries as they are now, to go back to with rewind()
+    def mark(self):
+        if self.marked is None or self.marked[2] != self.insert_count:
+            self.marked = (list(self.heap), set(self.keys), self.insert_count)
+        return self.marked
+
+    def rewind(self, mark):
+        heap, keys, self.insert_count = mark
+        self.heap = list(heap)
+        self.keys = set(keys)
+        self.marked = mark
+
+    # Offer every entry of another selector, closest first
+    def merge(self, other):
+        for distance, key, item in other.entries():
+            self.push(distance, key, item)
+        return self
@@ -0,0 +1,228 @@
+'''
+Asteroid Hunter API Pipeline
+bench_reports.py
+Benchmarks every report function against the offline NeoWs stand-in (replay.py):
+throughput (NEOs/s, approaches/s), request latency and peak RSS per report.
+Each report runs in a fresh process so its peak RSS is its own. Without --warm the
+timings include generating the synthetic pages; --warm renders them in an untimed
+first run, so only the pipeline is measured (the rendered pages count towards RSS).
+
+    python benchmarks/bench_reports.py --neos 10000 100000 --workers 4
+    python benchmarks/bench_reports.py --neos 100000 --warm --save bench.json
+    python benchmarks/bench_reports.py --neos 100000 --baseline bench.json
+'''
+
+import argparse, contextlib, json, multiprocessing, os, queue, sys, tempfile, threading, time
+
+# Run from a plain checkout: the package is imported from the repo root (also in the
+# spawned report processes, which import this script again)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+report_calls = {
+    'browse': lambda pipeline: pipeline.browse_reports(),
+    'closest': lambda pipeline: pipeline.asteroid_closest_approach(),
+    'misses': lambda pipeline: pipeline.nearest_misses(),
+    'month': lambda pipeline: pipeline.month_closest_approaches(),
+    'months': lambda pipeline: pipeline.month_range_closest_approaches(2021, 1, 2021, 12),
+    'sync': lambda pipeline: pipeline.sync_reports(),
+}
+feed_reports = ('month', 'months')
+
+
+# Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# Records the latency of every request made through the wrapped transport
+class TimedTransport:
+    def __init__(self, transport):
+        self.transport = transport
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        start = time.perf_counter()
+        response = self.transport.get(url, params=params, headers=headers, **kwargs)
+        with self.lock:
+            self.latencies.append(time.perf_counter() - start)
+        return response
+
+
+# One report in the current directory; returns its measurements
+def timed_report(report, neo_count, options):
+    from asteroid_hunter_app import main as pipeline
+    from asteroid_hunter_app.replay import ReplayTransport, SyntheticCatalogue, serve
+
+    source = SyntheticCatalogue(neo_count, seed=options.seed, memoize=options.warm)
+    if report in feed_reports:
+        source.dates()     # Feed date index is the stand-in server's cost, not the pipeline's
+
+    if options.http:
+        import requests
+        server, base_url = serve(source)
+        pipeline.browse_api = base_url + '/neo/browse?'
+        pipeline.feed_api = base_url + '/feed?'
+        timed_transport = TimedTransport(requests.Session())
+    else:
+        timed_transport = TimedTransport(ReplayTransport(source))
+    pipeline.http_transport = timed_transport
+    pipeline.requests_per_hour = 10 ** 9
+    pipeline.use_cache = False
+    pipeline.use_catalogue = options.catalogue or report == 'sync'
+    pipeline.fetch_workers = options.workers
+    pipeline.stream_pages = options.stream
+    pipeline.columnar_reports = options.columnar
+    if options.warm:
+        with open(os.devnull, 'w') as discard, contextlib.redirect_stdout(discard):
+            report_calls[report](pipeline)
+        pipeline.neo_catalogue = None
+        for path in os.listdir('.'):
+            os.remove(path)
+        source.neos_served = source.approaches_served = 0
+        timed_transport.latencies = []
+    setup_rss = peak_rss_mb()
+
+    # Report output goes to a file; the pipeline reports failures there instead of raising
+    with open('report_output.txt', 'w') as report_output, contextlib.redirect_stdout(report_output):
+        start = time.perf_counter()
+        report_calls[report](pipeline)
+        elapsed = time.perf_counter() - start
+    with open('report_output.txt') as report_output:
+        failed = any('error occured' in line for line in report_output)
+
+    if pipeline.neo_catalogue is not None:
+        pipeline.neo_catalogue.close()
+    latencies = timed_transport.latencies
+    return {
+        'report': report,
+        'neos': neo_count,
+        'failed': failed,
+        'seconds': elapsed,
+        'neos_per_second': source.neos_served / elapsed,
+        'approaches_per_second': source.approaches_served / elapsed,
+        'requests': len(latencies),
+        'latency_p50_ms': percentile(latencies, 0.50) * 1000,
+        'latency_p95_ms': percentile(latencies, 0.95) * 1000,
+        'latency_max_ms': max(latencies, default=0.0) * 1000,
+        'setup_rss_mb': setup_rss,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+# Child process entry, run in a work directory the parent removes afterwards
+def run_report(report, neo_count, options, results, work_path):
+    os.chdir(work_path)
+    results.put(timed_report(report, neo_count, options))
+
+# Row for a child that crashed, was killed (e.g. out of memory) or ran past --timeout
+def failed_result(report, neo_count, reason):
+    print(f'{report} ({neo_count} NEOs) failed: {reason}')
+    return {'report': report, 'neos': neo_count, 'failed': True, 'seconds': 0.0, 'neos_per_second': 0.0,
+            'approaches_per_second': 0.0, 'requests': 0, 'latency_p50_ms': 0.0, 'latency_p95_ms': 0.0,
+            'latency_max_ms': 0.0, 'setup_rss_mb': None, 'peak_rss_mb': None}
+
+
+# Fresh interpreter per report, so peak RSS and module state never leak between runs; its
+# report files are removed even when the child is killed
+def measure(report, neo_count, options):
+    with tempfile.TemporaryDirectory(prefix='asteroid_bench_') as work_path:
+        return measure_in(report, neo_count, options, work_path)
+
+def measure_in(report, neo_count, options, work_path):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_report, args=(report, neo_count, options, results, work_path))
+    process.start()
+
+    # Poll, so a child that died without a result is noticed at once rather than at the timeout
+    deadline = time.monotonic() + options.timeout
+    result = None
+    while result is None and time.monotonic() < deadline:
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            if not process.is_alive():
+                try:
+                    result = results.get(timeout=1)
+                except queue.Empty:
+                    break
+    process.join(timeout=10)
+    if process.is_alive():
+        process.kill()
+        process.join()
+        return failed_result(report, neo_count, f'no result after {options.timeout} s')
+    if result is None:
+        return failed_result(report, neo_count, f'exit code {process.exitcode}')
+    return result
+
+def print_result(result, baseline=None):
+    rss = '-' if result['peak_rss_mb'] is None else f"{result['peak_rss_mb']:.0f}"
+    line = (f"{result['report']:<8} {result['neos']:>8} {result['seconds']:>8.2f} "
+            f"{result['neos_per_second']:>10.0f} {result['approaches_per_second']:>12.0f} "
+            f"{result['requests']:>8} {result['latency_p50_ms']:>8.2f} {result['latency_p95_ms']:>8.2f} {rss:>8}")
+    if result['failed']:
+        line += '  FAILED'
+    if baseline is not None:
+        line += f"  x{result['neos_per_second'] / baseline['neos_per_second']:.2f}"
+    print(line)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the report functions against a synthetic NeoWs catalogue')
+    parser.add_argument('--neos', type=int, nargs='+', default=[10000], help='catalogue sizes (NEOs)')
+    parser.add_argument('--reports', nargs='+', choices=sorted(report_calls), default=sorted(report_calls))
+    parser.add_argument('--workers', type=int, default=1, help='fetch_workers')
+    parser.add_argument('--stream', action='store_true', help='stream_pages')
+    parser.add_argument('--columnar', action='store_true', help='columnar_reports')
+    parser.add_argument('--catalogue', action='store_true', help='use_catalogue (always on for sync)')
+    parser.add_argument('--http', action='store_true', help='go through a local HTTP server and requests')
+    parser.add_argument('--warm', action='store_true', help='render every page in an untimed first run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=3600, help='seconds to wait for one report')
+    parser.add_argument('--save', help='write results as JSON')
+    parser.add_argument('--baseline', help='compare against results saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='fail when NEOs/s drops by more than this fraction of the baseline')
+    return parser
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    baselines = {}
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            baselines = {(result['report'], result['neos']): result for result in json.load(baseline_file)}
+
+    print(f"{'report':<8} {'neos':>8} {'seconds':>8} {'neos/s':>10} {'approaches/s':>12} "
+          f"{'requests':>8} {'p50 ms':>8} {'p95 ms':>8} {'rss MB':>8}")
+    results = []
+    regressions = []
+    for neo_count in options.neos:
+        for report in options.reports:
+            result = measure(report, neo_count, options)
+            baseline = baselines.get((report, neo_count))
+            print_result(result, baseline)
+            results.append(result)
+            if result['failed'] or (baseline is not None and
+                                    result['neos_per_second'] < baseline['neos_per_second'] * (1 - options.tolerance)):
+                regressions.append((report, neo_count))
+
+    if options.save:
+        with open(options.save, 'w') as save_file:
+            json.dump(results, save_file, indent=2)
+    if regressions:
+        print(f'Regressions: {regressions}')
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
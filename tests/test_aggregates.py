@@ -0,0 +1,84 @@
+import datetime, random, pytest
+from asteroid_hunter_app.aggregates import PeriodTops, period_bounds, period_parts
+from asteroid_hunter_app.catalogue import CatalogueIngest, NeoCatalogue
+from asteroid_hunter_app.replay import SyntheticCatalogue
+
+
+synthetic = SyntheticCatalogue(400, start_date=datetime.date(2019, 11, 1), end_date=datetime.date(2022, 2, 1))
+
+def keys(records):
+    return [(neo["id"], neo["close_approach_data"]["epoch_date_close_approach"]) for neo in records]
+
+def expected(neos, start_date, end_date, top_count):
+    approaches = sorted((float(close_objects["miss_distance"]["astronomical"]), neo["id"],
+                         close_objects["epoch_date_close_approach"])
+                        for neo in neos for close_objects in neo["close_approach_data"]
+                        if close_objects["orbiting_body"] == "Earth"
+                        and start_date.isoformat() <= close_objects["close_approach_date"] <= end_date.isoformat())
+    return [(neo_id, epoch) for _, neo_id, epoch in approaches[:top_count]]
+
+def ingest(catalogue, neos):
+    catalogue_ingest = CatalogueIngest(catalogue)
+    for neo in neos:
+        for close_objects in neo["close_approach_data"]:
+            catalogue_ingest.consume(neo, close_objects, 0)
+    catalogue_ingest.page_done(0)
+
+
+def test_period_parts():
+    assert period_parts(datetime.date(2020, 12, 30), datetime.date(2022, 2, 2)) == [
+        ('day', '2020-12-30'), ('day', '2020-12-31'), ('year', '2021'), ('month', '2022-01'),
+        ('day', '2022-02-01'), ('day', '2022-02-02')]
+    assert period_bounds('2021-Q1') == (datetime.date(2021, 1, 1), datetime.date(2021, 3, 31))
+    assert period_bounds('2100-02') == (datetime.date(2100, 2, 1), datetime.date(2100, 2, 28))
+    assert period_bounds('2021') == (datetime.date(2021, 1, 1), datetime.date(2021, 12, 31))
+
+def test_period_tops_match_brute_force(tmp_path):
+    neos = list(synthetic.neos())
+    streamed = PeriodTops(10)
+    for neo in neos:
+        for close_objects in neo["close_approach_data"]:
+            streamed.consume(neo, close_objects, 0)
+    catalogue = NeoCatalogue(str(tmp_path / 'catalogue.sqlite'))
+    ingest(catalogue, neos)
+    built = PeriodTops.from_catalogue(catalogue, 10)
+
+    rng = random.Random(7)
+    ranges = [period_bounds('2021'), period_bounds('2020-Q3'), period_bounds('2021-02')]
+    for _ in range(20):
+        start_date = datetime.date(2019, 11, 1) + datetime.timedelta(days=rng.randrange(800))
+        ranges.append((start_date, start_date + datetime.timedelta(days=rng.randrange(400))))
+    for start_date, end_date in ranges:
+        assert keys(streamed.top(start_date, end_date)) == expected(neos, start_date, end_date, 10)
+        assert keys(built.top(start_date, end_date, 5)) == expected(neos, start_date, end_date, 5)
+    assert keys(built.month(2021, 1)) == keys(catalogue.month_closest(2021, 1, 10))
+    assert list(built.yearly(2019, 2023)) == ['2019', '2020', '2021', '2022', '2023']
+    with pytest.raises(ValueError):
+        built.year(2021, 11)
+
+    # Shards / checkpoints: state and merge give back the same aggregates
+    restored = PeriodTops(10)
+    restored.restore(streamed.state())
+    assert keys(restored.year(2021)) == keys(streamed.year(2021))
+    first, second = PeriodTops(10), PeriodTops(10)
+    for index, neo in enumerate(neos):
+        for close_objects in neo["close_approach_data"]:
+            (first if index % 2 else second).consume(neo, close_objects, 0)
+    assert keys(first.merge(second).quarter(2020, 4)) == keys(streamed.quarter(2020, 4))
+
+def test_refresh_recomputes_changed_days(tmp_path):
+    neos = list(synthetic.neos())
+    catalogue = NeoCatalogue(str(tmp_path / 'catalogue.sqlite'))
+    ingest(catalogue, neos[:300])
+    period_tops = PeriodTops.from_catalogue(catalogue, 10)
+    assert period_tops.refresh(catalogue) is False
+
+    # New NEO's, and an existing NEO whose approaches were all dropped upstream
+    ingest(catalogue, neos[300:])
+    dropped = dict(neos[0], close_approach_data=[])
+    catalogue.replace_neos([catalogue.neo_row(dropped)], [])
+    assert period_tops.refresh(catalogue) is True
+
+    remaining = neos[1:]
+    for start_date, end_date in [period_bounds('2020'), period_bounds('2021-Q2'), period_bounds('2019-11-05')]:
+        assert keys(period_tops.top(start_date, end_date)) == expected(remaining, start_date, end_date, 10)
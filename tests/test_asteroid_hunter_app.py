@@ -1,55 +1,183 @@
-import json, math, requests
-from asteroid_hunter_app.month_information import monthInfo
-from asteroid_hunter_app import __version__, main, apikey
+import datetime, json, pytest
+from asteroid_hunter_app.month_information import MonthInfo, WindowPlan, feed_windows, month_range_plan, year_bucket
+from asteroid_hunter_app.replay import ReplayTransport, SyntheticCatalogue
+import asteroid_hunter_app
+from asteroid_hunter_app import __version__, main
+
+
+# Every report runs offline against a synthetic NeoWs catalogue (replay.py)
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    synthetic = SyntheticCatalogue(200, start_date=datetime.date(2020, 6, 1), end_date=datetime.date(2021, 6, 1))
+    monkeypatch.setattr(main, 'http_transport', ReplayTransport(synthetic))
+    monkeypatch.setattr(main, 'use_cache', False)
+    monkeypatch.setattr(main, 'use_catalogue', False)
+    monkeypatch.setattr(main, 'fetch_workers', 2)
+    monkeypatch.setattr(main, 'api_fetchers', None)
+    monkeypatch.setattr(main, 'neo_catalogue', None)
+    return synthetic
+
+# (distance, NEO id) of every Earth approach, closest first
+def earth_approaches(synthetic, start_date='0000', end_date='9999'):
+    return sorted((float(close_objects["miss_distance"]["astronomical"]), neo["id"])
+                  for neo in synthetic.neos() for close_objects in neo["close_approach_data"]
+                  if close_objects["orbiting_body"] == "Earth"
+                  and start_date <= close_objects["close_approach_date"] <= end_date)
 
 
 def test_version():
     assert __version__ == '0.1.0'
 
-def test_near_misses():
-    # Test JSON type output of functions
-    assert type(main.nearest_misses()) == json
-    assert type(main.asteroid_closest_approach()) == json
-    assert type(main.month_closest_approaches()) == json
+# Every report function of main (named *_reports, *_approach(es) or *_between) is re-exported
+def test_package_exports_every_report():
+    reports = [name for name in vars(main) if name.endswith(('_reports', '_approaches', '_approach', '_between'))
+               and callable(getattr(main, name))]
+    for name in reports + ['nearest_misses']:
+        assert getattr(asteroid_hunter_app, name) is getattr(main, name)
 
-    # Test HTTP Request statuses of API's
-    params = {
-        'api_key':apikey.userApiKey
-    }
-    assert (requests.get(main.browseApi, params=params)).status_code ==  200
-    assert (requests.get(main.feedApi, params=params)).status_code == 200
-
-    responseStr = json.dumps(requests.get(main.browseApi, params=params).json())
-    loadJson = json.loads(responseStr)
-    numberPages = loadJson["page"]["size"]  
-    assert (numberPages) == 20
+def test_near_misses(source):
+    main.browse_reports()
+    expected = earth_approaches(source)
 
     # Test Output JSON file for asteroid_closest_approach()
-    fileOpen1 = open('closest_neo.json') 
-    loadJsonOutput1 = json.load(fileOpen1)
-    assert(loadJsonOutput1["id"]) == "2099942"
+    with open('closest_neo.json') as file_open:
+        load_json_output = json.load(file_open)
+    assert load_json_output["id"] == expected[0][1]
+    assert float(load_json_output["close_approach_data"]["miss_distance"]["astronomical"]) == expected[0][0]
 
     # Test Output JSON file for nearest_misses()
-    fileOpen2 = open('ten_closest_neo.json')
-    loadJsonOutput2 = json.load(fileOpen2)
-    assert(loadJsonOutput2[0]["id"]) == "2099942"
+    with open('ten_closest_neo.json') as file_open:
+        load_json_output = json.load(file_open)
+    assert [neo["id"] for neo in load_json_output] == [neo_id for _, neo_id in expected[:main.top_count]]
+
+    # Every browse page was requested once
+    assert source.neos_served == 200
+
+def test_malformed_neos_are_skipped_and_new_keys_kept(source, monkeypatch, capsys):
+    # The closest NEO gains unit keys the records do not know; the next one loses a required field
+    expected = earth_approaches(source)
+    extended_id = expected[0][1]
+    broken_id = next(neo_id for _, neo_id in expected if neo_id != extended_id)
+    synthetic_neo = source.neo
+    def changed_neo(index):
+        neo = synthetic_neo(index)
+        if neo["id"] == extended_id:
+            neo["estimated_diameter"]["parsecs"] = {"estimated_diameter_min": 1e-16, "estimated_diameter_max": 2e-16}
+            for close_objects in neo["close_approach_data"]:
+                close_objects["miss_distance"]["parsecs"] = '0.0000000001'
+        if neo["id"] == broken_id:
+            del neo["estimated_diameter"]
+        return neo
+    monkeypatch.setattr(source, 'neo', changed_neo)
+
+    main.browse_reports()
+    with open('closest_neo.json') as file_open:
+        closest = json.load(file_open)
+    assert closest["id"] == extended_id
+    assert list(closest["close_approach_data"]["miss_distance"])[-1] == 'parsecs'
+    assert "parsecs" in closest["estimated_diameter"]
+    with open('ten_closest_neo.json') as file_open:
+        ten_closest = json.load(file_open)
+    assert [neo["id"] for neo in ten_closest] == \
+        [neo_id for _, neo_id in expected if neo_id != broken_id][:main.top_count]
+    output = capsys.readouterr().out
+    assert f"'neo': '{broken_id}'" in output
+    assert f'NEO {broken_id}: missing estimated_diameter' in output
+
+def test_month_closest_approaches(source):
+    main.month_closest_approaches()
+    with open('closest_neo_per_month.json') as file_open:
+        load_json_output = json.load(file_open)
+    expected = earth_approaches(source, '2021-01-01', '2021-01-31')
+    assert [neo["id"] for neo in load_json_output] == [neo_id for _, neo_id in expected[:main.top_month_count]]
+
+def test_month_range_closest_approaches(source, capsys):
+    # Windows span the year boundary and month ends; every month must equal its own brute-force pass
+    month_reports = main.month_range_closest_approaches(2020, 11, 2021, 2)
+    with open('closest_neo_per_month_range.json') as file_open:
+        load_json_output = json.load(file_open)
+    assert list(load_json_output) == ['2020-11', '2020-12', '2021-01', '2021-02']
+    assert load_json_output == month_reports
+    for month_key, (start_date, end_date) in [('2020-11', ('2020-11-01', '2020-11-30')),
+                                              ('2020-12', ('2020-12-01', '2020-12-31')),
+                                              ('2021-01', ('2021-01-01', '2021-01-31')),
+                                              ('2021-02', ('2021-02-01', '2021-02-28'))]:
+        expected = earth_approaches(source, start_date, end_date)
+        assert [neo["id"] for neo in load_json_output[month_key]] == \
+            [neo_id for _, neo_id in expected[:main.top_month_count]]
+        assert all(start_date <= neo["close_approach_data"]["close_approach_date"] <= end_date
+                   for neo in load_json_output[month_key])
+
+    # A reversed range is reported, not fetched
+    served = source.neos_served
+    assert main.month_range_closest_approaches(2021, 2, 2020, 11) is None
+    assert 'Month range ends before it starts' in capsys.readouterr().out
+    assert source.neos_served == served
 
+def test_period_reports_longer_than_the_aggregates(source, monkeypatch):
+    monkeypatch.setattr(main, 'use_catalogue', True)
+    monkeypatch.setattr(main, 'period_aggregates', None)
+    main.browse_reports()
+
+    # The aggregates keep max(top_count, top_month_count) per period; 25 come from the catalogue
+    for top_qty in (5, 25):
+        expected = earth_approaches(source, '2020-07-01', '2021-03-31')
+        assert [neo["id"] for neo in main.period_closest_approaches('2020-Q3', '2021-Q1', top_qty)] == \
+            [neo_id for _, neo_id in expected[:top_qty]]
+        expected = earth_approaches(source, '2021-01-01', '2021-12-31')
+        assert [neo["id"] for neo in main.yearly_closest_approaches(2020, 2021, top_qty)['2021']] == \
+            [neo_id for _, neo_id in expected[:top_qty]]
+
+def test_month_info():
     # Test Month Information Class parameters and methods
-    monthTest1 = monthInfo(2021, 1)
-    assert (monthTest1.startDate) == 1
-    assert (monthTest1.endDate) == 31
-    assert (monthTest1.daysInMonth()) == 31
-    numberWeeksMonth1 = math.floor(int(monthTest1.endDay) / main.daysPerQuery)
-    assert (numberWeeksMonth1) == 5
-
-    monthTest2 = monthInfo(2021, 2)
-    assert (monthTest2.endDate) == 28
-    assert (monthTest2.daysInMonth()) == 28
-    numberWeeksMonth2 = math.floor(int(monthTest2.endDay) / main.daysPerQuery)
-    assert (numberWeeksMonth2) == 4
-
-    monthTest3 = monthInfo(2020, 2)
-    assert (monthTest3.endDate) == 29
-    assert (monthTest3.daysInMonth()) == 29
-    numberWeeksMonth3 = math.floor(int(monthTest3.endDay) / main.daysPerQuery)
-    assert (numberWeeksMonth3) == 5
\ No newline at end of file
+    month_test = MonthInfo(2021, 1)
+    assert month_test.start_date == '2021-01-01'
+    assert month_test.end_date == '2021-01-31'
+    assert month_test.days_in_month(2021, 1) == 31
+    assert len(feed_windows(datetime.date(2021, 1, 1), datetime.date(2021, 1, 31), main.days_per_query)) == 5
+
+    month_test = MonthInfo(2021, 2)
+    assert month_test.end_date == '2021-02-28'
+    assert len(feed_windows(datetime.date(2021, 2, 1), datetime.date(2021, 2, 28), main.days_per_query)) == 4
+
+    month_test = MonthInfo(2020, 2)
+    assert month_test.end_date == '2020-02-29'
+    assert len(feed_windows(datetime.date(2020, 2, 1), datetime.date(2020, 2, 29), main.days_per_query)) == 5
+
+    # Gregorian century rule
+    assert MonthInfo(1900, 2).end_date == '1900-02-28'
+    assert MonthInfo(2000, 2).end_date == '2000-02-29'
+    assert MonthInfo(2100, 2).end_date == '2100-02-28'
+    assert month_test.days_in_month(2021, 13) == 0
+
+def test_window_plan():
+    # Fewest windows for the range, across month and year boundaries, memoised per range
+    plan = month_range_plan(2099, 12, 2100, 3)
+    days = (datetime.date(2100, 3, 31) - datetime.date(2099, 12, 1)).days + 1
+    assert len(plan.windows) == -(-days // 7)
+    assert plan is month_range_plan(2099, 12, 2100, 3)
+    assert plan.buckets == ('2099-12', '2100-01', '2100-02', '2100-03')
+    assert [day for window in plan.windows for day in window][-1] == datetime.date(2100, 3, 31)
+
+    # Each month completes in the window holding its last day, exactly once
+    completed = [month_key for idx in range(len(plan.windows)) for month_key in plan.completed(idx)]
+    assert completed == list(plan.buckets)
+    window = next(idx for idx, (start, end) in enumerate(plan.windows) if start.month != end.month)
+    assert len(plan.window_buckets(window)) == 2
+
+    # One response routed to every bucket it covers
+    response = {"near_earth_objects": {"2099-12-31": ["a"], "2100-01-01": ["b"], "2100-04-01": ["c"]}}
+    assert list(plan.route(response)) == [('2099-12', '2099-12-31', ["a"]), ('2100-01', '2100-01-01', ["b"])]
+    years = WindowPlan(datetime.date(2099, 12, 30), datetime.date(2100, 1, 2), bucket=year_bucket)
+    assert years.buckets == ('2099', '2100') and years.completed(0) == ('2099', '2100')
+
+def test_quiet_run_records_metrics(source, monkeypatch, capsys):
+    monkeypatch.setattr(main, 'quiet', True)
+    monkeypatch.setattr(main, 'echo_reports', False)
+    main.metrics.reset()
+    main.browse_reports()
+    assert 'Current page' not in capsys.readouterr().out
+    assert main.metrics.total('pages', endpoint='browse') == 10
+    assert main.metrics.total('approaches') == sum(len(neo["close_approach_data"]) for neo in source.neos())
+    assert main.metrics.total('topk_inserts') >= main.top_count
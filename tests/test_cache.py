@@ -0,0 +1,55 @@
+import json, random
+from asteroid_hunter_app.cache import ResponseCache, cached
+
+feed_api = 'https://api.nasa.gov/neo/rest/v1/feed?'
+browse_api = 'https://api.nasa.gov/neo/rest/v1/neo/browse?'
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None, etag=None):
+        self.status_code = status_code
+        self.content = json.dumps(payload).encode() if payload is not None else b''
+        self.headers = {'ETag': etag} if etag else {}
+
+def test_historical_feed_week_is_served_without_network(tmp_path):
+    calls = []
+    def get_response(api, params, headers):
+        calls.append(params)
+        return FakeResponse(200, {'element_count': 3})
+
+    get_json = cached(get_response, ResponseCache(str(tmp_path / 'cache.sqlite')))
+    params = {'start_date': '2021-01-01', 'end_date': '2021-01-07', 'api_key': 'DEMO_KEY'}
+    assert get_json(feed_api, params) == {'element_count': 3}
+    # A different api_key maps to the same entry
+    assert get_json(feed_api, dict(params, api_key='other')) == {'element_count': 3}
+    assert len(calls) == 1
+
+def test_stale_browse_page_is_revalidated(tmp_path):
+    now = [1_000_000.0]
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), browse_ttl=60, clock=lambda: now[0])
+    sent_headers = []
+    def get_response(api, params, headers):
+        sent_headers.append(headers)
+        if headers.get('If-None-Match') == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, {'page': {'number': 0}}, etag='"v1"')
+
+    get_json = cached(get_response, cache)
+    params = {'page': 0, 'api_key': 'DEMO_KEY'}
+    get_json(browse_api, params)
+    get_json(browse_api, params)
+    assert len(sent_headers) == 1
+    now[0] += 120
+    assert get_json(browse_api, params) == {'page': {'number': 0}}
+    assert sent_headers[-1] == {'If-None-Match': '"v1"'}
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    now = [0.0]
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), max_bytes=2000, clock=lambda: now[0])
+    rng = random.Random(1)
+    body = bytes(rng.getrandbits(8) for _ in range(800))   # Incompressible, so two entries exceed the cap
+    for page in range(4):
+        now[0] += 1
+        cache.store(browse_api, {'page': page}, body)
+    assert cache.lookup(browse_api, {'page': 0}) is None
+    assert cache.lookup(browse_api, {'page': 3})['body'] == body
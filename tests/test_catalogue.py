@@ -0,0 +1,61 @@
+from asteroid_hunter_app.catalogue import CatalogueIngest, NeoCatalogue
+
+
+def approach(date, distance, body="Earth"):
+    return {
+        "close_approach_date": date,
+        "epoch_date_close_approach": int(date.replace('-', '')),
+        "relative_velocity": {"kilometers_per_second": "10.0"},
+        "miss_distance": {"astronomical": distance, "lunar": "1.0", "kilometers": "1.0"},
+        "orbiting_body": body,
+    }
+
+def test_catalogue_range_queries(tmp_path):
+    neos = [
+        {"id": "2000433", "is_potentially_hazardous_asteroid": False,
+         "close_approach_data": [approach("2021-01-05", "0.30"), approach("2021-02-01", "0.01")]},
+        {"id": "2099942", "is_potentially_hazardous_asteroid": True,
+         "close_approach_data": [approach("2021-01-20", "0.10"), approach("2021-01-21", "0.001", "Mars")]},
+    ]
+    catalogue = NeoCatalogue(str(tmp_path / 'catalogue.sqlite'))
+    ingest = CatalogueIngest(catalogue)
+    for page_api in range(2):
+        # Crawling the same pages twice must not duplicate approaches
+        for neo in neos:
+            for close_objects in neo["close_approach_data"]:
+                ingest.consume(neo, close_objects, page_api)
+        ingest.page_done(page_api)
+
+    assert catalogue.count() == 4
+    assert catalogue.closest()["close_approach_data"]["close_approach_date"] == "2021-02-01"
+    january = catalogue.month_closest(2021, 1, 10)
+    assert [neo["id"] for neo in january] == ["2099942", "2000433"]
+    assert january[0]["close_approach_data"] == neos[1]["close_approach_data"][0]
+    assert catalogue.closest_between("2021-01-21", "2021-01-31", 10) == []
+    assert catalogue.closest_between("2021-01-21", "2021-01-31", 10, body="Mars")[0]["id"] == "2099942"
+
+def test_feed_rows_keep_browse_fields(tmp_path):
+    browse_neo = {"id": "2099942", "name_limited": "Apophis", "designation": "99942",
+                  "is_potentially_hazardous_asteroid": True, "close_approach_data": [approach("2029-04-13", "0.0003")],
+                  "orbital_data": {"orbit_id": "206"}}
+    feed_neo = {"id": "2099942", "is_potentially_hazardous_asteroid": True,
+                "close_approach_data": [approach("2021-03-06", "0.11")]}
+    catalogue = NeoCatalogue(str(tmp_path / 'catalogue.sqlite'))
+    feed_first = {"id": "2000433", "is_potentially_hazardous_asteroid": False,
+                  "close_approach_data": [approach("2021-03-07", "0.2")]}
+
+    for neo, from_browse in ((browse_neo, True), (feed_neo, False), (feed_first, False),
+                             (dict(feed_first, orbital_data={"orbit_id": "659"}), True)):
+        ingest = CatalogueIngest(catalogue, from_browse)
+        for close_objects in neo["close_approach_data"]:
+            ingest.consume(neo, close_objects, 0)
+        ingest.page_done(0)
+
+    # The feed window's thinner object neither replaces nor trims the browse object ...
+    for record in catalogue.nearest_misses(10):
+        if record["id"] == "2099942":
+            assert record["orbital_data"] == {"orbit_id": "206"}
+            assert record["name_limited"] == "Apophis"
+    assert catalogue.count() == 3
+    # ... while a browse crawl replaces a NEO first stored from the feed
+    assert catalogue.closest_between("2021-03-07", "2021-03-07", 1)[0]["orbital_data"] == {"orbit_id": "659"}
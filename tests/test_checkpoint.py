@@ -0,0 +1,120 @@
+import pytest
+from asteroid_hunter_app.checkpoint import CrawlCheckpoint
+from asteroid_hunter_app.columnar import ColumnarIngest
+from asteroid_hunter_app.crawl import BrowseCrawl, ClosestApproach, NearestMisses
+from asteroid_hunter_app.replay import SyntheticCatalogue
+
+
+def crawl_reports(get_json, checkpoint=None, resume=False):
+    crawl = BrowseCrawl(get_json, 'browse', 'DEMO_KEY', checkpoint=checkpoint, resume=resume)
+    closest = crawl.register(ClosestApproach())
+    misses = crawl.register(NearestMisses(5))
+    table = crawl.register(ColumnarIngest()).table
+    crawl.run()
+    return closest.result(), misses.result(), table.nearest_misses(5)
+
+
+def test_interrupted_crawl_resumes_from_last_page(tmp_path):
+    source = SyntheticCatalogue(120)
+    requested = []
+    interrupted = []
+    def get_json(api, params):
+        requested.append(params['page'])
+        if params['page'] == 4 and not interrupted:
+            interrupted.append(True)
+            raise KeyboardInterrupt
+        return source.browse(params['page'])
+
+    checkpoint = CrawlCheckpoint(str(tmp_path / 'checkpoint.json'), every=2)
+    with pytest.raises(KeyboardInterrupt):
+        crawl_reports(get_json, checkpoint)
+    assert checkpoint.load()['next_page'] == 4
+
+    # Only the pages after the last completed one are fetched again
+    requested.clear()
+    resumed = crawl_reports(get_json, checkpoint, resume=True)
+    assert requested == [4, 5]
+    assert checkpoint.load() is None
+    assert resumed == crawl_reports(lambda api, params: source.browse(params['page']))
+
+
+def test_checkpoint_of_another_crawl_is_ignored(tmp_path):
+    source = SyntheticCatalogue(40)
+    checkpoint = CrawlCheckpoint(str(tmp_path / 'checkpoint.json'))
+    checkpoint.save({'browse_api': 'elsewhere', 'consumers': [], 'next_page': 1, 'total_pages': 2,
+                     'failed_pages': [], 'states': []})
+    requested = []
+    def get_json(api, params):
+        requested.append(params['page'])
+        return source.browse(params['page'])
+    crawl_reports(get_json, checkpoint, resume=True)
+    assert requested == [0, 1]
+
+def test_page_cut_off_mid_way_is_not_kept(tmp_path):
+    source = SyntheticCatalogue(120)
+    class InterruptOnPage:
+        def __init__(self, page_api):
+            self.page_api = page_api
+            self.seen = 0
+        def consume(self, neo, close_objects, page_api):
+            if page_api == self.page_api:
+                self.seen += 1
+                if self.seen == 3:
+                    raise KeyboardInterrupt
+        def page_done(self, page_api):
+            pass
+        def state(self):
+            return {}
+        def restore(self, state):
+            pass
+        def result(self):
+            return None
+
+    checkpoint = CrawlCheckpoint(str(tmp_path / 'checkpoint.json'), every=2)
+    crawl = BrowseCrawl(lambda api, params: source.browse(params['page']), 'browse', 'DEMO_KEY', checkpoint=checkpoint)
+    crawl.register(ColumnarIngest())
+    crawl.register(InterruptOnPage(3))
+    with pytest.raises(KeyboardInterrupt):
+        crawl.run()
+    assert checkpoint.load()['next_page'] == 3
+
+    # Resuming repeats page 3 whole; its first rows, appended before the interrupt, are not kept twice
+    resumed = BrowseCrawl(lambda api, params: source.browse(params['page']), 'browse', 'DEMO_KEY',
+                          checkpoint=checkpoint, resume=True)
+    table = resumed.register(ColumnarIngest()).table
+    resumed.register(InterruptOnPage(None))
+    resumed.run()
+    clean = BrowseCrawl(lambda api, params: source.browse(params['page']), 'browse', 'DEMO_KEY')
+    clean_table = clean.register(ColumnarIngest()).table
+    clean.run()
+    assert list(table.epoch) == list(clean_table.epoch)
+    assert [table.record(row) for row in range(len(table))] == \
+        [clean_table.record(row) for row in range(len(clean_table))]
+
+def test_checkpoints_append_only_new_rows(tmp_path, monkeypatch):
+    source = SyntheticCatalogue(120)
+    checkpoint = CrawlCheckpoint(str(tmp_path / 'checkpoint.json'), every=1)
+    appended = []
+    append_lines = checkpoint.append_lines
+    def count_lines(name, lines):
+        appended.append(len(lines))
+        append_lines(name, lines)
+    monkeypatch.setattr(checkpoint, 'append_lines', count_lines)
+    monkeypatch.setattr(checkpoint, 'clear', lambda: None)   # Keep the last checkpoint to read back
+
+    crawl = BrowseCrawl(lambda api, params: source.browse(params['page']), 'browse', 'DEMO_KEY', checkpoint=checkpoint)
+    table = crawl.register(ColumnarIngest()).table
+    crawl.run()
+    pages = [sum(len(neo["close_approach_data"]) for neo in source.browse(page_api)["near_earth_objects"])
+             for page_api in range(6)]
+    # Page 0 is dispatched before the loop, so the first checkpoint (after page 1) carries both
+    assert appended == [pages[0] + pages[1], *pages[2:]]
+    assert sum(appended) == len(table)
+
+    # A log line appended after the last checkpoint (a save that never finished) is dropped on restore
+    checkpoint.append_lines('0', [[0, None, {}]])
+    state = checkpoint.load()
+    restored = ColumnarIngest()
+    restored.checkpoint_restore(checkpoint, '0', state['states'][0])
+    assert [restored.table.record(row) for row in range(len(table))] == [table.record(row) for row in range(len(table))]
+    assert len(checkpoint.read_lines('0', len(table))) == len(table)
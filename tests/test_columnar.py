@@ -0,0 +1,79 @@
+import random
+from asteroid_hunter_app import columnar
+from asteroid_hunter_app.replay import SyntheticCatalogue
+from asteroid_hunter_app.top_k import TopK
+
+
+def make_neos(count, seed=5):
+    rng = random.Random(seed)
+    synthetic = SyntheticCatalogue(count)
+    neos = []
+    for idx in range(count):
+        close_approach_data = []
+        for _ in range(rng.randint(1, 4)):
+            day = rng.randint(1, 28)
+            close_approach_data.append({
+                "close_approach_date": f"2021-{rng.randint(1, 3):02d}-{day:02d}",
+                "close_approach_date_full": f"2021-Jan-{day:02d} 00:00",
+                "epoch_date_close_approach": rng.randint(0, 10 ** 12),
+                "relative_velocity": {"kilometers_per_second": str(rng.random() * 30),
+                                      "kilometers_per_hour": "1.0", "miles_per_hour": "1.0"},
+                # Few distinct distances, so ties are common
+                "miss_distance": {"astronomical": str(rng.randint(1, 40) / 1000),
+                                  "lunar": "1.0", "kilometers": "1.0", "miles": "1.0"},
+                "orbiting_body": rng.choice(["Earth", "Earth", "Mars", "Juptr"]),
+            })
+        neos.append(dict(synthetic.neo(idx), is_potentially_hazardous_asteroid=idx % 3 == 0,
+                         close_approach_data=close_approach_data))
+    return neos
+
+def expected_nearest(neos, top_count, month=None):
+    top = TopK(top_count)
+    for neo in neos:
+        for close_objects in neo["close_approach_data"]:
+            if close_objects["orbiting_body"] != "Earth":
+                continue
+            if month is not None and int(close_objects["close_approach_date"][5:7]) != month:
+                continue
+            closest_neo = dict(neo)
+            closest_neo["close_approach_data"] = close_objects
+            top.push(float(close_objects["miss_distance"]["astronomical"]),
+                     (neo["id"], close_objects["epoch_date_close_approach"]), closest_neo)
+    return top.items()
+
+def check_table_matches_top_k():
+    neos = make_neos(300)
+    ingest = columnar.ColumnarIngest()
+    for neo in neos:
+        for close_objects in neo["close_approach_data"]:
+            ingest.consume(neo, close_objects, 0)
+    table = ingest.result()
+    for top_count in (1, 10, 100, 2000):
+        assert table.nearest_misses(top_count) == expected_nearest(neos, top_count)
+    assert table.closest() == expected_nearest(neos, 1)[0]
+    assert table.month_closest(2021, 2, 10) == expected_nearest(neos, 10, month=2)
+    assert table.nearest_misses(5, body='Pluto') == []
+
+def test_columnar_queries_match_top_k():
+    check_table_matches_top_k()
+
+def test_columnar_queries_without_numpy(monkeypatch):
+    monkeypatch.setattr(columnar, '_numpy', lambda: None)
+    check_table_matches_top_k()
+
+def test_rows_rebuild_their_approach_json():
+    neos = make_neos(50)
+    neos[0]["close_approach_data"][0]["approach_note"] = 'new upstream field'
+    neos[1]["close_approach_data"][0]["miss_distance"]["lunar"] = 1.5    # A number not given as text
+    approaches = [(neo, close_objects) for neo in neos for close_objects in neo["close_approach_data"]]
+    table = columnar.ApproachTable()
+    for neo, close_objects in approaches:
+        table.append(neo, close_objects)
+    # Only the two odd approaches are kept as JSON text; the rest come back from the columns
+    assert len(table.approach_json) == 2
+    assert [table.approach(row) for row in range(len(table))] == [close_objects for _, close_objects in approaches]
+
+    table.truncate(3, len({neo["id"] for neo, _ in approaches[:3]}))
+    assert [table.approach(row) for row in range(len(table))] == [close_objects for _, close_objects in approaches[:3]]
+    assert len(table.approach_text) == 3
+    assert set(table.neos) == {int(neo["id"]) for neo, _ in approaches[:3]}
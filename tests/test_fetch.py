@@ -0,0 +1,77 @@
+import random, time, pytest
+from asteroid_hunter_app.crawl import BrowseCrawl, ClosestApproach
+from asteroid_hunter_app.fetch import RateLimiter, fetch_ordered, retrying, skip_failed
+from asteroid_hunter_app.replay import ReplayHTTPError, ReplayResponse, SyntheticCatalogue
+
+
+def test_fetch_ordered_matches_sequential():
+    # Responses finish out of order, but must be yielded in request order
+    def slow_get_json(api, params):
+        time.sleep(random.random() / 100)
+        return (api, params['page'])
+
+    requests_list = [('browse', {'page': page}) for page in range(25)]
+    sequential = list(fetch_ordered(slow_get_json, requests_list, workers=1))
+    concurrent = list(fetch_ordered(slow_get_json, requests_list, workers=8))
+    assert concurrent == sequential
+    assert [page for _, page in concurrent] == list(range(25))
+
+def test_rate_limiter_waits_for_window():
+    now = [0.0]
+    sleeps = []
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    limiter = RateLimiter(2, period=10.0, clock=lambda: now[0], sleep=fake_sleep)
+    limiter.acquire()
+    limiter.acquire()
+    assert sleeps == []
+    limiter.acquire()
+    assert sleeps == [10.0]
+
+    # Server reports fewer calls left than the local window allows
+    limiter.observe(1)
+    limiter.acquire()
+    assert sleeps == [10.0]
+    limiter.acquire()
+    assert len(sleeps) == 2
+
+def test_retrying_backs_off_and_honours_retry_after():
+    responses = [ReplayResponse(503), ReplayResponse(429, headers={'Retry-After': '7'}), ReplayResponse(200, b'{}')]
+    sleeps = []
+    fetch = retrying(lambda api, params: responses.pop(0), retries=4, backoff=1.0,
+                     sleep=sleeps.append, random=lambda: 0.5)
+    assert fetch('feed', {}).status_code == 200
+    assert sleeps == [0.5, 7.0]
+
+    # Connection errors are retried, then raised; failing statuses end in raise_for_status()
+    attempts = []
+    def refused(api, params):
+        attempts.append(api)
+        raise ConnectionError('refused')
+    with pytest.raises(ConnectionError):
+        retrying(refused, retries=2, errors=(ConnectionError,), sleep=lambda seconds: None)('feed', {})
+    assert len(attempts) == 3
+    with pytest.raises(ReplayHTTPError):
+        retrying(lambda api, params: ReplayResponse(503), retries=1, sleep=lambda seconds: None)('feed', {})
+
+def test_bad_page_is_skipped_not_fatal():
+    def get_json(api, params):
+        if params['page'] == 1:
+            raise ValueError('truncated page')
+        neo = SyntheticCatalogue(3).neo(params['page'])
+        close_objects = dict(neo["close_approach_data"][0], orbiting_body="Earth")
+        close_objects["miss_distance"] = dict(close_objects["miss_distance"], astronomical=str(1.0 / (params['page'] + 1)))
+        neo["close_approach_data"] = [close_objects]
+        return {"page": {"total_pages": 3}, "near_earth_objects": [neo]}
+
+    failures = []
+    assert skip_failed(get_json, failures)('browse', {'page': 1}) is None
+    assert len(failures) == 1
+
+    crawl = BrowseCrawl(get_json, 'browse', 'DEMO_KEY', workers=2)
+    closest = crawl.register(ClosestApproach())
+    crawl.run()
+    assert closest.result()["id"] == "2000002"
+    assert [params['page'] for params, _ in crawl.failed_pages] == [1]
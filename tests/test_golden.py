@@ -0,0 +1,209 @@
+'''
+Golden-output regression tests: every report, through every engine, against the
+recorded NeoWs responses in tests/recorded, must write files byte for byte equal
+to the goldens in tests/, within a time and a memory budget. The goldens
+themselves are checked against a brute-force pass over the same responses.
+
+tests/recorded is not a capture of the live API. Its browse pages 0-3 hold the
+7 NeoWs NEO's of the original goldens followed by SyntheticCatalogue(60, seed=0)
+NEO's approaching Oct 2020 - Mar 2021, 20 to a page as their page blocks say;
+the feed windows of the January 2021 and Nov 2020 - Feb 2021 month reports come
+from the same synthetic NEO's. After an intended output change, rewrite the
+goldens with the sequential engine, then check them with the brute-force test:
+
+    python -m tests.test_golden
+'''
+
+import json, os, shutil, time, tracemalloc
+import pytest
+from asteroid_hunter_app import main
+from asteroid_hunter_app.month_information import month_range_plan, month_span, window_plan
+from asteroid_hunter_app.replay import RecordedResponses, ReplayTransport
+
+tests_path = os.path.dirname(os.path.abspath(__file__))
+recorded_path = os.path.join(tests_path, 'recorded')
+
+# Report -> (call, golden files it writes)
+reports = {
+    'browse': (lambda: main.browse_reports(), ('closest_neo.json', 'ten_closest_neo.json')),
+    'month': (lambda: main.month_closest_approaches(), ('closest_neo_per_month.json',)),
+    'months': (lambda: main.month_range_closest_approaches(2020, 11, 2021, 2), ('closest_neo_per_month_range.json',)),
+}
+
+# Engine -> (main settings, seconds, MB of Python allocations at peak) per report. These inputs
+# take well under 0.1 s and 1 MB in every engine; the budgets leave headroom for slow CI hosts
+# and tracemalloc's own overhead. Columnar includes the numpy import, sharded the process pool
+# start (its workers' memory is not traced).
+engines = {
+    'sequential': ({'fetch_workers': 1}, 2, 4),
+    'concurrent': ({'fetch_workers': 4}, 2, 4),
+    'stream': ({'fetch_workers': 1, 'stream_pages': True}, 2, 4),
+    'cached': ({'use_cache': True}, 2, 4),
+    'columnar': ({'columnar_reports': True}, 5, 16),
+    'catalogue': ({'use_catalogue': True}, 2, 4),
+    'sharded': ({'shard_processes': 2}, 20, 4),
+    'queue': ({'shard_queue_path': 'shards.sqlite'}, 2, 4),
+}
+
+def recorded_settings():
+    return {
+        'http_transport': ReplayTransport(RecordedResponses(recorded_path)),
+        'use_cache': False,
+        'use_catalogue': False,
+        'quiet': True,
+        'echo_reports': False,
+        'output_format': 'json',
+        'output_compress': False,
+        'year_to_test': 2021,
+        'month_to_test': 1,
+        'api_fetchers': None,
+        'response_cache': None,
+        'neo_catalogue': None,
+        'period_aggregates': None,
+    }
+
+def run_report(report):
+    call, _ = reports[report]
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        call()
+        seconds = time.perf_counter() - start
+        peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+    return seconds, peak_mb
+
+def read_bytes(path):
+    with open(path, 'rb') as file_open:
+        return file_open.read()
+
+
+@pytest.mark.parametrize('report', sorted(reports))
+@pytest.mark.parametrize('engine', sorted(engines))
+def test_reports_match_goldens(engine, report, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    settings, seconds_budget, memory_budget = engines[engine]
+    for name, value in dict(recorded_settings(), **settings).items():
+        monkeypatch.setattr(main, name, value)
+
+    # Cached: the second run is answered from the response cache
+    for _ in range(2 if engine == 'cached' else 1):
+        seconds, peak_mb = run_report(report)
+        assert 'error occured' not in capsys.readouterr().out
+        for golden in reports[report][1]:
+            assert read_bytes(golden) == read_bytes(os.path.join(tests_path, golden)), golden
+        assert seconds < seconds_budget
+        assert peak_mb < memory_budget
+
+def read_recorded(path, params):
+    with open(os.path.join(recorded_path, RecordedResponses.file_name(path, params)), 'rb') as file_open:
+        return json.load(file_open)
+
+# Closest (qty) Earth approaches of (neo, close_objects) pairs in arrival order: sorted on distance,
+# ties in arrival order, a repeated (NEO id, epoch) counted once
+def closest_first(approaches, top_count):
+    order = sorted(range(len(approaches)),
+                   key=lambda index: (float(approaches[index][1]["miss_distance"]["astronomical"]), index))
+    seen = set()
+    records = []
+    for index in order:
+        neo, close_objects = approaches[index]
+        key = (neo["id"], close_objects["epoch_date_close_approach"])
+        if close_objects["orbiting_body"] != "Earth" or key in seen:
+            continue
+        seen.add(key)
+        records.append(dict(neo, close_approach_data=close_objects))
+    return records[:top_count]
+
+def feed_approaches(plan, first_date, last_date):
+    return [(neo, close_objects)
+            for params in plan.params()
+            for date_text, neos_on_date in read_recorded('/feed', params)["near_earth_objects"].items()
+            if first_date <= date_text <= last_date
+            for neo in neos_on_date for close_objects in neo["close_approach_data"]]
+
+def brute_force_reports():
+    first_page = read_recorded('/browse', {'page': 0})
+    pages = [first_page] + [read_recorded('/browse', {'page': page})
+                            for page in range(1, first_page["page"]["total_pages"])]
+    browse = [(neo, close_objects) for page in pages
+              for neo in page["near_earth_objects"] for close_objects in neo["close_approach_data"]]
+    month_start, month_end = month_span(2021, 1)
+    month = feed_approaches(window_plan(month_start, month_end), month_start.isoformat(), month_end.isoformat())
+    range_plan = month_range_plan(2020, 11, 2021, 2)
+    month_keys = ['2020-11', '2020-12', '2021-01', '2021-02']
+    return {
+        'closest_neo.json': closest_first(browse, 1)[0],
+        'ten_closest_neo.json': closest_first(browse, main.top_count),
+        'closest_neo_per_month.json': closest_first(month, main.top_month_count),
+        'closest_neo_per_month_range.json': {
+            month_key: closest_first(feed_approaches(range_plan, f'{month_key}-01', f'{month_key}-31'),
+                                     main.top_month_count)
+            for month_key in month_keys},
+    }
+
+
+def test_recorded_pages_match_their_page_blocks():
+    page_block = read_recorded('/browse', {'page': 0})["page"]
+    neo_count = 0
+    for page_api in range(page_block["total_pages"]):
+        page = read_recorded('/browse', {'page': page_api})
+        assert page["page"] == dict(page_block, number=page_api)
+        last_page = page_api == page_block["total_pages"] - 1
+        assert 0 < len(page["near_earth_objects"]) <= page_block["size"]
+        assert last_page or len(page["near_earth_objects"]) == page_block["size"]
+        neo_count += len(page["near_earth_objects"])
+    assert neo_count == page_block["total_elements"]
+    assert not os.path.exists(os.path.join(
+        recorded_path, RecordedResponses.file_name('/browse', {'page': page_block["total_pages"]})))
+
+def test_goldens_match_brute_force():
+    for golden, expected in brute_force_reports().items():
+        with open(os.path.join(tests_path, golden)) as file_open:
+            assert json.load(file_open) == expected, golden
+
+def test_catalogue_reports_match_goldens(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name, value in dict(recorded_settings(), use_catalogue=True).items():
+        monkeypatch.setattr(main, name, value)
+    main.browse_reports()
+    os.remove('closest_neo.json')
+    os.remove('ten_closest_neo.json')
+
+    # Browse and month reports answered from the catalogue filled by the crawl; nothing is recorded
+    # in tmp_path, so any request would fail
+    monkeypatch.setattr(main, 'http_transport', ReplayTransport(RecordedResponses(str(tmp_path))))
+    main.browse_reports(from_catalogue=True)
+    main.month_closest_approaches(from_catalogue=True)
+    for golden in ('closest_neo.json', 'ten_closest_neo.json', 'closest_neo_per_month.json'):
+        assert read_bytes(golden) == read_bytes(os.path.join(tests_path, golden)), golden
+
+@pytest.mark.parametrize('shard_processes', [1, 2])
+def test_month_range_fills_the_catalogue(shard_processes, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name, value in dict(recorded_settings(), use_catalogue=True, shard_processes=shard_processes).items():
+        monkeypatch.setattr(main, name, value)
+    main.month_range_closest_approaches(2020, 11, 2021, 2)
+
+    # January 2021 is inside the range, so its month report needs no request
+    monkeypatch.setattr(main, 'http_transport', ReplayTransport(RecordedResponses(str(tmp_path))))
+    main.month_closest_approaches(from_catalogue=True)
+    assert read_bytes('closest_neo_per_month.json') == read_bytes(os.path.join(tests_path, 'closest_neo_per_month.json'))
+
+
+# Rewrite the goldens from the recorded responses with the sequential engine
+def write_goldens():
+    for name, value in dict(recorded_settings(), fetch_workers=1).items():
+        setattr(main, name, value)
+    work_path = os.getcwd()
+    for report in sorted(reports):
+        run_report(report)
+        for golden in reports[report][1]:
+            shutil.copyfile(os.path.join(work_path, golden), os.path.join(tests_path, golden))
+            print(f'Wrote {os.path.join(tests_path, golden)}')
+
+if __name__ == '__main__':
+    import tempfile
+    os.chdir(tempfile.mkdtemp(prefix='asteroid_golden_'))
+    write_goldens()
@@ -0,0 +1,41 @@
+import json, sys
+import pytest
+from asteroid_hunter_app import json_backend
+from asteroid_hunter_app.json_example import neo_example
+from asteroid_hunter_app.replay import SyntheticCatalogue
+
+
+page = SyntheticCatalogue(20).browse(0)
+page["near_earth_objects"] += list(neo_example)
+page["links"]["name"] = "719 Albert (A911 TB) ’"   # Backends differ on escaping non-ASCII
+
+@pytest.fixture
+def restore_backend():
+    backend = json_backend.backend
+    yield
+    json_backend.set_backend(backend)
+
+
+@pytest.mark.parametrize('name', ['json', 'orjson', 'ujson'])
+def test_backends_decode_and_encode_the_same_content(name, restore_backend):
+    if name != 'json':
+        pytest.importorskip(name)
+    assert json_backend.set_backend(name) == name
+    body = json.dumps(page, ensure_ascii=False)
+    assert json_backend.loads(body) == page
+    assert json_backend.loads(body.encode()) == page
+    assert json.loads(json_backend.dumps(page)) == page
+    assert json_backend.loads(json_backend.dumps(page)) == page
+
+def test_set_backend_falls_back(monkeypatch, restore_backend):
+    # A None entry in sys.modules makes the import raise ImportError
+    monkeypatch.setitem(sys.modules, 'orjson', None)
+    monkeypatch.setitem(sys.modules, 'ujson', None)
+    assert json_backend.set_backend() == 'json'
+    assert json_backend.loads(json_backend.dumps(page)) == page
+    with pytest.raises(ImportError):
+        json_backend.set_backend('orjson')
+    assert json_backend.backend == 'json'
+    with pytest.raises(ValueError):
+        json_backend.set_backend('simplejson')
+    monkeypatch.undo()
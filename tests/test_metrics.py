@@ -0,0 +1,31 @@
+import json, logging
+from asteroid_hunter_app.metrics import Metrics, instrumented, timed_decode
+from asteroid_hunter_app.replay import ReplayTransport, SyntheticCatalogue
+
+
+def test_requests_and_decode_are_measured(caplog):
+    registry = Metrics()
+    transport = ReplayTransport(SyntheticCatalogue(40))
+    fetch = instrumented(lambda api, params: transport.get(api, params=params), registry)
+    decode = timed_decode(json.loads, registry)
+    with caplog.at_level(logging.INFO, logger='asteroid_hunter_app'):
+        for page in range(2):
+            decode(fetch('https://api.nasa.gov/neo/rest/v1/neo/browse?', {'page': page}).content)
+
+    assert registry.total('requests', endpoint='browse') == 2
+    assert registry.total('response_bytes') == transport.bytes_served
+    assert [json.loads(record.message)['event'] for record in caplog.records] == ['request', 'request']
+
+    text = registry.prometheus_text()
+    assert 'asteroid_hunter_requests_total{endpoint="browse",status="200"} 2' in text
+    assert 'asteroid_hunter_request_seconds_count{endpoint="browse"} 2' in text
+    assert 'asteroid_hunter_decode_seconds_bucket{le="+Inf"} 2' in text
+
+
+def test_cache_hit_ratio():
+    registry = Metrics()
+    assert registry.cache_hit_ratio() is None
+    registry.count('cache_lookups', 3, result='hit')
+    registry.count('cache_lookups', result='miss')
+    assert registry.cache_hit_ratio() == 0.75
+    assert 'asteroid_hunter_cache_hit_ratio 0.75' in registry.prometheus_text()
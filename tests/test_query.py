@@ -0,0 +1,73 @@
+import datetime, pytest
+from asteroid_hunter_app.catalogue import CatalogueIngest, NeoCatalogue
+from asteroid_hunter_app.query import ApproachQuery, QueryResults, filtered, rank_metrics
+from asteroid_hunter_app.replay import ReplayTransport, SyntheticCatalogue
+from asteroid_hunter_app import main
+
+
+synthetic = SyntheticCatalogue(300, start_date=datetime.date(2020, 6, 1), end_date=datetime.date(2021, 6, 1))
+
+queries = [
+    ApproachQuery(hazardous=True, top_count=5),
+    ApproachQuery(body=None, min_diameter=1.0, max_diameter=3.0, rank='diameter'),
+    ApproachQuery(body='Mars', min_velocity=10.0, max_velocity=30.0, rank='velocity'),
+    ApproachQuery(start_date='2021-01-01', end_date='2021-03-31', rank='kinetic_energy', top_count=7),
+]
+
+# Top (qty) (NEO id, epoch) by brute force over every approach
+def expected(approach_query):
+    value, largest_first, _ = rank_metrics[approach_query.rank]
+    matching = [(-value(neo, close_objects) if largest_first else value(neo, close_objects),
+                 neo["id"], close_objects["epoch_date_close_approach"])
+                for neo in synthetic.neos() for close_objects in neo["close_approach_data"]
+                if approach_query.matches(neo, close_objects)]
+    return [(neo_id, epoch) for _, neo_id, epoch in sorted(matching)[:approach_query.top_count]]
+
+def keys(records):
+    return [(neo["id"], neo["close_approach_data"]["epoch_date_close_approach"]) for neo in records]
+
+
+@pytest.mark.parametrize('approach_query', queries)
+def test_query_results_and_catalogue_pushdown(approach_query, tmp_path):
+    query_consumer = QueryResults(approach_query)
+    catalogue = NeoCatalogue(str(tmp_path / 'catalogue.sqlite'))
+    ingest = CatalogueIngest(catalogue)
+    for neo in synthetic.neos():
+        for close_objects in neo["close_approach_data"]:
+            query_consumer.consume(neo, close_objects, 0)
+            ingest.consume(neo, close_objects, 0)
+    ingest.page_done(0)
+
+    assert keys(query_consumer.result()) == expected(approach_query)
+    assert keys(catalogue.search(approach_query)) == expected(approach_query)
+
+def test_filtered_ingest_stores_only_matches(tmp_path):
+    approach_query = ApproachQuery(hazardous=True)
+    catalogue = NeoCatalogue(str(tmp_path / 'catalogue.sqlite'))
+    ingest = filtered(CatalogueIngest(catalogue), approach_query)
+    for neo in synthetic.neos():
+        for close_objects in neo["close_approach_data"]:
+            ingest.consume(neo, close_objects, 0)
+    ingest.page_done(0)
+    assert catalogue.count() == sum(approach_query.matches(neo, close_objects)
+                                    for neo in synthetic.neos() for close_objects in neo["close_approach_data"])
+    assert filtered(ingest, None) is ingest
+
+def test_unknown_metric():
+    with pytest.raises(ValueError):
+        ApproachQuery(rank='albedo')
+
+def test_query_reports_feed_and_browse(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, 'http_transport', ReplayTransport(synthetic))
+    monkeypatch.setattr(main, 'use_cache', False)
+    monkeypatch.setattr(main, 'use_catalogue', False)
+    monkeypatch.setattr(main, 'echo_reports', False)
+    monkeypatch.setattr(main, 'quiet', True)
+    monkeypatch.setattr(main, 'api_fetchers', None)
+
+    # Date-bounded Earth queries go through the feed windows, the others crawl the browse pages
+    dated = queries[3]
+    assert keys(main.query_reports(dated)) == expected(dated)
+    undated = queries[1]
+    assert keys(main.query_reports(undated)) == expected(undated)
@@ -0,0 +1,110 @@
+import copy, json, tracemalloc
+import pytest
+from asteroid_hunter_app.crawl import NearestMisses
+from asteroid_hunter_app.json_example import neo_example
+from asteroid_hunter_app.records import ApproachRecord, NeoRecord, RecordCache, RecordError, validate
+from asteroid_hunter_app.replay import SyntheticCatalogue
+
+
+synthetic = SyntheticCatalogue(300)
+
+def report_record(neo, close_objects):
+    record = dict(neo)
+    record["close_approach_data"] = close_objects
+    return record
+
+
+def test_records_round_trip():
+    neos = list(neo_example) + list(synthetic.neos())
+    for neo in neos:
+        validate(neo)
+        neo_record = NeoRecord.from_json(neo)
+        assert json.dumps(neo_record.to_json(neo["close_approach_data"])) == json.dumps(neo)
+        for close_objects in neo["close_approach_data"]:
+            approach_record = ApproachRecord.from_json(neo, close_objects, neo_record)
+            assert json.dumps(approach_record.to_json()) == json.dumps(report_record(neo, close_objects))
+            assert ApproachRecord.from_report(approach_record.to_json()) == approach_record
+            assert approach_record.approach.astronomical == float(close_objects["miss_distance"]["astronomical"])
+    assert NeoRecord.from_json(neo_example[0]).hazardous is True   # "true" in the example
+
+@pytest.mark.parametrize('change, message', [
+    (lambda neo: neo.pop("estimated_diameter"), 'missing estimated_diameter'),
+    (lambda neo: neo.update(absolute_magnitude_h='20.3'), 'absolute_magnitude_h'),
+    (lambda neo: neo["estimated_diameter"].pop("kilometers"), 'estimated_diameter without kilometers'),
+    (lambda neo: neo.update(close_approach_data='none'), 'close_approach_data'),
+    (lambda neo: neo["close_approach_data"][0]["miss_distance"].update(astronomical='far'), 'not a number'),
+    (lambda neo: neo["close_approach_data"][0].update(close_approach_date='2021/01/01'), 'YYYY-MM-DD'),
+    (lambda neo: neo["close_approach_data"][0]["relative_velocity"].pop("kilometers_per_second"), 'relative_velocity'),
+    (lambda neo: neo["close_approach_data"][0]["miss_distance"].pop("lunar"), 'miss_distance'),
+    (lambda neo: neo["close_approach_data"][0].update(orbiting_body=None), 'orbiting_body'),
+    (lambda neo: neo.update(name=433), 'name is not a string'),
+    (lambda neo: neo.update(is_sentry_object='no'), 'is_sentry_object'),
+])
+def test_records_reject_malformed_neos(change, message):
+    neo = copy.deepcopy(neo_example[0])
+    change(neo)
+    with pytest.raises(RecordError, match=message):
+        for close_objects in neo["close_approach_data"]:
+            ApproachRecord.from_json(neo, close_objects)
+    with pytest.raises(RecordError, match=message):
+        validate(neo)
+
+def test_records_carry_new_keys_and_missing_optional_fields():
+    neo = copy.deepcopy(neo_example[0])
+    neo["estimated_diameter"]["parsecs"] = {"estimated_diameter_min": 7.3e-15, "estimated_diameter_max": 1.6e-14}
+    del neo["links"], neo["is_sentry_object"]
+    neo["orbit_class"] = {"orbit_class_type": "APO"}
+    close_objects = neo["close_approach_data"][0]
+    close_objects["miss_distance"]["parsecs"] = '0.0000001234'
+    close_objects["relative_velocity"].pop("miles_per_hour")
+    close_objects["approach_note"] = 'new upstream field'
+    del close_objects["close_approach_date_full"]
+
+    validate(neo)
+    approach_record = ApproachRecord.from_json(neo, close_objects)
+    assert json.dumps(approach_record.to_json()) == json.dumps(report_record(neo, close_objects))
+    assert ApproachRecord.from_report(approach_record.to_json()) == approach_record
+    assert approach_record.neo.diameter == NeoRecord.from_json(neo_example[0]).diameter
+
+def test_kept_records_do_not_alias_the_page():
+    neo = copy.deepcopy(neo_example[0])
+    nearest_misses = NearestMisses(1, verbose=False)
+    nearest_misses.consume(neo, neo["close_approach_data"][0], 0)
+    expected = nearest_misses.result()
+
+    # Later changes to the page, or to a returned report, do not reach the kept record
+    neo["name"] = 'changed'
+    neo["links"]["self"] = 'changed'
+    neo["close_approach_data"][0]["miss_distance"]["astronomical"] = '0'
+    nearest_misses.result()[0]["estimated_diameter"]["kilometers"]["estimated_diameter_min"] = 0
+    assert nearest_misses.result() == expected
+    with pytest.raises(AttributeError):
+        nearest_misses.closest.items()[0].neo.name = 'changed'
+
+def test_records_are_smaller_than_dicts():
+    neos = list(synthetic.neos())
+    copies = json.dumps(neos)
+    def kept_size(build, count):
+        tracemalloc.start()
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert len(kept) == count
+        return size
+
+    # One NEO without its approaches, as the columnar table keeps it: about half the decoded dict
+    neo_size = kept_size(lambda: [report_record(neo, None) for neo in json.loads(copies)], len(neos))
+    neo_record_size = kept_size(lambda: [NeoRecord.from_json(neo) for neo in json.loads(copies)], len(neos))
+    assert neo_record_size < neo_size * 0.55
+
+    # Kept approaches, against report dicts that copy the approach but still share the page's
+    # NEO fields (the aliasing the records remove): about 0.6 of the size
+    approach_count = sum(len(neo["close_approach_data"]) for neo in neos)
+    dict_size = kept_size(lambda: [report_record(neo, copy.deepcopy(close_objects))
+                                   for neo in json.loads(copies) for close_objects in neo["close_approach_data"]],
+                          approach_count)
+    record_cache = RecordCache()
+    record_size = kept_size(lambda: [record_cache.approach(neo, close_objects)
+                                     for neo in json.loads(copies) for close_objects in neo["close_approach_data"]],
+                            approach_count)
+    assert record_size < dict_size * 0.65
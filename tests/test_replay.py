@@ -0,0 +1,55 @@
+import datetime, json, urllib.request
+from asteroid_hunter_app.replay import (RecordedResponses, RecordingTransport, ReplayTransport,
+                                        SyntheticCatalogue, serve)
+
+browse_api = 'https://api.nasa.gov/neo/rest/v1/neo/browse?'
+feed_api = 'https://api.nasa.gov/neo/rest/v1/feed?'
+
+
+def test_synthetic_pages_are_deterministic():
+    assert SyntheticCatalogue(50, seed=3).browse(1) == SyntheticCatalogue(50, seed=3).browse(1)
+    page = SyntheticCatalogue(50).browse(2)
+    assert page["page"] == {"size": 20, "total_elements": 50, "total_pages": 3, "number": 2}
+    assert [neo["id"] for neo in page["near_earth_objects"]] == [str(2000040 + index) for index in range(10)]
+
+
+def test_feed_matches_browse():
+    source = SyntheticCatalogue(100, start_date=datetime.date(2021, 1, 1), end_date=datetime.date(2021, 2, 1))
+    expected = sorted((neo["id"], close_objects["epoch_date_close_approach"])
+                      for neo in source.neos() for close_objects in neo["close_approach_data"]
+                      if "2021-01-08" <= close_objects["close_approach_date"] <= "2021-01-14")
+    feed = source.feed("2021-01-08", "2021-01-14")
+    served = sorted((neo["id"], neo["close_approach_data"][0]["epoch_date_close_approach"])
+                    for neos_on_date in feed["near_earth_objects"].values() for neo in neos_on_date)
+    assert served == expected
+    assert feed["element_count"] == len(expected)
+
+
+def test_transport_revalidates_and_records(tmp_path):
+    transport = ReplayTransport(SyntheticCatalogue(30))
+    response = transport.get(browse_api, params={'page': 1, 'api_key': 'DEMO_KEY'})
+    assert response.status_code == 200
+    assert response.json()["page"]["number"] == 1
+    etag = response.headers['ETag']
+    assert transport.get(browse_api, params={'page': 1}, headers={'If-None-Match': etag}).status_code == 304
+    assert transport.get(browse_api, params={'page': 9}).json()["near_earth_objects"] == []
+
+    # Recorded responses replay byte for byte
+    recording = RecordingTransport(transport, str(tmp_path))
+    recording.get(browse_api, params={'page': 0})
+    recording.get(feed_api, params={'start_date': '2021-01-01', 'end_date': '2021-01-07'})
+    replay = ReplayTransport(RecordedResponses(str(tmp_path)))
+    assert replay.get(browse_api, params={'page': 0}).content == transport.get(browse_api, params={'page': 0}).content
+    assert replay.get(feed_api, params={'start_date': '2021-01-01', 'end_date': '2021-01-07'}).status_code == 200
+    assert replay.get(browse_api, params={'page': 1}).status_code == 404
+
+
+def test_local_server():
+    server, base_url = serve(SyntheticCatalogue(30))
+    try:
+        with urllib.request.urlopen(base_url + '/neo/browse?page=1&api_key=DEMO_KEY') as response:
+            page = json.loads(response.read())
+        assert page["page"]["number"] == 1
+        assert len(page["near_earth_objects"]) == 10
+    finally:
+        server.shutdown()
@@ -0,0 +1,104 @@
+import datetime, json, threading, urllib.request
+import pytest
+from asteroid_hunter_app.catalogue import CatalogueIngest, NeoCatalogue
+from asteroid_hunter_app.replay import SyntheticCatalogue
+from asteroid_hunter_app.service import ReportIndex, serve
+
+
+def ingest(catalogue, neos):
+    catalogue_ingest = CatalogueIngest(catalogue)
+    for neo in neos:
+        for close_objects in neo["close_approach_data"]:
+            catalogue_ingest.consume(neo, close_objects, 0)
+    catalogue_ingest.page_done(0)
+
+@pytest.fixture
+def catalogue(tmp_path):
+    catalogue = NeoCatalogue(str(tmp_path / 'catalogue.sqlite'))
+    synthetic = SyntheticCatalogue(200, start_date=datetime.date(2020, 6, 1), end_date=datetime.date(2021, 6, 1))
+    ingest(catalogue, list(synthetic.neos())[:150])
+    catalogue.remaining = list(synthetic.neos())[150:]
+    return catalogue
+
+def get(base_url, path):
+    try:
+        with urllib.request.urlopen(base_url + path) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as err:
+        return err.code, json.loads(err.read())
+
+
+def test_day_tops_match_day_queries(catalogue):
+    day_tops = catalogue.day_tops(3)
+    assert len(day_tops) > 200
+    for date_text, records in day_tops.items():
+        assert records == catalogue.day_top(date_text, 3)
+
+def test_service_answers_from_snapshot(catalogue):
+    index = ReportIndex(catalogue, top_count=10, month_top_count=5).start()
+    server, base_url = serve(index)
+    try:
+        assert get(base_url, '/closest') == (200, catalogue.closest())
+        assert get(base_url, '/top?count=3') == (200, catalogue.nearest_misses(3))
+        assert get(base_url, '/top') == (200, catalogue.nearest_misses(10))
+        assert get(base_url, '/months/2021-01') == (200, catalogue.month_closest(2021, 1, 5))
+        assert get(base_url, '/months/1999-01') == (200, [])
+        assert get(base_url, '/years/2021') == (200, catalogue.closest_between('2021-01-01', '2021-12-31', 5))
+        assert get(base_url, '/quarters/2020-Q4') == (200, catalogue.closest_between('2020-10-01', '2020-12-31', 5))
+        assert get(base_url, '/range?start=2020-07-15&end=2021-02-03') == \
+            (200, catalogue.closest_between('2020-07-15', '2021-02-03', 5))
+        assert get(base_url, '/range?start=2020-07-15')[0] == 400
+        assert get(base_url, '/top?count=11')[0] == 400
+        assert get(base_url, '/nothing')[0] == 404
+        assert get(base_url, '/health')[1]['approaches'] == catalogue.count()
+
+        # Many concurrent readers
+        answers = []
+        def reader():
+            for _ in range(20):
+                answers.append(get(base_url, '/top?count=5'))
+        readers = [threading.Thread(target=reader) for _ in range(8)]
+        for thread in readers:
+            thread.start()
+        for thread in readers:
+            thread.join()
+        assert answers == [(200, catalogue.nearest_misses(5))] * 160
+    finally:
+        server.shutdown()
+
+def test_refresh_rebuilds_only_on_change(catalogue):
+    changes = []
+    def refresh():
+        if changes:
+            ingest(catalogue, changes.pop())
+            return True
+        return False
+
+    index = ReportIndex(catalogue, refresh=refresh)
+    first = index.build()
+    index.refresh_once()
+    assert index.snapshot is first
+    first_range = first.period_tops.top(datetime.date(2020, 7, 15), datetime.date(2021, 2, 3))
+
+    changes.append(catalogue.remaining)
+    index.refresh_once()
+    assert index.snapshot is not first
+    assert index.snapshot.approach_count > first.approach_count
+    assert json.loads(index.answer('/top')[1]) == catalogue.nearest_misses(10)
+
+    # The new aggregates are a copy: the old snapshot still answers as it did. /range reads
+    # the current snapshot only, so it is answered while a build holds the build lock
+    assert first.period_tops.top(datetime.date(2020, 7, 15), datetime.date(2021, 2, 3)) == first_range
+    with index.build_lock:
+        assert json.loads(index.answer('/range?start=2020-07-15&end=2021-02-03')[1]) == \
+            catalogue.closest_between('2020-07-15', '2021-02-03', 10)
+    assert json.loads(index.answer('/range?start=2020-07-15&end=2021-02-03')[1]) != first_range
+
+    # A failed sync keeps the last snapshot
+    def broken():
+        raise OSError('API down')
+    index.refresh = broken
+    snapshot = index.snapshot
+    index.refresh_once()
+    assert index.snapshot is snapshot
+    assert 'API down' in json.loads(index.answer('/health')[1])['last_error']
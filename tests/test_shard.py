@@ -0,0 +1,123 @@
+import datetime, json, pytest
+from asteroid_hunter_app.crawl import ClosestApproach, NearestMisses
+from asteroid_hunter_app.replay import ReplayTransport, SyntheticCatalogue
+from asteroid_hunter_app.shard import WorkQueue, split_range
+from asteroid_hunter_app import cli, main
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    synthetic = SyntheticCatalogue(300, start_date=datetime.date(2020, 6, 1), end_date=datetime.date(2021, 6, 1))
+    monkeypatch.setattr(main, 'http_transport', ReplayTransport(synthetic))
+    monkeypatch.setattr(main, 'use_cache', False)
+    monkeypatch.setattr(main, 'use_catalogue', False)
+    monkeypatch.setattr(main, 'quiet', True)
+    monkeypatch.setattr(main, 'echo_reports', False)
+    monkeypatch.setattr(main, 'api_fetchers', None)
+    monkeypatch.setattr(main, 'neo_catalogue', None)
+    return synthetic
+
+def read_reports(*names):
+    reports = []
+    for name in names:
+        with open(name) as file_open:
+            reports.append(json.load(file_open))
+    return reports
+
+
+def test_split_range():
+    assert split_range(1, 15, 4) == [(1, 4), (4, 8), (8, 11), (11, 15)]
+    assert split_range(1, 3, 8) == [(1, 2), (2, 3)]
+    assert split_range(1, 1, 4) == []
+
+def test_merge_is_associative():
+    consumers = []
+    catalogue = SyntheticCatalogue(60, page_size=20)
+    for page_api in range(3):
+        closest, misses = ClosestApproach(verbose=False), NearestMisses(10, verbose=False)
+        for neo in catalogue.browse(page_api)["near_earth_objects"]:
+            for close_objects in neo["close_approach_data"]:
+                closest.consume(neo, close_objects, page_api)
+                misses.consume(neo, close_objects, page_api)
+        consumers.append((closest, misses))
+
+    def merged(first, second):
+        closest, misses = ClosestApproach(verbose=False), NearestMisses(10, verbose=False)
+        closest.merge(first[0]).merge(second[0])
+        misses.merge(first[1]).merge(second[1])
+        return closest, misses
+
+    left = merged(merged(consumers[0], consumers[1]), consumers[2])
+    right = merged(consumers[0], merged(consumers[1], consumers[2]))
+    assert left[0].result() == right[0].result()
+    assert left[1].result() == right[1].result()
+
+def test_sharded_reports_match_single_process(source, monkeypatch):
+    main.browse_reports()
+    single_browse = read_reports('closest_neo.json', 'ten_closest_neo.json')
+    single_months = main.month_range_closest_approaches(2020, 11, 2021, 2)
+
+    monkeypatch.setattr(main, 'shard_processes', 2)
+    main.metrics.reset()
+    main.browse_reports()
+    assert read_reports('closest_neo.json', 'ten_closest_neo.json') == single_browse
+    assert main.metrics.total('pages', endpoint='browse') == 15
+    assert main.month_range_closest_approaches(2020, 11, 2021, 2) == single_months
+
+def test_sharded_crawl_cannot_resume(source, monkeypatch, capsys):
+    monkeypatch.setattr(main, 'shard_processes', 2)
+    monkeypatch.setattr(main, 'resume_crawl', True)
+    main.browse_reports()
+    assert 'cannot resume' in capsys.readouterr().out
+    assert source.neos_served == 0
+    with pytest.raises(SystemExit):
+        cli.main(['--resume', '--shards', '2', 'browse'])
+    assert '--resume continues a single-process crawl' in capsys.readouterr().err
+
+def test_work_queue(source, tmp_path, monkeypatch):
+    main.browse_reports()
+    single_browse = read_reports('closest_neo.json', 'ten_closest_neo.json')
+
+    # The coordinator works the queue itself when no other worker is attached
+    monkeypatch.setattr(main, 'shard_queue_path', str(tmp_path / 'shards.sqlite'))
+    main.browse_reports()
+    assert read_reports('closest_neo.json', 'ten_closest_neo.json') == single_browse
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    now = [1000.0]
+    queue = WorkQueue(str(tmp_path / 'shards.sqlite'), lease=60, clock=lambda: now[0])
+    job = queue.put([{'pages': (1, 5)}, {'pages': (5, 9)}], {})
+    first = queue.claim('host-a')
+    second = queue.claim('host-b')
+    assert (first[1], second[1]) == ({'pages': [1, 5]}, {'pages': [5, 9]})
+    assert queue.claim('host-c') is None
+
+    queue.complete(second[0], 'done')
+    now[0] += 61
+    reclaimed = queue.claim('host-c')
+    assert reclaimed[0] == first[0]
+    assert queue.results(job) == ([None, 'done'], 2)
+    queue.close()
+
+def test_jobs_sharing_a_queue_stay_apart(source, tmp_path, monkeypatch):
+    main.browse_reports()
+    single_browse = read_reports('closest_neo.json', 'ten_closest_neo.json')
+
+    # Another coordinator's job is in the queue: this run neither claims, merges nor deletes it
+    queue_path = str(tmp_path / 'shards.sqlite')
+    queue = WorkQueue(queue_path)
+    other_job = queue.put([{'kind': 'browse', 'pages': (1, 3), 'consumers': []}], {'fetch_workers': 1})
+    monkeypatch.setattr(main, 'shard_queue_path', queue_path)
+    main.browse_reports()
+    assert read_reports('closest_neo.json', 'ten_closest_neo.json') == single_browse
+    assert queue.results(other_job) == ([None], 1)
+    assert queue.connection.execute('SELECT COUNT(*) FROM shard_tasks').fetchone()[0] == 1
+
+    # Stored as JSON, not pickles
+    task, settings = queue.connection.execute('SELECT task, settings FROM shard_tasks').fetchone()
+    assert json.loads(task)['pages'] == [1, 3]
+    assert json.loads(settings) == {'fetch_workers': 1}
+    assert queue.claim('host-a', job='elsewhere') is None
+    assert queue.claim('host-a')[1]['pages'] == [1, 3]
+    queue.close()
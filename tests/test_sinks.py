@@ -0,0 +1,78 @@
+import gzip, json, os, pytest
+from asteroid_hunter_app.sinks import open_sink, output_path
+from asteroid_hunter_app.replay import SyntheticCatalogue
+
+
+def records(count):
+    for neo in SyntheticCatalogue(count).neos():
+        record = dict(neo)
+        record["close_approach_data"] = neo["close_approach_data"][0]
+        record["name"] = "(2021 éè) \"quoted\"\nname"
+        yield record
+
+
+@pytest.mark.parametrize('count', [0, 1, 5])
+def test_json_sink_matches_whole_dump(tmp_path, count):
+    expected = list(records(count))
+    with open_sink(str(tmp_path / 'list.json')) as sink:
+        for record in expected:
+            sink.write(record)
+    assert (tmp_path / 'list.json').read_text() == json.dumps(expected, indent=2)
+
+    months = {f'2021-{month:02d}': expected for month in range(1, count + 1)}
+    with open_sink(str(tmp_path / 'object.json'), 'object') as sink:
+        for month in months.items():
+            sink.write(month)
+    assert (tmp_path / 'object.json').read_text() == json.dumps(months, indent=2)
+
+    with open_sink(str(tmp_path / 'single.json'), 'single') as sink:
+        sink.write(expected[0] if expected else None)
+    assert (tmp_path / 'single.json').read_text() == json.dumps(expected[0] if expected else None, indent=2)
+
+
+def test_ndjson_and_gzip(tmp_path):
+    expected = list(records(3))
+    path = str(tmp_path / output_path('ten_closest_neo', 'ndjson', compress=True))
+    assert path.endswith('ten_closest_neo.ndjson.gz')
+    with open_sink(path, 'list', 'ndjson', compress=True) as sink:
+        for record in expected:
+            sink.write(record)
+    with gzip.open(path, 'rt') as ndjson_file:
+        assert [json.loads(line) for line in ndjson_file] == expected
+
+
+@pytest.mark.parametrize('format', ['parquet', 'arrow'])
+def test_columnar_export(tmp_path, format):
+    pyarrow = pytest.importorskip('pyarrow')
+    expected = list(records(25))
+    path = str(tmp_path / output_path('closest_neo_per_month_range', format))
+    sink = open_sink(path, 'object', format, compress=True)
+    sink.batch_size = 10
+    sink.write(('2021-01', expected[:20]))
+    sink.write(('2021-02', expected[20:]))
+    sink.close()
+    if format == 'parquet':
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(path)
+    else:
+        import pyarrow.ipc
+        table = pyarrow.ipc.open_file(path).read_all()
+    assert table.column('group').to_pylist() == ['2021-01'] * 20 + ['2021-02'] * 5
+    assert [json.loads(record) for record in table.column('record').to_pylist()] == expected
+
+
+@pytest.mark.parametrize('format', ['json', 'parquet', 'arrow'])
+def test_report_cut_short_is_not_finished(tmp_path, format):
+    if format != 'json':
+        pytest.importorskip('pyarrow')
+    path = str(tmp_path / output_path('ten_closest_neo', format))
+    with pytest.raises(RuntimeError):
+        with open_sink(path, 'list', format) as sink:
+            for record in records(3):
+                sink.write(record)
+            raise RuntimeError('crawl failed')
+    if format == 'json':
+        with pytest.raises(ValueError):
+            json.loads((tmp_path / 'ten_closest_neo.json').read_text())
+    else:
+        assert os.listdir(tmp_path) == []
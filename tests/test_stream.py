@@ -0,0 +1,121 @@
+import json, tracemalloc
+from asteroid_hunter_app import main
+from asteroid_hunter_app.aggregates import PeriodTops
+from asteroid_hunter_app.columnar import ColumnarIngest
+from asteroid_hunter_app.crawl import BrowseCrawl, ClosestApproach, NearestMisses
+from asteroid_hunter_app.replay import SyntheticCatalogue, encode
+from asteroid_hunter_app.stream import StreamedPage, iter_chunks
+
+page = {
+    "links": {"next": "http://www.neowsapp.com/rest/v1/neo/browse?page=1&size=20"},
+    "near_earth_objects": [
+        {"id": "2000433", "name": "433 Eros (A898 PA)", "absolute_magnitude_h": 10.41,
+         "close_approach_data": [{"miss_distance": {"astronomical": "0.1492"}, "orbiting_body": "Earth"}]},
+        {"id": "2000719", "name": "719 Albert (A911 TB) ’", "absolute_magnitude_h": 15.51,
+         "close_approach_data": []},
+    ],
+    "page": {"size": 20, "total_elements": 40, "total_pages": 2, "number": 0},
+}
+
+
+def test_streamed_page_matches_whole_document_at_any_chunk_size():
+    body = json.dumps(page, indent=2, ensure_ascii=False).encode()
+    for size in (1, 2, 7, 64, len(body)):
+        chunks = (body[start:start + size] for start in range(0, len(body), size))
+        streamed = StreamedPage(chunks)
+        assert list(streamed) == page["near_earth_objects"]
+        assert streamed.header == {"links": page["links"], "page": page["page"]}
+
+def test_truncated_stream_is_skipped_like_a_failed_page():
+    synthetic = SyntheticCatalogue(60, page_size=20)
+    cut_offs = {1: 2}    # Page 1 is cut off mid-body on both of its reads
+
+    def get_body(api, params):
+        body = encode(synthetic.browse(params['page']))
+        if cut_offs.get(params['page']):
+            cut_offs[params['page']] -= 1
+            def truncated():
+                yield from iter_chunks(body[:len(body) // 2], 1024)
+                raise ConnectionError('connection reset mid-body')
+            return truncated()
+        return iter_chunks(body, 1024)
+
+    def crawl_with(get_body):
+        crawl = BrowseCrawl(get_body, 'browse', 'DEMO_KEY', stream=True)
+        closest = crawl.register(ClosestApproach(verbose=False))
+        misses = crawl.register(NearestMisses(10, verbose=False))
+        table = crawl.register(ColumnarIngest()).table
+        period_tops = crawl.register(PeriodTops(5))
+        crawl.run()
+        return crawl, (closest.result(), misses.result(), len(table), len(table.neos), period_tops.year(2021))
+
+    def whole_pages(api, params):
+        return iter_chunks(encode(synthetic.browse(params['page'])), 1024)
+
+    # Page 1 fails on both reads: skipped, and every consumer dropped the half it saw
+    crawl, results = crawl_with(get_body)
+    assert [params['page'] for params, _ in crawl.failed_pages] == [1]
+    without_page = [neo for page_api in (0, 2) for neo in synthetic.browse(page_api)["near_earth_objects"]]
+    closest, misses, rows, neos, year = results
+    assert all(neo["id"] in {kept["id"] for kept in without_page} for neo in misses + [closest])
+    assert (rows, neos) == (sum(len(neo["close_approach_data"]) for neo in without_page), len(without_page))
+    assert year == [neo for neo in year if neo["id"] in {kept["id"] for kept in without_page}]
+
+    # Cut off once: the second read takes the whole page, and nothing of the first is counted twice
+    cut_offs[1] = 1
+    crawl, results = crawl_with(get_body)
+    assert crawl.failed_pages == []
+    assert results == crawl_with(whole_pages)[1]
+
+
+# requests-like response whose body is generated one NEO at a time, so only the pipeline's
+# own memory grows with the page; reading .content builds the whole body
+class GeneratedResponse:
+    def __init__(self, synthetic):
+        self.synthetic = synthetic
+        self.status_code = 200
+        self.headers = {}
+
+    def iter_content(self, chunk_size=1):
+        synthetic = self.synthetic
+        page_block = {"size": synthetic.page_size, "total_elements": synthetic.neo_count, "total_pages": 1, "number": 0}
+        yield b'{"links":{},"page":' + encode(page_block) + b',"near_earth_objects":['
+        for index in range(synthetic.neo_count):
+            yield (b',' if index else b'') + encode(synthetic.neo(index))
+        yield b']}'
+
+    @property
+    def content(self):
+        return b''.join(self.iter_content())
+
+    def raise_for_status(self):
+        pass
+
+class GeneratedTransport:
+    def __init__(self, neo_count):
+        self.synthetic = SyntheticCatalogue(neo_count, page_size=neo_count)
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        return GeneratedResponse(self.synthetic)
+
+def test_streamed_browse_memory_stays_flat_as_the_page_grows(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    for name, value in {'stream_pages': True, 'use_cache': True, 'use_catalogue': False, 'fetch_workers': 1,
+                        'quiet': True, 'echo_reports': False, 'output_format': 'json', 'output_compress': False,
+                        'api_fetchers': None, 'response_cache': None}.items():
+        monkeypatch.setattr(main, name, value)
+
+    peaks = {}
+    for neo_count in (100, 2000):
+        monkeypatch.setattr(main, 'http_transport', GeneratedTransport(neo_count))
+        monkeypatch.setattr(main, 'cache_path', f'cache-{neo_count}.sqlite')
+        monkeypatch.setattr(main, 'api_fetchers', None)
+        tracemalloc.start()
+        try:
+            main.browse_reports()
+            peaks[neo_count] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert 'error occured' not in capsys.readouterr().out
+    # A 2000 NEO page body is about 5 MB; holding it (or its decoded tree) would show
+    assert peaks[2000] < peaks[100] + 1024 * 1024
@@ -0,0 +1,53 @@
+import datetime, json
+from asteroid_hunter_app.catalogue import NeoCatalogue
+from asteroid_hunter_app.sync import CatalogueSync
+
+
+def neo(neo_id, distance):
+    return {"id": neo_id, "absolute_magnitude_h": 22.1, "is_potentially_hazardous_asteroid": False,
+            "estimated_diameter": {"kilometers": {"estimated_diameter_min": 0.1, "estimated_diameter_max": 0.2}},
+            "close_approach_data": [{
+        "close_approach_date": "2021-01-05", "epoch_date_close_approach": 1609804800000,
+        "relative_velocity": {"kilometers_per_second": "10.0"},
+        "miss_distance": {"astronomical": distance, "lunar": "1.0", "kilometers": "1.0"},
+        "orbiting_body": "Earth"}]}
+
+def test_sync_only_ingests_changes(tmp_path):
+    pages = [[neo("1", "0.3"), neo("2", "0.2")], [neo("3", "0.1")]]
+    calls = []
+    def get_body(api, params):
+        calls.append(params)
+        if 'page' in params:
+            return json.dumps({"page": {"total_pages": len(pages)},
+                               "near_earth_objects": pages[params['page']]}).encode()
+        return json.dumps({"element_count": 1, "near_earth_objects": {"2021-02-01": [neo("4", "0.05")]}}).encode()
+
+    catalogue_sync = CatalogueSync(NeoCatalogue(str(tmp_path / 'catalogue.sqlite')), get_body,
+                                   'browse', 'feed', 'DEMO_KEY', top_count=2)
+    assert catalogue_sync.sync_browse() == [0, 1]
+    assert catalogue_sync.sync_browse() == []
+    assert [record["id"] for record in catalogue_sync.nearest_misses()] == ["3", "2"]
+
+    # NEO 3 moves away: its page is the only delta, and the running top (qty) is corrected
+    pages[1] = [neo("3", "0.9")]
+    assert catalogue_sync.sync_browse() == [1]
+    assert [record["id"] for record in catalogue_sync.nearest_misses()] == ["2", "1"]
+
+    # Feed weeks are only fetched past the high-water mark
+    start = datetime.date(2021, 2, 1)
+    assert catalogue_sync.sync_feed(start, datetime.date(2021, 2, 10)) == (start, datetime.date(2021, 2, 10))
+    feed_calls = len(calls)
+    assert catalogue_sync.sync_feed(start, datetime.date(2021, 2, 10)) is None
+    assert len(calls) == feed_calls
+    assert catalogue_sync.closest()["id"] == "4"
+
+def test_running_results_do_not_alias_the_page(tmp_path):
+    catalogue_sync = CatalogueSync(NeoCatalogue(str(tmp_path / 'catalogue.sqlite')), None,
+                                   'browse', 'feed', 'DEMO_KEY', top_count=2)
+    feed_neo = neo("5", "0.01")
+    running = catalogue_sync.merge(catalogue_sync.load_running(), [feed_neo], False, {'date': '2021-01-05'})
+    expected = [record.to_json() for record in running.items()]
+    feed_neo["close_approach_data"][0]["miss_distance"]["astronomical"] = "0.9"
+    feed_neo["estimated_diameter"]["kilometers"]["estimated_diameter_min"] = 0
+    assert [record.to_json() for record in running.items()] == expected
+    assert expected[0]["close_approach_data"]["miss_distance"]["astronomical"] == "0.01"
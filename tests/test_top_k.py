@@ -0,0 +1,28 @@
+import random
+from asteroid_hunter_app.top_k import TopK
+
+
+def test_top_k_matches_sorted_selection():
+    rng = random.Random(3)
+    distances = [rng.random() for _ in range(5000)]
+    top = TopK(100)
+    for idx, distance in enumerate(distances):
+        top.push(distance, idx, idx)
+    assert top.distances() == sorted(distances)[:100]
+
+def test_top_k_dedupes_and_breaks_ties_by_arrival():
+    top = TopK(3)
+    assert top.push(0.5, ('2000433', 1), 'first')
+    assert not top.push(0.5, ('2000433', 1), 'repeat')
+    assert top.push(0.5, ('2000719', 2), 'second')
+    assert top.push(0.1, ('2099942', 3), 'closest')
+    assert not top.push(0.5, ('2001036', 4), 'late tie')
+    assert top.items() == ['closest', 'first', 'second']
+
+def test_top_k_merge():
+    left, right, whole = TopK(5), TopK(5), TopK(5)
+    for idx in range(20):
+        distance = (idx * 7) % 11
+        (left if idx < 10 else right).push(distance, idx, idx)
+        whole.push(distance, idx, idx)
+    assert left.merge(right).entries() == whole.entries()